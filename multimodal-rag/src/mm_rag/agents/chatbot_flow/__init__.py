@@ -1,59 +1,67 @@
-from typing import TYPE_CHECKING, Annotated, Literal, Any
-
-from mm_rag.pipelines.retrievers import Retriever
-from mm_rag.models.s3bucket import BucketService
-from mm_rag.agents.vlm import VLM
-
-from typing_extensions import TypedDict
-
-from langgraph.graph import StateGraph, START
-from langgraph.graph.message import add_messages
-
-from langchain_core.documents import Document
+import functools
+from typing import TYPE_CHECKING, Any
 
 from mm_rag.logging_service.log_config import create_logger
 
-from . import input_classifier, formatter, chatbot, retriever, router
+if TYPE_CHECKING:
+  from mm_rag.pipelines.retrievers import Retriever
+  from mm_rag.models.s3bucket import BucketService
+  from mm_rag.agents.vlm import VLM
+  from mm_rag.agents.chatbot_flow.graph import State
+  from mm_rag.agents.chatbot_flow.semantic_cache import SemanticCache
 
 
 logger= create_logger(__name__)
 
 
-class State(TypedDict):
-  messages: Annotated[list, add_messages]
-  is_retrieval_required: bool | None
-  retriever: Retriever
-  vlm: VLM
-  retrieved: list[Document] | None
-  bucket: BucketService
-  query: str
-
-logger.debug(f"Created new State Schema: {State}")
-
-builder = StateGraph(State)
-logger.debug(f"Created graph builder: {builder}")
-
-
-builder.add_node("classify", input_classifier.classify_input)
-builder.add_node("route", router.router)
-builder.add_node("chatbot", chatbot.chatbot)
-builder.add_node("retrieve", retriever.retrieve)
-builder.add_node("format", formatter.formatter)
-builder.add_edge(START, "classify")
-builder.add_edge("classify", "route")
-builder.add_conditional_edges(
-    "route",
-    lambda state: state.get("is_retrieval_required"),
-    {True: "retrieve", False: "chatbot"}
-)
-builder.add_edge("retrieve", "format")
-builder.add_edge("format", "chatbot")
-
-
-graph = builder.compile()
-
-
-def run_chatbot(query: str, retriever: 'Retriever', vlm: 'VLM', bucket: 'BucketService') -> Any | None:
+@functools.cache
+def get_graph():
+  """
+  Compiles the chatbot graph on first use, langgraph and the nodes' dependencies are imported only then.
+  """
+  from mm_rag.agents.chatbot_flow.graph import build_graph
+  return build_graph()
+
+
+def __getattr__(name: str) -> Any:
+  if name == 'graph':
+    return get_graph()
+  if name == 'State':
+    from mm_rag.agents.chatbot_flow.graph import State
+    return State
+  raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def run_chatbot(
+    query: str,
+    retriever: 'Retriever',
+    vlm: 'VLM',
+    bucket: 'BucketService',
+    cache: 'SemanticCache | None' = None
+) -> Any | None:
+  """
+  :param cache: when given, the answer of a close enough previous query of the same namespace
+    is returned without running the graph, and new answers are stored in it
+  """
+  if cache is None:
+    return _invoke(query, retriever, vlm, bucket)
+
+  namespace = retriever.namespace
+  # Read before answering, so that an upload racing with this query invalidates its answer
+  version = cache.versions.get(namespace)
+  embedding = retriever.embed(query)
+
+  answer = cache.get(namespace, embedding)
+  if answer is not None:
+    return answer
+
+  answer = _invoke(query, retriever, vlm, bucket)
+  if answer is not None:
+    cache.set(namespace, embedding, answer, version=version)
+  return answer
+
+
+def _invoke(query: str, retriever: 'Retriever', vlm: 'VLM', bucket: 'BucketService') -> Any | None:
   state = {
     "messages": [],
     "is_retrieve_required": None,
@@ -68,7 +76,7 @@ def run_chatbot(query: str, retriever: 'Retriever', vlm: 'VLM', bucket: 'BucketS
     {"role": "user", "content": state['query']}
   ]
 
-  state = graph.invoke(state)
+  state = get_graph().invoke(state)
 
   if state.get("messages") and len(state['messages']) > 0:
     last_message = state['messages'][-1]
@@ -60,8 +60,10 @@ def formatter(state: 'State'):
       }
 
     doc_type = doc_type.lower().lstrip(".")
+    # Pdf pages can be embedded either from their text layer or as images
+    modality = doc.metadata.get("modality")
 
-    if doc_type in ['jpeg', 'png', 'jpg', 'pdf']:
+    if doc_type in ['jpeg', 'png', 'jpg', 'pdf'] and modality != 'text':
       img_url = bucket.generate_presigned_url(doc_id)
       final_message_content.append(
         {
@@ -4,6 +4,7 @@ if TYPE_CHECKING:
 
 from mm_rag.logging_service.log_config import create_logger
 from mm_rag.agents.prompts import classifier_prompt
+from mm_rag.agents.chatbot_flow.pre_classifier import Decision, pre_classifier
 from mm_rag.agents.agent_utils import validate_response
 from mm_rag.exceptions import ResponseValidationError, MessageError
 
@@ -34,6 +35,11 @@ def classify_input(state: 'State'):
 
   logger.debug(f"Classifying input: {query}")
 
+  if pre_classifier is not None:
+    decision = pre_classifier.classify(query, state.get('retriever'))
+    if decision is not None:
+      return {"is_retrieval_required": decision.is_retrieval_required, 'query': query}
+
   input_prompt = classifier_prompt.invoke({"query": query}).to_string().removeprefix("Human: ")
 
   message = BaseMessage(
@@ -59,11 +65,13 @@ def classify_input(state: 'State'):
       if validated:
         logger.debug(f"Parsed model output: {validated}")
         logger.debug(f"Is retrieval required? {validated.is_retrieval_required}, type: {type(validated.is_retrieval_required)}")
+        _record_vlm(validated.is_retrieval_required)
 
         return {"is_retrieval_required": validated.is_retrieval_required, 'query': query}
 
     except ResponseValidationError as e:
       if i == MAX_RETRIES:
+        _record_vlm(True)
         return {"is_retrieval_required": True, "query": query}
 
       logger.info(
@@ -75,3 +83,8 @@ def classify_input(state: 'State'):
   if not validated:
     return {"is_retrieval_required": True, "query": query}
   return None
+
+
+def _record_vlm(is_retrieval_required: bool) -> None:
+  if pre_classifier is not None:
+    pre_classifier.record(Decision(is_retrieval_required, 'vlm'))
@@ -0,0 +1,144 @@
+import re
+import threading
+from array import array
+from collections import Counter
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
+
+from mm_rag.agents.chatbot_flow.semantic_cache import dot, unit_vector
+from mm_rag.agents.prompts import classifier_prompt_template
+from mm_rag.config.config import config
+from mm_rag.logging_service.log_config import create_logger
+
+if TYPE_CHECKING:
+  from mm_rag.pipelines.retrievers import Retriever
+
+
+logger = create_logger(__name__)
+
+
+# Labeled examples of the classifier prompt, so that both stages learn from the same ones
+_EXAMPLE = re.compile(r'Query: (?P<query>.+?)\{\{"is_retrieval_required": (?P<label>true|false)\}\}')
+
+EXEMPLARS: list[tuple[str, bool]] = [
+  (match['query'].strip(), match['label'] == 'true')
+  for match in _EXAMPLE.finditer(classifier_prompt_template)
+]
+
+# Queries that are unambiguous on their own: references to the user's content need it, small talk does not
+RULES: list[tuple[re.Pattern, bool]] = [
+  (re.compile(
+    r'\b(my|our|this|these|the uploaded|the attached|uploaded|attached)\s+'
+    r'(documents?|docs?|files?|pdfs?|images?|pictures?|photos?|slides?|notes?|papers?|reports?)\b',
+    re.IGNORECASE
+  ), True),
+  (re.compile(r'\b(section|figure|fig\.|table|page|chapter|appendix)\s+\d+', re.IGNORECASE), True),
+  (re.compile(
+    r'^\s*(hi|hello|hey|thanks|thank you|thx|ok|okay|bye|goodbye|good (morning|afternoon|evening))'
+    r'( there)?[\s!.,?]*$',
+    re.IGNORECASE
+  ), False),
+]
+
+
+@dataclass
+class Decision:
+  is_retrieval_required: bool
+  # One of: 'rules', 'exemplars', 'vlm'
+  source: str
+  confidence: float = 1.0
+
+
+class PreClassifier:
+  """
+  Decides locally whether a query requires retrieval, before the VLM is asked.
+  The rules are tried first, then the query's embedding is compared to the ones of the labeled exemplars:
+  the decision is taken when the closest exemplar is similar enough and closer than every exemplar of the other label
+  by at least `min_margin`. Otherwise nothing is decided, and the VLM should be asked.
+  """
+  def __init__(
+      self,
+      exemplars: list[tuple[str, bool]] = EXEMPLARS,
+      rules: list[tuple[re.Pattern, bool]] = RULES,
+      min_similarity: float = 0.8,
+      min_margin: float = 0.1
+  ) -> None:
+    self.exemplars = exemplars
+    self.rules = rules
+    self.min_similarity = min_similarity
+    self.min_margin = min_margin
+    self.decisions: Counter[str] = Counter()
+
+    # Embeddings of the exemplars, by embedding model
+    self._embedded: dict[str, list[tuple[array, bool]]] = {}
+    self._lock = threading.Lock()
+
+  def classify(self, query: str, retriever: 'Retriever | None' = None) -> Decision | None:
+    """
+    :param retriever: embeds the query and the exemplars, only the rules are applied without it
+    :return: the decision, None when the confidence is too low
+    """
+    for pattern, label in self.rules:
+      if pattern.search(query):
+        return self.record(Decision(label, 'rules'))
+
+    if retriever is None or not self.exemplars:
+      return None
+
+    try:
+      exemplars = self._exemplars(retriever)
+      embedding = unit_vector(retriever.embed(query))
+    except Exception as e:
+      logger.warning(f"Unable to embed the query for the pre-classifier: {e}")
+      return None
+
+    best = {True: -1.0, False: -1.0}
+    for exemplar, label in exemplars:
+      best[label] = max(best[label], dot(embedding, exemplar))
+
+    label = best[True] >= best[False]
+    margin = best[label] - best[not label]
+    logger.debug(f"Closest exemplars: {best}, margin {margin:.3f}")
+
+    if best[label] < self.min_similarity or margin < self.min_margin:
+      return None
+    return self.record(Decision(label, 'exemplars', confidence=margin))
+
+  def record(self, decision: Decision) -> Decision:
+    with self._lock:
+      self.decisions[decision.source] += 1
+    logger.debug(f"Retrieval required: {decision.is_retrieval_required}, decided by {decision.source}")
+    return decision
+
+  def metrics(self) -> dict[str, Any]:
+    with self._lock:
+      decisions = dict(self.decisions)
+
+    total = sum(decisions.values())
+    return {
+      'decisions': decisions,
+      'local_rate': (total - decisions.get('vlm', 0)) / total if total else 0.0,
+    }
+
+  def _exemplars(self, retriever: 'Retriever') -> list[tuple[array, bool]]:
+    model_id = retriever.model_id
+    embedded = self._embedded.get(model_id)
+
+    if embedded is None:
+      embedded = [(unit_vector(retriever.embed(query)), label) for query, label in self.exemplars]
+      self._embedded[model_id] = embedded
+
+    return embedded
+
+
+def from_config(classifier_config: dict[str, Any]) -> PreClassifier | None:
+  if not classifier_config.get('enabled', True):
+    return None
+
+  return PreClassifier(
+    min_similarity=classifier_config.get('min_similarity', 0.8),
+    min_margin=classifier_config.get('min_margin', 0.1)
+  )
+
+
+pre_classifier = from_config(config['pre_classifier'])
@@ -0,0 +1,156 @@
+import math
+import operator
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any
+
+from mm_rag.caching import CacheStats, NamespaceVersions, namespace_versions
+from mm_rag.config.config import config
+from mm_rag.logging_service.log_config import create_logger
+
+
+logger = create_logger(__name__)
+
+
+@dataclass
+class _Entry:
+  namespace: str
+  version: int
+  # L2-normalized, so that the cosine similarity is a dot product
+  embedding: array
+  answer: Any
+  expires_at: float
+
+
+class SemanticCache:
+  """
+  Answers of the chatbot, indexed by the embedding of their query, one small index per namespace.
+  A query within `max_distance` cosine distance of a cached one gets its answer back,
+  as long as the namespace did not change since, see NamespaceVersions.
+  Entries expire after `ttl` seconds and the least recently used are evicted past `max_entries`, over all namespaces.
+  """
+  def __init__(
+      self,
+      max_entries: int = 1024,
+      max_distance: float = 0.05,
+      ttl: float = 3600,
+      versions: NamespaceVersions = namespace_versions,
+      clock=time.monotonic
+  ) -> None:
+    if max_entries < 1:
+      raise ValueError(f"max_entries must be positive, got {max_entries}")
+
+    self.max_entries = max_entries
+    self.max_distance = max_distance
+    self.ttl = ttl
+    self.versions = versions
+    self.clock = clock
+    self.stats = CacheStats()
+
+    # Every entry in LRU order, and the entries of every namespace
+    self._entries: OrderedDict[int, _Entry] = OrderedDict()
+    self._by_namespace: dict[str, dict[int, _Entry]] = {}
+    self._next_id = 0
+    self._lock = threading.Lock()
+
+  def get(self, namespace: str, embedding: list[float]) -> Any | None:
+    """
+    :return: the answer of the closest cached query, None if none is close enough
+    """
+    query = unit_vector(embedding)
+    version = self.versions.get(namespace)
+    now = self.clock()
+
+    with self._lock:
+      best_id, best_similarity = None, -1.0
+
+      for entry_id, entry in list(self._by_namespace.get(namespace, {}).items()):
+        if entry.version != version or entry.expires_at <= now:
+          self._remove(entry_id)
+          continue
+
+        similarity = dot(query, entry.embedding)
+        if similarity > best_similarity:
+          best_id, best_similarity = entry_id, similarity
+
+      if best_id is None or 1 - best_similarity > self.max_distance:
+        self.stats.misses += 1
+        return None
+
+      self.stats.hits += 1
+      self._entries.move_to_end(best_id)
+      logger.debug(f"Chat cache hit in {namespace} at distance {1 - best_similarity:.4f}, hit rate {self.stats.hit_rate:.2f}")
+      return self._entries[best_id].answer
+
+  def set(self, namespace: str, embedding: list[float], answer: Any, version: int | None = None) -> None:
+    """
+    :param version: of the namespace when the answer was computed, read before computing it
+      so that answers racing with an upload are never served after it
+    """
+    entry = _Entry(
+      namespace=namespace,
+      version=self.versions.get(namespace) if version is None else version,
+      embedding=unit_vector(embedding),
+      answer=answer,
+      expires_at=self.clock() + self.ttl
+    )
+
+    with self._lock:
+      entry_id = self._next_id
+      self._next_id += 1
+      self._entries[entry_id] = entry
+      self._by_namespace.setdefault(namespace, {})[entry_id] = entry
+
+      while len(self._entries) > self.max_entries:
+        self._remove(next(iter(self._entries)))
+        self.stats.evictions += 1
+
+  def clear(self) -> None:
+    with self._lock:
+      self._entries.clear()
+      self._by_namespace.clear()
+
+  def metrics(self) -> dict[str, float]:
+    return {
+      'hits': self.stats.hits,
+      'misses': self.stats.misses,
+      'evictions': self.stats.evictions,
+      'hit_rate': self.stats.hit_rate,
+      'entries': len(self._entries),
+    }
+
+  def __len__(self) -> int:
+    return len(self._entries)
+
+  def _remove(self, entry_id: int) -> None:
+    entry = self._entries.pop(entry_id)
+    namespace_entries = self._by_namespace[entry.namespace]
+    del namespace_entries[entry_id]
+    if not namespace_entries:
+      del self._by_namespace[entry.namespace]
+
+
+def unit_vector(embedding: list[float]) -> array:
+  norm = math.sqrt(math.fsum(value * value for value in embedding)) or 1.0
+  return array('f', (value / norm for value in embedding))
+
+
+def dot(a: array, b: array) -> float:
+  return sum(map(operator.mul, a, b))
+
+
+def from_config(cache_config: dict[str, Any]) -> SemanticCache | None:
+  if not cache_config.get('enabled', True):
+    return None
+
+  return SemanticCache(
+    max_entries=cache_config.get('max_entries', 1024),
+    max_distance=cache_config.get('max_distance', 0.05),
+    ttl=cache_config.get('ttl_seconds', 3600)
+  )
+
+
+chat_cache = from_config(config['chat_cache'])
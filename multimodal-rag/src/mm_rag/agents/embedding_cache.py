@@ -0,0 +1,234 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from array import array
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+  from mm_rag.models.dynamodb import DynamoDB
+
+from botocore.exceptions import ClientError
+
+from mm_rag.caching import LRUCache
+from mm_rag.logging_service.log_config import create_logger
+
+
+logger = create_logger(__name__)
+
+
+class CacheBackend(ABC):
+  """
+  Persistent tier of the EmbeddingCache.
+  Embeddings are stored as packed float32 bytes.
+  """
+  hits: int = 0
+  misses: int = 0
+
+  @abstractmethod
+  def get(self, key: str) -> bytes | None:
+    pass
+
+  @abstractmethod
+  def set(self, key: str, value: bytes) -> None:
+    pass
+
+
+class SQLiteCacheBackend(CacheBackend):
+  def __init__(self, path: str, max_entries: int = 100_000) -> None:
+    self.path = path
+    self.max_entries = max_entries
+    self.hits = 0
+    self.misses = 0
+
+    self._lock = threading.Lock()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    self._conn = sqlite3.connect(path, check_same_thread=False)
+    self._conn.execute("PRAGMA journal_mode=WAL")
+    self._conn.execute("PRAGMA mmap_size=268435456")
+    self._conn.execute(
+      "CREATE TABLE IF NOT EXISTS embeddings ("
+      "key TEXT PRIMARY KEY, value BLOB NOT NULL, accessed REAL NOT NULL)"
+    )
+    self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_accessed ON embeddings (accessed)")
+    self._conn.commit()
+
+  def get(self, key: str) -> bytes | None:
+    with self._lock:
+      row = self._conn.execute("SELECT value FROM embeddings WHERE key = ?", (key,)).fetchone()
+      if row is None:
+        self.misses += 1
+        return None
+
+      self._conn.execute("UPDATE embeddings SET accessed = ? WHERE key = ?", (time.time(), key))
+      self._conn.commit()
+      self.hits += 1
+      return row[0]
+
+  def set(self, key: str, value: bytes) -> None:
+    with self._lock:
+      self._conn.execute(
+        "INSERT OR REPLACE INTO embeddings (key, value, accessed) VALUES (?, ?, ?)",
+        (key, value, time.time())
+      )
+      self._evict()
+      self._conn.commit()
+
+  def __len__(self) -> int:
+    with self._lock:
+      return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+  def _evict(self) -> None:
+    count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+    overflow = count - self.max_entries
+    if overflow <= 0:
+      return
+
+    # Drop a tenth of the table at once so that eviction does not run on every insert
+    to_remove = max(overflow, self.max_entries // 10)
+    logger.debug(f"Evicting {to_remove} embeddings from {self.path}")
+    self._conn.execute(
+      "DELETE FROM embeddings WHERE key IN "
+      "(SELECT key FROM embeddings ORDER BY accessed ASC LIMIT ?)",
+      (to_remove,)
+    )
+
+
+class DynamoDBCacheBackend(CacheBackend):
+  """
+  Stores the embeddings in the `embedding_cache` table.
+  Size is bounded through DynamoDB's native TTL on the `expiresAt` attribute.
+  """
+  table_name = 'embedding_cache'
+
+  def __init__(self, dynamodb: 'DynamoDB', ttl_seconds: int = 30 * 24 * 3600) -> None:
+    self.dynamodb = dynamodb
+    self.ttl_seconds = ttl_seconds
+    self.hits = 0
+    self.misses = 0
+    # Resolved once, every lookup then costs a single request
+    self.table = dynamodb.table(self.table_name)
+
+  def get(self, key: str) -> bytes | None:
+    try:
+      item: dict[str, Any] | None = self.table.get_item(Key={'cacheKey': key}).get('Item')
+    except ClientError as e:
+      logger.warning(f"Embedding cache lookup failed for {key}: {e}")
+      self.misses += 1
+      return None
+
+    if item is None:
+      self.misses += 1
+      return None
+
+    self.hits += 1
+    value = item['embedding']
+    # boto3 wraps binary attributes in `Binary`
+    return bytes(getattr(value, 'value', value))
+
+  def set(self, key: str, value: bytes) -> None:
+    try:
+      self.table.put_item(
+        Item={
+          'cacheKey': key,
+          'embedding': value,
+          'expiresAt': int(time.time()) + self.ttl_seconds
+        }
+      )
+    except ClientError as e:
+      logger.warning(f"Unable to store {key} in the embedding cache: {e}")
+
+
+class EmbeddingCache:
+  """
+  Content-addressed cache in front of the Embedder.
+  Keys are built from the model id, the kind of input and the sha256 of the input,
+  lookups go through an in-process LRU first and then through the optional persistent backend.
+  """
+  def __init__(
+      self,
+      max_entries: int = 4096,
+      max_bytes: int | None = 64 * 1024 * 1024,
+      persistent: CacheBackend | None = None
+  ) -> None:
+    self.memory: LRUCache[str, array] = LRUCache(
+      max_entries=max_entries,
+      max_bytes=max_bytes,
+      sizeof=lambda key, value: len(key) + value.itemsize * len(value)
+    )
+    self.persistent = persistent
+
+  @staticmethod
+  def key(model_id: str, kind: str, payload: str) -> str:
+    digest = hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    return f"{model_id}:{kind}:{digest}"
+
+  def get(self, key: str) -> list[float] | None:
+    cached = self.memory.get(key)
+    if cached is not None:
+      return cached.tolist()
+
+    if self.persistent is None:
+      return None
+
+    packed = self.persistent.get(key)
+    if packed is None:
+      return None
+
+    # Promote to the in-process tier
+    values = array('f')
+    values.frombytes(packed)
+    self.memory.set(key, values)
+    return values.tolist()
+
+  def set(self, key: str, embedding: list[float]) -> None:
+    values = array('f', embedding)
+    self.memory.set(key, values)
+
+    if self.persistent is not None:
+      self.persistent.set(key, values.tobytes())
+
+  def stats(self) -> dict[str, int]:
+    stats = {
+      'memory_hits': self.memory.stats.hits,
+      'memory_misses': self.memory.stats.misses,
+      'memory_evictions': self.memory.stats.evictions,
+      'memory_entries': len(self.memory),
+      'memory_bytes': self.memory.size,
+    }
+    if self.persistent is not None:
+      stats['persistent_hits'] = self.persistent.hits
+      stats['persistent_misses'] = self.persistent.misses
+
+    return stats
+
+
+def from_config(cache_config: dict[str, Any], dynamodb: 'DynamoDB | None' = None) -> EmbeddingCache | None:
+  if not cache_config.get('enabled', True):
+    return None
+
+  backend = cache_config.get('backend')
+  persistent: CacheBackend | None = None
+
+  if backend == 'sqlite':
+    persistent = SQLiteCacheBackend(
+      cache_config['sqlite_path'],
+      max_entries=cache_config.get('sqlite_max_entries', 100_000)
+    )
+  elif backend == 'dynamodb':
+    if dynamodb is None:
+      raise ValueError("A DynamoDB instance is required for the `dynamodb` embedding cache backend")
+    persistent = DynamoDBCacheBackend(
+      dynamodb,
+      ttl_seconds=cache_config.get('dynamodb_ttl_days', 30) * 24 * 3600
+    )
+  elif backend is not None:
+    raise ValueError(f"Unknown embedding cache backend: {backend}")
+
+  return EmbeddingCache(
+    max_entries=cache_config.get('memory_entries', 4096),
+    max_bytes=cache_config.get('memory_bytes'),
+    persistent=persistent
+  )
@@ -1,28 +1,62 @@
-from typing import Any
+from typing import TYPE_CHECKING, Any, Callable, TypeVar
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError
 from langchain_core.embeddings.embeddings import Embeddings
 
+import asyncio
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 from mm_rag.logging_service.log_config import create_logger
 
+if TYPE_CHECKING:
+  from mm_rag.agents.embedding_cache import EmbeddingCache
+
 
 logger = create_logger(__name__)
 
+T = TypeVar("T")
+
 
 class Embedder(Embeddings):
   def __init__(
       self,
-      model_id: str = 'amazon.titan-embed-image-v1'
+      model_id: str = 'amazon.titan-embed-image-v1',
+      max_concurrency: int = 8,
+      batch_size: int = 32,
+      cache: 'EmbeddingCache | None' = None
   ) -> None:
-    self.client = boto3.client("bedrock-runtime", region_name='eu-central-1')
+    if max_concurrency < 1 or batch_size < 1:
+      raise ValueError(
+        f"max_concurrency and batch_size must be positive, got {max_concurrency} and {batch_size}"
+      )
+
+    self.client = boto3.client(
+      "bedrock-runtime",
+      region_name='eu-central-1',
+      # Keep enough pooled connections around for every in-flight `invoke_model`
+      config=Config(max_pool_connections=max(max_concurrency, 10))
+    )
     self.model_id = model_id
+    self.max_concurrency = max_concurrency
+    self.batch_size = batch_size
+    self.cache = cache
+
+    self._executor: ThreadPoolExecutor | None = None
+    self._executor_lock = threading.Lock()
 
   # Add `def embed_audio(self, audio_input: ?) -> list[float]`
   # Add `def embed_video(self, video_input: ?) -> list[float]`
 
   def embed_query(self, text: str) -> list[float]:
+    return self._cached('text', text, self._embed_query)
+
+  def embed_img(self, base64_encoded_img: str) -> list[float]:
+    return self._cached('image', base64_encoded_img, self._embed_img)
+
+  def _embed_query(self, text: str) -> list[float]:
     request_body = json.dumps({
           "inputText": text
         })
@@ -39,7 +73,7 @@ class Embedder(Embeddings):
 
     return json.loads(response['body'].read())['embedding']
 
-  def embed_img(self, base64_encoded_img: str) -> list[float]:
+  def _embed_img(self, base64_encoded_img: str) -> list[float]:
     request_body = json.dumps({
       "inputImage": base64_encoded_img
     })
@@ -58,15 +92,88 @@ class Embedder(Embeddings):
     return json.loads(response['body'].read())['embedding']
 
   def embed_documents(self, texts: list[str]) -> list[list[float]]:
-    embedded_docs: list[list[float]] = []
+    self._validate_inputs(texts)
+
+    return self._embed_many(self.embed_query, texts)
+
+  def embed_imgs(self, base64_encoded_imgs: list[str]) -> list[list[float]]:
+    self._validate_inputs(base64_encoded_imgs)
+
+    return self._embed_many(self.embed_img, base64_encoded_imgs)
+
+  async def aembed_query(self, text: str) -> list[float]:
+    return await asyncio.to_thread(self.embed_query, text)
+
+  async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+    self._validate_inputs(texts)
 
-    if isinstance(texts, list):
-      for text in texts:
-        embedded_docs.append(self.embed_query(text))
+    return await self._aembed_many(self.embed_query, texts)
 
-      return embedded_docs
+  async def aembed_imgs(self, base64_encoded_imgs: list[str]) -> list[list[float]]:
+    self._validate_inputs(base64_encoded_imgs)
 
-    else:
+    return await self._aembed_many(self.embed_img, base64_encoded_imgs)
+
+  def _cached(self, kind: str, payload: str, embed_func: Callable[[str], list[float]]) -> list[float]:
+    if self.cache is None:
+      return embed_func(payload)
+
+    key = self.cache.key(self.model_id, kind, payload)
+    cached = self.cache.get(key)
+    if cached is not None:
+      return cached
+
+    embedding = embed_func(payload)
+    self.cache.set(key, embedding)
+
+    return embedding
+
+  @property
+  def executor(self) -> ThreadPoolExecutor:
+    """
+    Long-lived worker pool shared by every batched call on this embedder,
+    so that concurrent uploads are bounded together by `max_concurrency`.
+    """
+    if self._executor is None:
+      with self._executor_lock:
+        if self._executor is None:
+          self._executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrency,
+            thread_name_prefix='embedder'
+          )
+    return self._executor
+
+  def _embed_many(self, embed_func: Callable[[T], list[float]], inputs: list[T]) -> list[list[float]]:
+    embedded: list[list[float]] = []
+
+    # Submitting one batch at a time bounds the number of request bodies held in memory,
+    # `map` returns the results in input order.
+    for start in range(0, len(inputs), self.batch_size):
+      batch = inputs[start:start + self.batch_size]
+      logger.debug(f"Embedding batch {start // self.batch_size + 1} of {len(batch)} inputs")
+      embedded.extend(self.executor.map(embed_func, batch))
+
+    return embedded
+
+  async def _aembed_many(self, embed_func: Callable[[T], list[float]], inputs: list[T]) -> list[list[float]]:
+    semaphore = asyncio.Semaphore(self.max_concurrency)
+    loop = asyncio.get_running_loop()
+
+    async def _embed(value: T) -> list[float]:
+      async with semaphore:
+        return await loop.run_in_executor(self.executor, embed_func, value)
+
+    embedded: list[list[float]] = []
+
+    for start in range(0, len(inputs), self.batch_size):
+      batch = inputs[start:start + self.batch_size]
+      embedded.extend(await asyncio.gather(*[_embed(value) for value in batch]))
+
+    return embedded
+
+  @staticmethod
+  def _validate_inputs(inputs: Any) -> None:
+    if not isinstance(inputs, list):
       raise ValueError(
-        f"Input must be a list[str], got {type(texts)}"
-      )
\ No newline at end of file
+        f"Input must be a list[str], got {type(inputs)}"
+      )
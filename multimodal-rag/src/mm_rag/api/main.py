@@ -1,24 +1,68 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request, responses
 from mangum import Mangum
-import uvicorn
 from mm_rag.api.routes.add_file import upload_router
 from mm_rag.api.routes.search import search_router
 from mm_rag.api.routes.chat import chat_router
 from mm_rag.api.routes.clean import cleanup_router
+from mm_rag.api.routes.jobs import jobs_router
+from mm_rag.api.routes.metrics import metrics_router
 from mm_rag.logging_service.log_config import create_logger
+from mm_rag.config.config import config
+from mm_rag.entrypoints import setup
 import boto3
 
 
 logger = create_logger(__name__)
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+  # Components are otherwise built by the first request that needs them
+  if config['services']['warm_up_on_startup']:
+    await asyncio.to_thread(setup.services.warm_up)
+  yield
+  # Jobs still queued or running are lost with the process, their state stays 'queued' or 'running'
+  if setup.services.is_built('jobs'):
+    await setup.jobs.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+# Request bodies larger than these are rejected before the multipart body is read,
+# the routes enforce their limits again for bodies without a length
+UPLOAD_LIMITS_MB = {
+  '/upload-file': config['uploads']['max_mb'],
+  '/upload-files': config['batch']['max_request_mb'],
+}
+
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+  max_mb = UPLOAD_LIMITS_MB.get(request.url.path.rstrip('/'))
+  content_length = request.headers.get('content-length')
+
+  if (max_mb is not None
+      and content_length is not None
+      and content_length.isdigit()
+      and int(content_length) > max_mb * 1024 * 1024):
+    return responses.JSONResponse(
+      status_code=413,
+      content={"detail": f"Uploads to {request.url.path} are limited to {max_mb}MB"}
+    )
+
+  return await call_next(request)
 
 
 app.include_router(upload_router)
 app.include_router(search_router)
 app.include_router(chat_router)
 app.include_router(cleanup_router)
+app.include_router(jobs_router)
+app.include_router(metrics_router)
 
 
 handler = Mangum(app)
@@ -1,12 +1,21 @@
-from typing import Annotated
+import os
+from contextlib import AsyncExitStack
+from dataclasses import asdict
+from typing import TYPE_CHECKING, Annotated, Any, Callable
 
 from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, responses
 
-from mm_rag.api.utils import write_file_to_lambda_path,authorize
+from mm_rag.api.utils import aauthorize, check_background_jobs, stage_upload, upload_dedup
 from mm_rag.logging_service.log_config import create_logger
-from mm_rag.entrypoints import upload_file, setup
+from mm_rag.entrypoints import upload_file, upload_files, setup
 from mm_rag.api.dependencies import auth_pat_dependency, HTTPAuthorizationCredentials
-from mm_rag.exceptions import FileNotValidError, DocGenerationError, ImageTooBigError, ObjectUpsertionError, StorageError
+from mm_rag.config.config import config
+from mm_rag.exceptions import FileNotValidError, DocGenerationError, ImageTooBigError, JobQueueFullError, ObjectUpsertionError, StorageError, UploadTooLargeError
+from mm_rag.pipelines.jobs import Job, JobRunner
+
+
+if TYPE_CHECKING:
+  from mm_rag.pipelines.ingest import IngestProgress
 
 
 upload_router = APIRouter()
@@ -17,17 +26,15 @@ logger = create_logger(__name__)
 async def add_file(
     auth_pat: Annotated[HTTPAuthorizationCredentials, Depends(auth_pat_dependency)],
     file: UploadFile = File(...),
+    background: bool = False,
 ):
-  user = authorize(setup.dynamo, auth_pat.credentials)
+  """
+  :param background: returns a job id right away, the file is ingested by the job queue, see `/jobs/{job_id}`
+  """
+  user = await aauthorize(setup.dynamo, auth_pat.credentials)
+  check_background_jobs(background)
 
   filename = file.filename
-  bytes_file = file.file.read()
-
-  if len(bytes_file) == 0:
-    raise HTTPException(
-      status_code=404,
-      detail="Cannot upload an empty file: {filename}"
-    )
 
   if filename is None:
     logger.warning(f"Found UploadFile object with no file name: {file}")
@@ -37,11 +44,34 @@ async def add_file(
     )
 
   try:
-    logger.debug(f"Writing {filename} to lambda path")
-    path = write_file_to_lambda_path(bytes_file, filename)
+    async with stage_upload(
+      file,
+      max_bytes=config['uploads']['max_mb'] * 1024 * 1024,
+      chunk_bytes=config['uploads']['chunk_kb'] * 1024
+    ) as staged:
+      if staged.size == 0:
+        raise HTTPException(
+          status_code=404,
+          detail=f"Cannot upload an empty file: {filename}"
+        )
+
+      dedup_key = (user.user_id, os.path.basename(filename), staged.sha256)
+      path = staged.path
+
+      if background:
+        return submit_job(
+          Job(user_id=user.user_id, file_name=filename),
+          lambda progress: upload_dedup.run(dedup_key, lambda: upload_file(path, user.user_id, progress)),
+          remove=staged.detach()
+        )
 
-    logger.debug(f"Uploading file: {path}, with userId = {user.user_id}")
-    await upload_file(path, user.user_id)
+      logger.debug(f"Uploading file: {path}, with userId = {user.user_id}")
+      ingested = await upload_dedup.run(dedup_key, lambda: upload_file(path, user.user_id))
+
+  except UploadTooLargeError as e:
+    raise HTTPException(
+      status_code=413, detail=str(e)
+    )
 
   except (FileNotValidError, FileNotFoundError) as e:
     raise HTTPException(
@@ -70,7 +100,82 @@ async def add_file(
       detail=str(e)
     )
 
+  if not ingested:
+    return responses.JSONResponse(
+      status_code=200,
+      content={"message": f"{file.filename} was already uploaded, skipped."}
+    )
+
   return responses.JSONResponse(
     status_code=200,
     content={"message": f"Upload of {file.filename} successful!"}
   )
+
+
+@upload_router.post("/upload-files/")
+async def add_files(
+    auth_pat: Annotated[HTTPAuthorizationCredentials, Depends(auth_pat_dependency)],
+    files: list[UploadFile] = File(...),
+    background: bool = False,
+):
+  """
+  Ingests a batch of files, zip archives included, and reports the result of every file.
+  :param background: returns a job id right away, the results are reported by `/jobs/{job_id}`
+  """
+  user = await aauthorize(setup.dynamo, auth_pat.credentials)
+  check_background_jobs(background)
+
+  if len(files) > config['batch']['max_files']:
+    raise HTTPException(
+      status_code=413,
+      detail=f"At most {config['batch']['max_files']} files can be uploaded at once, got {len(files)}"
+    )
+
+  try:
+    async with AsyncExitStack() as stack:
+      staged = [
+        await stack.enter_async_context(stage_upload(
+          file,
+          max_bytes=config['uploads']['max_mb'] * 1024 * 1024,
+          chunk_bytes=config['uploads']['chunk_kb'] * 1024
+        ))
+        for file in files
+      ]
+      # Empty files are reported as failed by the batch, in their place
+      paths = [upload.path for upload in staged]
+
+      if background:
+        removers = [upload.detach() for upload in staged]
+        return submit_job(
+          Job(user_id=user.user_id, file_name=f"{len(paths)} files"),
+          lambda progress: _run_batch(paths, user.user_id, progress),
+          remove=lambda: [remove() for remove in removers]
+        )
+
+      results = await upload_files(paths, user.user_id)
+
+  except UploadTooLargeError as e:
+    raise HTTPException(status_code=413, detail=str(e))
+  except FileNotValidError as e:
+    raise HTTPException(status_code=404, detail=f"Invalid file. Full error: {e}")
+
+  return responses.JSONResponse(
+    status_code=200,
+    content={"results": [asdict(result) for result in results]}
+  )
+
+
+async def _run_batch(paths: list[str], user_id: str, progress: 'IngestProgress') -> list[dict[str, Any]]:
+  return [asdict(result) for result in await upload_files(paths, user_id, progress)]
+
+def submit_job(job: Job, run: JobRunner, remove: Callable[[], None]) -> responses.JSONResponse:
+  try:
+    setup.jobs.submit(job, run, cleanup=remove)
+  except JobQueueFullError as e:
+    remove()
+    raise HTTPException(status_code=503, detail=str(e))
+
+  return responses.JSONResponse(
+    status_code=202,
+    content={"job_id": job.job_id, "status": job.status, "status_url": f"/jobs/{job.job_id}"}
+  )
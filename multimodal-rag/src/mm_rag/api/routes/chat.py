@@ -5,11 +5,11 @@ from pydantic import BaseModel
 
 from mm_rag.exceptions import MessageError, MissingResponseContentError
 from mm_rag.logging_service.log_config import create_logger
-from mm_rag.entrypoints import run_chatbot
-from mm_rag.entrypoints.setup import vlm, bucket, dynamo, factory
+from mm_rag.entrypoints import run_chatbot, setup
 from mm_rag.api.dependencies import auth_pat_dependency, HTTPAuthorizationCredentials
 from mm_rag.api.utils import authorize
 from mm_rag.api.models import Query
+from mm_rag.agents.chatbot_flow.semantic_cache import chat_cache
 
 
 logger = create_logger(__name__)
@@ -18,14 +18,15 @@ chat_router = APIRouter()
 
 @chat_router.post('/chat')
 def chat(chat_input: Query, auth_pat: Annotated[HTTPAuthorizationCredentials, Depends(auth_pat_dependency)]):
-  user = authorize(dynamo, auth_pat.credentials)
+  user = authorize(setup.dynamo, auth_pat.credentials)
 
   try:
     response = run_chatbot(
       chat_input.query,
-      factory.get_retriever(user.user_id),
-      vlm,
-      bucket
+      setup.factory.get_retriever(user.user_id),
+      setup.vlm,
+      setup.bucket,
+      cache=chat_cache
     )
   except MessageError as e:
     raise HTTPException(status_code=422, detail=str(e))
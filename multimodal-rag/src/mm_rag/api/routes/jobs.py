@@ -0,0 +1,29 @@
+from dataclasses import asdict
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import JSONResponse
+
+from mm_rag.entrypoints import setup
+from mm_rag.logging_service.log_config import create_logger
+from mm_rag.api.dependencies import auth_pat_dependency, HTTPAuthorizationCredentials
+from mm_rag.api.utils import authorize
+
+
+logger = create_logger(__name__)
+jobs_router = APIRouter()
+
+
+@jobs_router.get('/jobs/{job_id}')
+def get_job(job_id: str, auth_pat: Annotated[HTTPAuthorizationCredentials, Depends(auth_pat_dependency)]):
+  user = authorize(setup.dynamo, auth_pat.credentials)
+
+  job = setup.jobs.get(job_id)
+  # The jobs of other users are reported as missing, not as forbidden
+  if job is None or job.user_id != user.user_id:
+    raise HTTPException(
+      status_code=404,
+      detail=f"No job found with id {job_id}"
+    )
+
+  return JSONResponse(content=asdict(job))
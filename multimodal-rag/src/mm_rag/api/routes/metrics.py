@@ -0,0 +1,30 @@
+from typing import Annotated
+
+from fastapi import APIRouter, Depends
+from fastapi.responses import JSONResponse
+
+from mm_rag.entrypoints import setup
+from mm_rag.logging_service.log_config import create_logger
+from mm_rag.api.dependencies import auth_pat_dependency, HTTPAuthorizationCredentials
+from mm_rag.api.utils import authorize
+from mm_rag.agents.chatbot_flow.semantic_cache import chat_cache
+
+
+logger = create_logger(__name__)
+metrics_router = APIRouter()
+
+
+@metrics_router.get('/metrics')
+def get_metrics(auth_pat: Annotated[HTTPAuthorizationCredentials, Depends(auth_pat_dependency)]):
+  """
+  Counters of the process' chat cache and query pre-classifier, since it started.
+  A disabled component is reported as null.
+  """
+  authorize(setup.dynamo, auth_pat.credentials)
+  # Imports the classifier prompt and langchain_core with it, only paid once the metrics are asked for
+  from mm_rag.agents.chatbot_flow.pre_classifier import pre_classifier
+
+  return JSONResponse(content={
+    'chat_cache': chat_cache.metrics() if chat_cache is not None else None,
+    'pre_classifier': pre_classifier.metrics() if pre_classifier is not None else None,
+  })
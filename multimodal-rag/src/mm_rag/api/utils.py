@@ -1,11 +1,22 @@
+import asyncio
+import functools
 import hashlib
+import shutil
+import tempfile
+import threading
+from concurrent.futures import Future
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable
 
 from mm_rag.logging_service.log_config import create_logger
-from mm_rag.exceptions import MissingItemError
-from mm_rag.models.dynamodb import DynamoDB
+from mm_rag.config.config import config
+from mm_rag.caching import LRUCache
+from mm_rag.exceptions import MissingItemError, UploadTooLargeError
+from mm_rag.models.dynamodb import DynamoDB, on_pat_change
 from mm_rag.exceptions import FileNotValidError
 
-from fastapi import HTTPException
+from fastapi import HTTPException, UploadFile
 
 from pydantic import BaseModel, ValidationError
 
@@ -16,19 +27,112 @@ logger = create_logger(__name__)
 LAMBDA_DIR = '/tmp/'
 
 
-def write_file_to_lambda_path(file: bytes, filename: str) -> str:
+@dataclass
+class StagedUpload:
+  path: str
+  sha256: str
+  size: int
+  detached: bool = False
 
-  file_path = os.path.join(LAMBDA_DIR, filename)
+  def detach(self) -> Callable[[], None]:
+    """
+    Keeps the file past the end of `stage_upload`, e.g. for a background job.
+    :return: removes the file, the caller is now responsible for calling it
+    """
+    self.detached = True
+    return functools.partial(shutil.rmtree, os.path.dirname(self.path), ignore_errors=True)
+
+
+@asynccontextmanager
+async def stage_upload(file: UploadFile, max_bytes: int, chunk_bytes: int = 1024 * 1024) -> AsyncIterator[StagedUpload]:
+  """
+  Copies the upload to its own temporary directory, `chunk_bytes` at a time, hashing it along the way.
+  The file keeps the client file name, which the extractors rely on, and is removed on exit unless detached.
+  :raises UploadTooLargeError: as soon as more than `max_bytes` are read
+  """
+  if file.size is not None and file.size > max_bytes:
+    raise UploadTooLargeError(f"{file.filename} is larger than {max_bytes} bytes")
+
+  # Never trust a client path, e.g. '../../etc/passwd'
+  filename = os.path.basename(file.filename or '')
+  if filename in ('', '.', '..'):
+    raise FileNotValidError(f"Invalid file name: {file.filename}")
+
+  directory = tempfile.mkdtemp(prefix='upload-', dir=LAMBDA_DIR)
+  path = os.path.join(directory, filename)
+  digest = hashlib.sha256()
+  size = 0
+  staged: StagedUpload | None = None
 
   try:
-    with open(file_path, 'wb') as f:
-      f.write(file)
+    with open(path, 'wb') as f:
+      while chunk := await file.read(chunk_bytes):
+        size += len(chunk)
+        if size > max_bytes:
+          raise UploadTooLargeError(f"{file.filename} is larger than {max_bytes} bytes")
+
+        digest.update(chunk)
+        f.write(chunk)
+
+    logger.debug(f"Staged {size} bytes of {filename} in {path}")
+    staged = StagedUpload(path=path, sha256=digest.hexdigest(), size=size)
+    yield staged
+
+  finally:
+    if staged is None or not staged.detached:
+      shutil.rmtree(directory, ignore_errors=True)
+
+
+class UploadDeduplicator:
+  """
+  Remembers the uploads ingested in the last `ttl` seconds, keyed by user, file name and content hash.
+  Concurrent uploads of the same file share a single ingestion and repeated ones are skipped.
+  """
+  def __init__(self, max_entries: int = 1024, ttl: float = 600) -> None:
+    self._done: LRUCache[tuple[str, str, str], bool] = LRUCache(max_entries=max_entries, ttl=ttl)
+    self._inflight: dict[tuple[str, str, str], asyncio.Future[bool]] = {}
+
+  async def run(self, key: tuple[str, str, str], ingest: Callable[[], Awaitable[None]]) -> bool:
+    """
+    :return: whether `ingest` ran, False if the upload was a duplicate
+    """
+    while True:
+      if self._done.get(key):
+        return False
 
-  except FileNotFoundError as e:
-    logger.error(f"Error while converting the provided file {filename} to a serverless-friendly file: {e}")
-    raise FileNotValidError(f"Error while converting the provided file {filename} to a serverless-friendly file: {e}")
+      inflight = self._inflight.get(key)
+      if inflight is None:
+        break
+      # The first upload failed, this one tries again
+      if await asyncio.shield(inflight):
+        return False
 
-  return file_path
+    future: asyncio.Future[bool] = asyncio.get_running_loop().create_future()
+    self._inflight[key] = future
+    try:
+      await ingest()
+      self._done.set(key, True)
+      future.set_result(True)
+    finally:
+      if not future.done():
+        future.set_result(False)
+      self._inflight.pop(key, None)
+
+    return True
+
+  def clear(self, user_id: str) -> None:
+    """
+    Forgets the uploads of `user_id`, the ones of every other user are kept
+    """
+    for key in self._done.keys():
+      if key[0] == user_id:
+        self._done.pop(key)
+
+
+upload_dedup = UploadDeduplicator(
+  max_entries=config['uploads']['dedup_entries'],
+  ttl=config['uploads']['dedup_ttl_seconds']
+)
 
 
 class AuthUser(BaseModel):
@@ -36,9 +140,112 @@ class AuthUser(BaseModel):
   pat: str
 
 
+# Cached in place of a user for tokens that match no user
+_UNKNOWN = object()
+
+
+class AuthCache:
+  """
+  In-process cache of the users authorized by a PAT, keyed by the PAT hash.
+  Unknown tokens are cached as well, for `negative_ttl` seconds,
+  and concurrent lookups of the same token share a single query.
+  """
+  def __init__(self, max_entries: int = 10_000, ttl: float = 300, negative_ttl: float = 30) -> None:
+    self.negative_ttl = negative_ttl
+    self._cache: LRUCache[str, object] = LRUCache(max_entries=max_entries, ttl=ttl)
+    self._inflight: dict[str, Future] = {}
+    self._lock = threading.Lock()
+
+  def get_or_load(self, token_hash: str, load: Callable[[], 'AuthUser | None']) -> 'AuthUser | None':
+    """
+    :param load: looks the user up, returning None if no user owns the token
+    :return: the user owning the token, or None
+    """
+    cached = self._cache.get(token_hash)
+    if cached is not None:
+      return None if cached is _UNKNOWN else cached  # type: ignore
+
+    with self._lock:
+      future = self._inflight.get(token_hash)
+      if future is not None:
+        leader = False
+      else:
+        leader = True
+        future = self._inflight[token_hash] = Future()
+
+    if not leader:
+      return future.result()
+
+    try:
+      user = load()
+    except BaseException as e:
+      with self._lock:
+        if self._inflight.get(token_hash) is future:
+          del self._inflight[token_hash]
+      future.set_exception(e)
+      raise
+
+    with self._lock:
+      # If the token was invalidated during the lookup, the result might be stale and is not cached
+      if self._inflight.get(token_hash) is future:
+        del self._inflight[token_hash]
+        if user is None:
+          self._cache.set(token_hash, _UNKNOWN, ttl=self.negative_ttl)
+        else:
+          self._cache.set(token_hash, user)
+
+    future.set_result(user)
+    return user
+
+  def invalidate(self, token_hash: str) -> None:
+    with self._lock:
+      self._inflight.pop(token_hash, None)
+      self._cache.pop(token_hash)
+
+  def clear(self) -> None:
+    with self._lock:
+      self._inflight.clear()
+      self._cache.clear()
+
+
+auth_cache = AuthCache(
+  max_entries=config['auth_cache']['max_entries'],
+  ttl=config['auth_cache']['ttl_seconds'],
+  negative_ttl=config['auth_cache']['negative_ttl_seconds']
+)
+# The users table stores the PAT hashes, which are also the keys of the cache
+on_pat_change(auth_cache.invalidate)
+
+
+def check_background_jobs(background: bool) -> None:
+  """
+  :raises HTTPException: 501 if a background upload is requested where the job queue cannot run it, see config['jobs']
+  """
+  if background and not config['jobs'].get('enabled', True):
+    raise HTTPException(
+      status_code=501,
+      detail="Background uploads are not available on this deployment, upload without `background`"
+    )
+
+
 def authorize(ddb: DynamoDB, token: str) -> AuthUser:
   encoded_token = hashlib.sha256(token.encode()).hexdigest()
 
+  auth_user = auth_cache.get_or_load(encoded_token, lambda: _lookup_user(ddb, encoded_token))
+  if auth_user is None:
+    raise HTTPException(status_code=403, detail=f"No user found with token {token}, access denied")
+
+  return auth_user
+
+
+async def aauthorize(ddb: DynamoDB, token: str) -> AuthUser:
+  """
+  `authorize` for the async routes: the lookup, or the wait for a concurrent one, runs off the event loop.
+  """
+  return await asyncio.to_thread(authorize, ddb, token)
+
+
+def _lookup_user(ddb: DynamoDB, encoded_token: str) -> AuthUser | None:
   try:
     user = ddb.query_with_gsi(
       table_name='users',
@@ -47,7 +254,7 @@ def authorize(ddb: DynamoDB, token: str) -> AuthUser:
       gsi_value=encoded_token
     )
   except MissingItemError:
-    raise HTTPException(status_code=403, detail=f"No user found with token {token}, access denied")
+    return None
   
   user = user[0]
 
@@ -0,0 +1,173 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Generic, Hashable, Iterable, TypeVar
+
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+@dataclass
+class CacheStats:
+  hits: int = 0
+  misses: int = 0
+  evictions: int = 0
+
+  @property
+  def hit_rate(self) -> float:
+    total = self.hits + self.misses
+    return self.hits / total if total else 0.0
+
+
+class LRUCache(Generic[K, V]):
+  """
+  Thread-safe in-process LRU cache.
+  Entries are evicted once either `max_entries` or `max_bytes` is exceeded,
+  the size of every entry is computed with `sizeof`.
+  When `ttl` is set, entries also expire that many seconds after being set.
+  """
+  def __init__(
+      self,
+      max_entries: int = 1024,
+      max_bytes: int | None = None,
+      sizeof: Callable[[K, V], int] | None = None,
+      ttl: float | None = None,
+      clock: Callable[[], float] = time.monotonic,
+  ) -> None:
+    if max_entries < 1:
+      raise ValueError(f"max_entries must be positive, got {max_entries}")
+
+    self.max_entries = max_entries
+    self.max_bytes = max_bytes
+    self.sizeof = sizeof or (lambda key, value: 0)
+    self.ttl = ttl
+    self.clock = clock
+    self.stats = CacheStats()
+
+    # key -> (value, size, expiration time or None)
+    self._entries: OrderedDict[K, tuple[V, int, float | None]] = OrderedDict()
+    self._size = 0
+    self._lock = threading.Lock()
+
+  def get(self, key: K) -> V | None:
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is not None and entry[2] is not None and entry[2] <= self.clock():
+        self._entries.pop(key)
+        self._size -= entry[1]
+        entry = None
+
+      if entry is None:
+        self.stats.misses += 1
+        return None
+
+      self._entries.move_to_end(key)
+      self.stats.hits += 1
+      return entry[0]
+
+  def set(self, key: K, value: V, ttl: float | None = None) -> None:
+    """
+    :param ttl: overrides the cache's ttl for this entry
+    """
+    size = self.sizeof(key, value)
+    ttl = ttl if ttl is not None else self.ttl
+    expires_at = self.clock() + ttl if ttl is not None else None
+
+    with self._lock:
+      if key in self._entries:
+        self._size -= self._entries.pop(key)[1]
+
+      self._entries[key] = (value, size, expires_at)
+      self._size += size
+      self._evict()
+
+  def pop(self, key: K) -> V | None:
+    with self._lock:
+      entry = self._entries.pop(key, None)
+      if entry is None:
+        return None
+
+      self._size -= entry[1]
+      return entry[0]
+
+  def clear(self) -> None:
+    with self._lock:
+      self._entries.clear()
+      self._size = 0
+
+  def keys(self) -> list[K]:
+    """
+    :return: a snapshot of the keys, expired ones included
+    """
+    with self._lock:
+      return list(self._entries)
+
+  @property
+  def size(self) -> int:
+    return self._size
+
+  def __len__(self) -> int:
+    return len(self._entries)
+
+  def __contains__(self, key: object) -> bool:
+    return key in self._entries
+
+  def _evict(self) -> None:
+    while self._entries and (
+        len(self._entries) > self.max_entries
+        or (self.max_bytes is not None and self._size > self.max_bytes)
+    ):
+      _, (_, size, _) = self._entries.popitem(last=False)
+      self._size -= size
+      self.stats.evictions += 1
+
+
+class NamespaceVersions:
+  """
+  Version counter of every namespace, bumped whenever its content changes.
+  Caches store the version along with their entries and ignore those of an older version.
+  """
+  def __init__(self) -> None:
+    self._versions: dict[str, int] = {}
+    self._lock = threading.Lock()
+
+  def get(self, namespace: str) -> int:
+    return self._versions.get(namespace, 0)
+
+  def bump(self, namespace: str) -> int:
+    with self._lock:
+      version = self._versions[namespace] = self._versions.get(namespace, 0) + 1
+      return version
+
+
+# Shared by the caches derived from the content of a namespace, bumped by uploads and cleanups
+namespace_versions = NamespaceVersions()
+
+
+class IngestCheckpoints:
+  """
+  Chunks already stored of the files whose ingestion failed, by namespace and file.
+  A new ingestion of the same content resumes after them instead of embedding and writing them again,
+  a cleanup of the namespace drops its checkpoints.
+  """
+  def __init__(self, max_entries: int = 1024, ttl: float | None = 24 * 3600) -> None:
+    # (namespace, file_id) -> (digest of the content, generation of the namespace, stored chunk ids)
+    self._files: LRUCache[tuple[str, str], tuple[str, int, frozenset[str]]] = LRUCache(max_entries, ttl=ttl)
+    self._generations = NamespaceVersions()
+
+  def get(self, namespace: str, file_id: str, digest: str) -> frozenset[str]:
+    entry = self._files.get((namespace, file_id))
+    if entry is None or entry[:2] != (digest, self._generations.get(namespace)):
+      return frozenset()
+    return entry[2]
+
+  def save(self, namespace: str, file_id: str, digest: str, chunk_ids: Iterable[str]) -> None:
+    self._files.set((namespace, file_id), (digest, self._generations.get(namespace), frozenset(chunk_ids)))
+
+  def discard(self, namespace: str, file_id: str) -> None:
+    self._files.pop((namespace, file_id))
+
+  def invalidate(self, namespace: str) -> None:
+    self._generations.bump(namespace)
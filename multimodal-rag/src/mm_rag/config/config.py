@@ -6,7 +6,160 @@ config = {
     'hosting_cloud': 'aws',
     'cloud_region': 'us-east-1'
   },
+  'vector_store': {
+    # One of: 'pinecone', 'local', 'pgvector'
+    'backend': 'pinecone',
+    # Directory of the memory-mapped local index, None keeps it in memory only
+    'local_path': '/tmp/mm-rag/vectors',
+    # Collections of at least this many vectors are searched through HNSW, when hnswlib is installed
+    'ann_threshold': 50_000,
+    'pg_host': os.environ.get('MM_RAG_PG_HOST', 'localhost'),
+    'pg_port': 5432,
+    'pg_database': os.environ.get('MM_RAG_PG_DATABASE', 'mm_rag'),
+    'pg_user': os.environ.get('MM_RAG_PG_USER', 'postgres'),
+    'pg_password': os.environ.get('MM_RAG_PG_PASSWORD', ''),
+    'pg_pool_size': 5,
+    # One of: 'hnsw', 'ivfflat'
+    'pg_vector_index': 'hnsw',
+    # Recall/latency knobs of the index, applied per query
+    'pg_ef_search': 40,
+    'pg_probes': 10,
+  },
   'aws': {
-    'bucketname': 'mm-rag-bucket-may-hot'
+    'bucketname': 'mm-rag-bucket-may-hot',
+    # Shared by every S3 call of the process, see models.s3bucket.get_s3_client
+    's3': {
+      # Sized for the concurrent page and chunk uploads of the ingest pipeline
+      'max_pool_connections': 32,
+      'max_attempts': 5,
+      # One of: 'legacy', 'standard', 'adaptive'
+      'retry_mode': 'standard',
+      'connect_timeout': 5,
+      'read_timeout': 30,
+      # Keys known to exist skip their existence check, the ttl bounds how long a deletion by another process goes unnoticed
+      'known_keys_entries': 10_000,
+      'known_keys_ttl_seconds': 600,
+      # Objects uploaded concurrently by BucketService.upload_objects, keep it within max_pool_connections
+      'upload_concurrency': 16,
+      # Larger objects are uploaded in parts of multipart_chunksize_mb, multipart_concurrency at a time
+      'multipart_threshold_mb': 8,
+      'multipart_chunksize_mb': 8,
+      'multipart_concurrency': 4,
+    },
+  },
+  'pdf': {
+    'dpi': 200,
+    # Concurrent pdftoppm processes
+    'render_workers': 2,
+    # Rendered pages waiting to be embedded, bounds the peak memory.
+    # Each pdftoppm process renders up to max_pending_pages // render_workers consecutive pages
+    'max_pending_pages': 4,
+    'embed_workers': 4,
+    # Pages with this much text and no image are chunked and embedded as text, without rendering
+    'min_text_chars': 200,
+    # Smaller images, e.g. logos and bullets, do not force a page to be rendered
+    'min_image_pixels': 100 * 100,
+    'chunk_size': 1000,
+    'chunk_overlap': 100,
+  },
+  'uploads': {
+    # Larger uploads are rejected with a 413, from their Content-Length when sent, otherwise while streamed
+    'max_mb': 100,
+    # Uploads are copied to disk this much at a time, bounding the memory of each upload
+    'chunk_kb': 1024,
+    # Identical uploads of a file by the same user within the ttl are ingested once
+    'dedup_entries': 1024,
+    'dedup_ttl_seconds': 600,
+  },
+  'batch': {
+    # Files of a /upload-files/ batch ingested concurrently, they share one thread pool of
+    # files * (embed_workers + store_workers + 1) threads
+    'files': 4,
+    # Files per request, the members of all its archives included
+    'max_files': 1000,
+    'max_archive_mb': 1024,
+    'max_request_mb': 2048,
+  },
+  'jobs': {
+    # Uploads sent with ?background=true are ingested by a queue of jobs, whose state lives in the store.
+    # The queue runs on the event loop of the serving process, which a Lambda freezes between invocations:
+    # background uploads are refused there with a 501 rather than left queued
+    'enabled': 'AWS_LAMBDA_FUNCTION_NAME' not in os.environ,
+    # One of: 'memory', 'sqlite', 'dynamodb'; dynamodb lets any instance report the jobs of the others
+    'backend': os.environ.get('MM_RAG_JOB_STORE', 'sqlite'),
+    'sqlite_path': '/tmp/mm-rag/jobs.sqlite',
+    'ttl_days': 7,
+    # Jobs ingested concurrently, and waiting before uploads are refused with a 503
+    'workers': 2,
+    'max_queued': 100,
+    'progress_interval_seconds': 1.0,
+  },
+  'images': {
+    # Processes decoding and encoding the images of a batch upload, 1 keeps them in-process.
+    # Lambda lacks the /dev/shm multiprocessing needs, only raise it elsewhere
+    'preprocess_workers': int(os.environ.get('MM_RAG_IMAGE_WORKERS', 1)),
+  },
+  'ingest': {
+    'embed_workers': 4,
+    'store_workers': 2,
+    # Chunks per write to the VectorStore
+    'batch_size': 32,
+    # Chunks waiting between two stages
+    'queue_size': 16,
+  },
+  'ingest_checkpoints': {
+    # Failed ingestions keep the chunks they stored, and uploading the same file again resumes after them.
+    # When disabled, failed ingestions are rolled back entirely
+    'enabled': True,
+    'max_entries': 1024,
+    'ttl_seconds': 24 * 3600,
+  },
+  'services': {
+    # Builds every component at startup instead of on first use, e.g. when provisioned concurrency absorbs the cost
+    'warm_up_on_startup': os.environ.get('MM_RAG_WARM_UP', '').lower() in ('1', 'true'),
+    # Components initialized concurrently by the warm up
+    'init_workers': 4,
+  },
+  'auth_cache': {
+    'max_entries': 10_000,
+    # Bounds how long a PAT revoked by another process stays valid here
+    'ttl_seconds': 300,
+    # Unknown tokens are remembered for less, so a newly created PAT works quickly
+    'negative_ttl_seconds': 30,
+  },
+  'retrieval_cache': {
+    'enabled': True,
+    # Normalized query texts and their embedding
+    'query_entries': 4096,
+    # Retrieved documents, by namespace, query embedding and top_k
+    'result_entries': 4096,
+    # Uploads and cleanups invalidate the results of this process only, the ttl bounds staleness elsewhere
+    'ttl_seconds': 300,
+  },
+  'chat_cache': {
+    'enabled': True,
+    # Answers of /chat kept for the queries close enough to a previous one of the same user
+    'max_entries': 1024,
+    # Cosine distance under which two queries are considered the same
+    'max_distance': 0.05,
+    # Uploads and cleanups invalidate the answers of this process only, the ttl bounds staleness elsewhere
+    'ttl_seconds': 3600,
+  },
+  'pre_classifier': {
+    'enabled': True,
+    # The closest exemplar must be at least this similar to the query to decide without the VLM
+    'min_similarity': 0.8,
+    # and closer than every exemplar of the other label by this much
+    'min_margin': 0.1,
+  },
+  'embedding_cache': {
+    'enabled': True,
+    'memory_entries': 4096,
+    'memory_bytes': 64 * 1024 * 1024,
+    # One of: None (in-process only), 'sqlite', 'dynamodb'
+    'backend': 'sqlite',
+    'sqlite_path': '/tmp/mm-rag/embedding_cache.sqlite',
+    'sqlite_max_entries': 100_000,
+    'dynamodb_ttl_days': 30,
   }
 }
@@ -1,10 +1,14 @@
-from PIL import Image
-from langchain_core.documents import Document
-from typing import Callable, TypeAlias, Union
+import base64
+import io
+from typing import TYPE_CHECKING, Callable, TypeAlias, Union
 from dataclasses import dataclass, field, asdict
 from datetime import datetime
 from enum import Enum
 
+if TYPE_CHECKING:
+  from PIL import Image
+  from langchain_core.documents import Document
+
 
 
 class Code(Enum):
@@ -59,17 +63,57 @@ class Metadata:
     self.collection = 'audio' if self.file_type in FileType.AUDIO.value else 'other'
 
 
+@dataclass(frozen=True)
+class EncodedImage:
+  """
+  An image encoded once, whose bytes are both sent to the embedder, through `base64`, and stored in the bucket.
+  """
+  data: bytes
+  width: int
+  height: int
+  format: str = 'JPEG'
+
+  @property
+  def base64(self) -> str:
+    # Computed on access rather than cached, so the encoded copy lives only as long as the request needing it
+    return base64.b64encode(self.data).decode('utf-8')
+
+  @property
+  def nbytes(self) -> int:
+    return len(self.data)
+
+  def buffer(self) -> io.BytesIO:
+    return io.BytesIO(self.data)
+
+
 @dataclass
 class File:
   metadata: Metadata
-  content: str | Image.Image | list[Image.Image]
-  docs: list[Document]
+  content: 'str | Image.Image | list[Image.Image] | list[bytes] | EncodedImage'
+  docs: 'list[Document]'
   embeddings: list[list[float]]
 
 
+@dataclass
+class Chunk:
+  """
+  Unit of work of the ingest pipeline: a doc, its embedding once computed,
+  and the optional object to write in the bucket under `payload_key`.
+  Image chunks carry their `image`, which is embedded instead of the doc's content.
+  """
+  doc: 'Document'
+  embedding: list[float] | None = None
+  payload: bytes | None = None
+  payload_key: str | None = None
+  image: EncodedImage | None = None
+  # Set once the payload was written by this ingestion, payloads already in the bucket are left untouched
+  payload_written: bool = False
+
+
 Path: TypeAlias = str
 UserId: TypeAlias = str
 EmbeddingFunc = Callable[[Union[str]], list[float]]
+BatchEmbeddingFunc = Callable[[list[str]], list[list[float]]]
 
 
 class Storages(Enum):
@@ -1,18 +1,22 @@
 from . import setup
 import os
 import asyncio
+from typing import TYPE_CHECKING
 
 from mm_rag.logging_service.log_config import create_logger
 from mm_rag.agents.chatbot_flow import run_chatbot
 
-from langchain_core.documents import Document
+if TYPE_CHECKING:
+  from langchain_core.documents import Document
+  from mm_rag.pipelines.ingest import IngestProgress
+  from mm_rag.pipelines.pipes import FileResult
 
 from mm_rag.exceptions import ObjectDeletionError, MalformedResponseError
 
 logger = create_logger(__name__)
 
 
-async def upload_file(file_input: str, namespace: str) -> None:
+async def upload_file(file_input: str, namespace: str, progress: 'IngestProgress | None' = None) -> None:
   if not os.path.exists(file_input):
 
     logger.error(f"Provided file path: {file_input} does not exist")
@@ -22,12 +26,22 @@ async def upload_file(file_input: str, namespace: str) -> None:
 
   logger.debug(f"Piping file: {file_input} into namespace: {namespace}")
 
-  await setup.piper.pipe(file_input, namespace)
+  await setup.piper.pipe(file_input, namespace, progress)
 
   logger.debug(f"Upload of file {file_input} was a success.")
 
 
-def query_vectorstore(query_input: str, namespace: str) -> list[Document]:
+async def upload_files(file_inputs: list[str], namespace: str, progress: 'IngestProgress | None' = None) -> list['FileResult']:
+  logger.debug(f"Piping {len(file_inputs)} files into namespace: {namespace}")
+
+  results = await setup.piper.pipe_many(file_inputs, namespace, progress)
+
+  failed = [result.file_name for result in results if result.status == 'failed']
+  logger.debug(f"Upload of {len(results)} files done, {len(failed)} failed: {failed}")
+  return results
+
+
+def query_vectorstore(query_input: str, namespace: str) -> list['Document']:
 
   logger.info(f'Instantiating the retriever')
 
@@ -42,6 +56,8 @@ def query_vectorstore(query_input: str, namespace: str) -> list[Document]:
 
 
 async def cleanup(namespace: str) -> None:
+  from mm_rag.pipelines.pipes import invalidate_retrievals
+
   try:
     async with asyncio.TaskGroup() as tg:
       tg.create_task(setup.factory.get_vector_store(namespace).aclean())
@@ -50,3 +66,10 @@ async def cleanup(namespace: str) -> None:
   except* ObjectDeletionError as eg:
     logger.error(f"Caught the following exceptions in the exception group: {eg.exceptions}")
     pass
+
+  finally:
+    # After the deletions, so that results cached while they ran are dropped as well
+    invalidate_retrievals(namespace)
+    # The chunks kept by failed ingestions were deleted as well
+    if setup.piper.checkpoints is not None:
+      setup.piper.checkpoints.invalidate(namespace)
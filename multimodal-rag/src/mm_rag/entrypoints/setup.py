@@ -1,35 +1,170 @@
-from mm_rag.models import vectorstore, s3bucket, dynamodb
-from mm_rag.config.config import config
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Callable
+
+from mm_rag.models import s3bucket, dynamodb
+from mm_rag.config.config import config as app_config
 from mm_rag.logging_service.log_config import create_logger
-from mm_rag.agents.mm_embedder import Embedder
-from mm_rag.pipelines.pipes import Piper, ComponentFactory
-from mm_rag.agents.vlm import VLM
-from huggingface_hub import InferenceClient
 from mm_rag.utils import get_secret
 
+# The modules below import langchain, pinecone, PIL and huggingface_hub, they are imported by the builders
+if TYPE_CHECKING:
+  from mm_rag.agents.mm_embedder import Embedder
+  from mm_rag.pipelines.pipes import Piper, ComponentFactory
+  from mm_rag.agents.vlm import VLM
+  from mm_rag.pipelines.jobs import JobQueue
+  from huggingface_hub import InferenceClient
+
 
 logger = create_logger(__name__)
 
 
-bucket = s3bucket.BucketService(s3bucket.create_bucket(
-  config['aws']['bucketname']
-))
-dynamo = dynamodb.DynamoDB()
-embedder = Embedder()
-
-client = InferenceClient(model="Qwen/Qwen2.5-VL-7B-Instruct", api_key=get_secret()['hf_token'])
-vlm = VLM(model=client)
-
-factory = ComponentFactory(
-    embedder=embedder,
-    api_key=get_secret()['pinecone_api_key'],
-    index_name=config['pinecone']['index_name'],
-    cloud=config['pinecone']['hosting_cloud'],
-    region=config['pinecone']['cloud_region'],
-    dynamodb=dynamo,
-    bucket=bucket
-)
-
-piper = Piper(
-  factory=factory
-)
+class Services:
+  """
+  Container of the application's components.
+  Every component is built on first access, at most once, so importing this module costs no network call.
+  `warm_up` builds the components concurrently, each one as soon as its dependencies are ready.
+  """
+  components = ('secret', 'bucket', 'dynamo', 'embedder', 'client', 'vlm', 'factory', 'piper', 'jobs')
+
+  def __init__(self, config: dict[str, Any] = app_config, workers: int = 4) -> None:
+    self.config = config
+    self.workers = workers
+    # Seconds spent in every init phase, dependencies built on the way included
+    self.timings: dict[str, float] = {}
+
+    self._values: dict[str, Any] = {}
+    self._locks = {name: threading.Lock() for name in self.components}
+
+  def get(self, name: str) -> Any:
+    if name in self._values:
+      return self._values[name]
+
+    if name not in self._locks:
+      raise AttributeError(f"Unknown component {name}, expected one of {self.components}")
+
+    with self._locks[name]:
+      if name not in self._values:
+        build: Callable[[], Any] = getattr(self, f'_build_{name}')
+        self._values[name] = self._timed(name, build)
+      return self._values[name]
+
+  def is_built(self, name: str) -> bool:
+    return name in self._values
+
+  def warm_up(self) -> dict[str, float]:
+    """
+    Builds every component and opens the connections used on the first request.
+    :return: the timing of every init phase
+    """
+    started = time.perf_counter()
+    phases: list[Callable[[], Any]] = [lambda name=name: self.get(name) for name in self.components]
+    phases.append(lambda: self._timed('dynamo_tables', lambda: self.get('dynamo').ensure_tables(self.dynamo_tables())))
+    phases.append(lambda: self._timed('vector_index', self.get('factory').warm_up))
+
+    with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='warm-up') as pool:
+      for future in [pool.submit(phase) for phase in phases]:
+        future.result()
+
+    self.timings['warm_up'] = time.perf_counter() - started
+    logger.info(f"Services warmed up in {self.timings['warm_up']:.2f}s: {self.timings}")
+    return dict(self.timings)
+
+  def dynamo_tables(self) -> list[str]:
+    """
+    :return: the DynamoDB tables used with the configured backends
+    """
+    tables = ['users', 'files']
+
+    cache_config = self.config['embedding_cache']
+    if cache_config.get('enabled', True) and cache_config.get('backend') == 'dynamodb':
+      tables.append('embedding_cache')
+    if self.config['jobs']['backend'] == 'dynamodb':
+      tables.append('jobs')
+
+    return tables
+
+  def _timed(self, name: str, func: Callable[[], Any]) -> Any:
+    started = time.perf_counter()
+    value = func()
+    self.timings[name] = time.perf_counter() - started
+    logger.debug(f"Initialized {name} in {self.timings[name]:.3f}s")
+    return value
+
+  def _build_secret(self) -> dict[str, str]:
+    return get_secret()
+
+  def _build_bucket(self) -> s3bucket.BucketService:
+    return s3bucket.BucketService(s3bucket.create_bucket(
+      self.config['aws']['bucketname']
+    ))
+
+  def _build_dynamo(self) -> dynamodb.DynamoDB:
+    # Tables are checked on first use, or all at once by `warm_up`
+    return dynamodb.DynamoDB()
+
+  def _build_embedder(self) -> 'Embedder':
+    from mm_rag.agents.mm_embedder import Embedder
+    from mm_rag.agents import embedding_cache
+
+    return Embedder(
+      cache=embedding_cache.from_config(self.config['embedding_cache'], self.get('dynamo'))
+    )
+
+  def _build_client(self) -> 'InferenceClient':
+    from huggingface_hub import InferenceClient
+
+    return InferenceClient(model="Qwen/Qwen2.5-VL-7B-Instruct", api_key=self.get('secret')['hf_token'])
+
+  def _build_vlm(self) -> 'VLM':
+    from mm_rag.agents.vlm import VLM
+
+    return VLM(model=self.get('client'))
+
+  def _build_factory(self) -> 'ComponentFactory':
+    from mm_rag.pipelines.pipes import ComponentFactory
+
+    return ComponentFactory(
+      embedder=self.get('embedder'),
+      api_key=self.get('secret')['pinecone_api_key'],
+      index_name=self.config['pinecone']['index_name'],
+      cloud=self.config['pinecone']['hosting_cloud'],
+      region=self.config['pinecone']['cloud_region'],
+      dynamodb=self.get('dynamo'),
+      bucket=self.get('bucket'),
+      pdf_options=self.config['pdf'],
+      vector_store_options=self.config['vector_store'],
+      image_options=self.config['images']
+    )
+
+  def _build_piper(self) -> 'Piper':
+    from mm_rag.pipelines.pipes import Piper
+    from mm_rag.caching import IngestCheckpoints
+
+    checkpoints_config = self.config['ingest_checkpoints']
+    return Piper(
+      factory=self.get('factory'),
+      ingest_options=self.config['ingest'],
+      batch_options=self.config['batch'],
+      checkpoints=IngestCheckpoints(
+        max_entries=checkpoints_config['max_entries'],
+        ttl=checkpoints_config['ttl_seconds']
+      ) if checkpoints_config['enabled'] else None
+    )
+
+  def _build_jobs(self) -> 'JobQueue':
+    from mm_rag.pipelines import jobs
+
+    dynamo = self.get('dynamo') if self.config['jobs']['backend'] == 'dynamodb' else None
+    return jobs.from_config(self.config['jobs'], dynamo)
+
+
+services = Services(workers=app_config['services']['init_workers'])
+
+
+def __getattr__(name: str) -> Any:
+  # Keeps `setup.bucket`, `setup.factory`, ... working, building the component on first access
+  if name in Services.components:
+    return services.get(name)
+  raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -14,6 +14,18 @@ class ImageTooBigError(Exception):
     """
 
 
+class UploadTooLargeError(Exception):
+    """
+    This exception is raised as soon as an upload exceeds config['uploads']['max_mb'].
+    """
+
+
+class JobQueueFullError(Exception):
+    """
+    This exception is raised when an ingestion job is submitted while config['jobs']['max_queued'] jobs are waiting.
+    """
+
+
 class DocGenerationError(Exception):
     """
     This exception is raised everytime that the doc generation fails.
@@ -50,6 +62,20 @@ class ObjectUpsertionError(StorageError):
     super().__init__(self.msg)
 
 
+class PartialUpsertionError(ObjectUpsertionError):
+  """
+  Raised when a bulk upsertion fails after its first `confirmed` objects were stored.
+  """
+  def __init__(
+      self,
+      storage: ds.Storages,
+      confirmed: int,
+      msg: str | None = None
+    ) -> None:
+    self.confirmed = confirmed
+    super().__init__(storage, msg)
+
+
 class MissingItemError(Exception):
   def __init__(self, *args: object) -> None:
     super().__init__(*args)
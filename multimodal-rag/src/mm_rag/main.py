@@ -1,6 +1,5 @@
-from mm_rag.entrypoints import upload_file, query_vectorstore, run_chatbot, cleanup
+from mm_rag.entrypoints import upload_file, query_vectorstore, run_chatbot, cleanup, setup
 from mm_rag.logging_service.log_config import create_logger
-from mm_rag.entrypoints.setup import vlm, bucket, factory
 
 import asyncio
 
@@ -21,9 +20,9 @@ def query(user_id: str) -> None:
   )for doc in retrieved]
 
 def chat(user_id: str) -> None:
-  retriever = factory.get_retriever(user_id)
+  retriever = setup.factory.get_retriever(user_id)
   chat_query = input("You: ")
-  run_chatbot(chat_query, retriever, vlm, bucket)
+  run_chatbot(chat_query, retriever, setup.vlm, setup.bucket)
 
 async def main() -> None:
   user_id: str = input("Enter your userId:")
@@ -1,6 +1,8 @@
 import asyncio
 import datetime
-from typing import Any
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable
 import boto3
 import boto3.dynamodb
 import boto3.dynamodb.conditions
@@ -14,122 +16,198 @@ from mm_rag.logging_service.log_config import create_logger
 logger = create_logger(__name__)
 
 
+@dataclass(frozen=True)
+class TableSpec:
+  """
+  Description of a table owned by the application, used both to create and to validate it.
+  """
+  name: str
+  key_schema: list[dict[str, str]]
+  attribute_definitions: list[dict[str, str]]
+  global_secondary_indexes: list[dict[str, Any]] | None = None
+  provisioned_throughput: dict[str, int] | None = None
+  # Attribute holding the expiration epoch, when items expire through DynamoDB's TTL
+  ttl_attribute: str | None = None
+
+  def create_kwargs(self) -> dict[str, Any]:
+    kwargs: dict[str, Any] = {
+      'TableName': self.name,
+      'KeySchema': self.key_schema,
+      'AttributeDefinitions': self.attribute_definitions,
+    }
+    if self.global_secondary_indexes:
+      kwargs['GlobalSecondaryIndexes'] = self.global_secondary_indexes
+    if self.provisioned_throughput:
+      kwargs['ProvisionedThroughput'] = self.provisioned_throughput
+    else:
+      kwargs['BillingMode'] = 'PAY_PER_REQUEST'
+
+    return kwargs
+
+
+THROUGHPUT = {
+  'ReadCapacityUnits': 5,
+  'WriteCapacityUnits': 5
+}
+
+TABLE_SPECS: dict[str, TableSpec] = {
+  'users': TableSpec(
+    name='users',
+    key_schema=[
+      {'AttributeName': 'userId', 'KeyType': 'HASH'},
+      {'AttributeName': 'PAT', 'KeyType': 'RANGE'}
+    ],
+    attribute_definitions=[
+      {'AttributeName': 'userId', 'AttributeType': 'S'},
+      {'AttributeName': 'PAT', 'AttributeType': 'S'},
+      {'AttributeName': 'PAT-gsi', 'AttributeType': 'S'}
+    ],
+    global_secondary_indexes=[
+      {
+        'IndexName': 'PAT-index',
+        'KeySchema': [
+          {'AttributeName': 'PAT-gsi', 'KeyType': 'HASH'}
+        ],
+        'Projection': {
+          'ProjectionType': 'ALL',
+        },
+        'ProvisionedThroughput': THROUGHPUT
+      }
+    ],
+    provisioned_throughput=THROUGHPUT
+  ),
+  'files': TableSpec(
+    name='files',
+    key_schema=[
+      {'AttributeName': 'userId', 'KeyType': 'HASH'},
+      {'AttributeName': 'fileId', 'KeyType': 'RANGE'}
+    ],
+    attribute_definitions=[
+      {'AttributeName': 'userId', 'AttributeType': 'S'},
+      {'AttributeName': 'fileId', 'AttributeType': 'S'}
+    ],
+    provisioned_throughput=THROUGHPUT
+  ),
+  'embedding_cache': TableSpec(
+    name='embedding_cache',
+    key_schema=[
+      {'AttributeName': 'cacheKey', 'KeyType': 'HASH'}
+    ],
+    attribute_definitions=[
+      {'AttributeName': 'cacheKey', 'AttributeType': 'S'}
+    ],
+    # Cached embeddings expire through DynamoDB's TTL instead of explicit eviction
+    ttl_attribute='expiresAt'
+  ),
+  'jobs': TableSpec(
+    name='jobs',
+    key_schema=[
+      {'AttributeName': 'jobId', 'KeyType': 'HASH'}
+    ],
+    attribute_definitions=[
+      {'AttributeName': 'jobId', 'AttributeType': 'S'}
+    ],
+    ttl_attribute='expiresAt'
+  ),
+}
+
+# Tables already described or created by this process
+_ensured_tables: set[str] = set()
+_ensured_lock = threading.Lock()
+
+# Called with the PAT hash whenever a user's PAT is written or deleted, e.g. to invalidate caches
+_pat_listeners: list[Callable[[str], None]] = []
+
+
+def on_pat_change(listener: Callable[[str], None]) -> None:
+  _pat_listeners.append(listener)
+
+
+def _notify_pat_change(pat: str) -> None:
+  for listener in _pat_listeners:
+    listener(pat)
+
+
 class DynamoDB:
   def __init__(
       self,
   ) -> None:
     self.ddb = boto3.resource("dynamodb", region_name='eu-central-1')
+    self._tables: dict[str, Any] = {}
 
   def _validate_table(self, table_name: str):
-    if not hasattr(self, table_name):
+    if table_name not in TABLE_SPECS:
       raise ValueError(
         f"The table {table_name} does not exist and cannot be created"
       )
 
-    return getattr(self, table_name)
+    return self.table(table_name)
 
-  @property
-  def users(self):
-    try:
-      # Try to create the table if it does not exist
-      table = self.ddb.create_table(  # type: ignore
-        TableName = 'users',
-        KeySchema = [
-          {
-            'AttributeName': 'userId',
-            'KeyType': 'HASH'
-          },
-          {
-            'AttributeName': 'PAT',
-            'KeyType': 'RANGE'
-          }
-        ],
-        AttributeDefinitions = [
-          {
-            'AttributeName': 'userId',
-            'AttributeType': 'S'
-          },
-          {
-            'AttributeName': 'PAT',
-            'AttributeType': 'S'
-          },
-          {
-            "AttributeName": "PAT-gsi",
-            "AttributeType": "S"
-          }
-        ],
-        GlobalSecondaryIndexes=[
-          {
-            "IndexName": "PAT-index",
-            "KeySchema": [
-              {
-                "AttributeName": "PAT-gsi",
-                "KeyType": "HASH"
-              }
-            ],
-            "Projection": {
-              "ProjectionType": "ALL",
-            },
-            "ProvisionedThroughput": {
-              'ReadCapacityUnits': 5,
-              'WriteCapacityUnits': 5
-            }
-          }
-        ],
-        ProvisionedThroughput={
-          'ReadCapacityUnits': 5,
-          'WriteCapacityUnits': 5
-      }
-      )
+  def table(self, table_name: str):
+    """
+    :return: the cached handle of the table, checked or created at most once per process
+    """
+    table = self._tables.get(table_name)
+    if table is not None:
+      return table
 
-      table.wait_until_exists()
-    except ClientError as e:
-        if e.response['Error']['Code'] == 'ResourceInUseException':
-            # Already exists
-            table = self.ddb.Table('users')  # type: ignore
-        else:
-            raise
+    with _ensured_lock:
+      if table_name not in _ensured_tables:
+        self._ensure_table(TABLE_SPECS[table_name])
+        _ensured_tables.add(table_name)
+
+    table = self._tables.setdefault(table_name, self.ddb.Table(table_name))  # type: ignore
     return table
 
-  @property
-  def files(self):
+  def ensure_tables(self, table_names: list[str]) -> None:
+    """
+    Bootstraps the given tables, so that requests never pay for it.
+    :param table_names: only the ones in use, tables of backends that are not configured are never created
+    """
+    for table_name in table_names:
+      self.table(table_name)
+
+  def _ensure_table(self, spec: TableSpec) -> None:
+    table = self.ddb.Table(spec.name)  # type: ignore
+
     try:
-      # Try to create the table if it does not exists
-      table = self.ddb.create_table(  # type: ignore
-        TableName = 'files',
-        KeySchema = [
-          {
-            'AttributeName': 'userId',
-            'KeyType': 'HASH'
-          },
-          {
-            'AttributeName': 'fileId',
-            'KeyType': 'RANGE'
-          }
-        ],
-        AttributeDefinitions = [
-          {
-            'AttributeName': 'userId',
-            'AttributeType': 'S'
-          },
-          {
-            'AttributeName': 'fileId',
-            'AttributeType': 'S'
+      table.load()
+    except ClientError as e:
+      if e.response['Error']['Code'] != 'ResourceNotFoundException':
+        raise
+
+      logger.info(f"Creating DynamoDB table {spec.name}")
+      created = self.ddb.create_table(**spec.create_kwargs())  # type: ignore
+      created.wait_until_exists()
+
+      if spec.ttl_attribute:
+        self.ddb.meta.client.update_time_to_live(  # type: ignore
+          TableName=spec.name,
+          TimeToLiveSpecification={
+            'Enabled': True,
+            'AttributeName': spec.ttl_attribute
           }
-        ],
-        ProvisionedThroughput={
-          'ReadCapacityUnits': 5,
-          'WriteCapacityUnits': 5
-      }
+        )
+      return
+
+    expected = {(key['AttributeName'], key['KeyType']) for key in spec.key_schema}
+    found = {(key['AttributeName'], key['KeyType']) for key in table.key_schema}
+    if expected != found:
+      raise ValueError(
+        f"The table {spec.name} has key schema {sorted(found)}, expected {sorted(expected)}"
       )
 
-      table.wait_until_exists()
-      return table  # type: ignore
+  @property
+  def users(self):
+    return self.table('users')
 
-    # If the table already exists it raises an error
-    except ClientError as e:
-      # We can catch it and return the existing table for operations
-      return self.ddb.Table("files")  # type: ignore
+  @property
+  def files(self):
+    return self.table('files')
+
+  @property
+  def embedding_cache(self):
+    return self.table('embedding_cache')
 
   def add_user(
       self,
@@ -150,6 +228,8 @@ class DynamoDB:
       )
     except ClientError as e:
       raise e
+
+    _notify_pat_change(PAT)
     return True
 
   def store_file(
@@ -175,6 +255,22 @@ class DynamoDB:
       return False
     return True
 
+  def put_item(
+      self,
+      table_name: str,
+      item: dict[str, Any]
+  ) -> bool:
+
+    table = self._validate_table(table_name)
+
+    try:
+      table.put_item(
+        Item=item
+      )
+    except ClientError as e:
+      raise e
+    return True
+
   def get_from_table(
       self,
       table_name: str,
@@ -286,6 +382,9 @@ class DynamoDB:
       )
     except ClientError as e:
       raise
+
+    if table_name == 'users' and 'PAT' in item_key:
+      _notify_pat_change(item_key['PAT'])
     return True
 
   def clean(self):
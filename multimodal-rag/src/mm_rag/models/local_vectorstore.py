@@ -0,0 +1,490 @@
+import asyncio
+import json
+import os
+import threading
+from typing import Any
+from urllib.parse import quote
+
+import numpy as np
+from pinecone import Vector
+
+try:
+  import hnswlib
+except ImportError:  # Optional, brute force search is used for every collection size
+  hnswlib = None
+
+from mm_rag.logging_service.log_config import create_logger
+from mm_rag.agents.mm_embedder import Embedder
+from mm_rag.exceptions import ObjectUpsertionError
+import mm_rag.datastructures as ds
+
+
+logger = create_logger(__name__)
+
+DEFAULT_DIMENSION = 1024
+# Below this many vectors brute force search is faster than maintaining an HNSW graph
+DEFAULT_ANN_THRESHOLD = 50_000
+# Log entries written before the first snapshot of a namespace
+MIN_LOG_ENTRIES = 1024
+
+
+class _Namespace:
+  """
+  Vectors of one namespace, kept L2-normalized in a float32 matrix so that cosine similarity
+  is a single matrix-vector product.
+  When a `base_path` is given the matrix is a memory-mapped file. Ids and metadata are appended to a
+  log on every write, and only rewritten as a json snapshot by `flush`, once the log outgrows the namespace.
+  """
+  def __init__(self, dim: int, base_path: str | None = None) -> None:
+    self.dim = dim
+    self.base_path = base_path
+    self.ids: list[str] = []
+    self.metadata: list[dict[str, Any]] = []
+    self.rows: dict[str, int] = {}
+    self.matrix: np.ndarray = np.empty((0, dim), dtype=np.float32)
+    # Snapshot the log entries are applied to, and how many of them there are
+    self.generation = 0
+    self.log_entries = 0
+
+    # HNSW index, built on the first large enough query and then kept up to date.
+    # Its labels are stable, while rows move on deletes
+    self.ann: Any = None
+    self.labels: dict[str, int] = {}
+    self.label_ids: dict[int, str] = {}
+    self.next_label = 0
+
+    if base_path is not None:
+      self._load()
+
+  def __len__(self) -> int:
+    return len(self.ids)
+
+  def upsert(self, vectors: list[Vector]) -> int:
+    new_ids = {vector.id for vector in vectors if vector.id not in self.rows}
+    self._reserve(len(self.ids) + len(new_ids))
+
+    changes: dict[str, dict[str, Any]] = {}
+    for vector in vectors:
+      values = np.asarray(vector.values, dtype=np.float32)
+      if values.shape != (self.dim,):
+        raise ObjectUpsertionError(
+          storage=ds.Storages.VECTORSTORE,
+          msg=f"Expected {self.dim} dimensions for {vector.id}, but got {values.shape}"
+        )
+
+      row = self._set(vector.id, dict(vector.metadata or {}))
+      self.matrix[row] = _normalize(values)
+      changes[vector.id] = {'op': 'upsert', 'id': vector.id, 'metadata': self.metadata[row]}
+
+    if self.ann is not None and changes:
+      labels = [self._label(_id) for _id in changes]
+      if self.next_label > self.ann.get_max_elements():
+        self.ann.resize_index(max(self.next_label, 2 * self.ann.get_max_elements()))
+      # Existing labels are updated in place
+      self.ann.add_items(self.matrix[[self.rows[_id] for _id in changes]], labels)
+
+    self._log(list(changes.values()))
+    return len(vectors)
+
+  def query(self, vector: list[float], top_k: int, ann_threshold: int | None) -> list[tuple[int, float]]:
+    """
+    :return: (row, cosine similarity) of the top_k closest vectors, best first
+    """
+    count = len(self.ids)
+    if count == 0 or top_k <= 0:
+      return []
+
+    top_k = min(top_k, count)
+    query = _normalize(np.asarray(vector, dtype=np.float32))
+
+    if hnswlib is not None and ann_threshold is not None and count >= ann_threshold:
+      labels, distances = self._ann_index().knn_query(query, k=top_k)
+      return [
+        (self.rows[self.label_ids[int(label)]], 1.0 - float(distance))
+        for label, distance in zip(labels[0], distances[0])
+      ]
+
+    scores = self.matrix[:count] @ query
+    if top_k < count:
+      candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+    else:
+      candidates = np.arange(count)
+    best = candidates[np.argsort(-scores[candidates], kind='stable')]
+
+    return [(int(row), float(scores[row])) for row in best]
+
+  def delete(self, ids: list[str]) -> None:
+    changes = []
+    for _id in ids:
+      if not self._remove(_id, move_vector=True):
+        continue
+      changes.append({'op': 'delete', 'id': _id})
+
+      label = self.labels.pop(_id, None)
+      if self.ann is not None and label is not None:
+        self.ann.mark_deleted(label)
+        del self.label_ids[label]
+
+    # Deleted elements still slow down the graph, rebuild it once they outnumber the live ones
+    if self.ann is not None and self.next_label - len(self.labels) > len(self.ids):
+      self.ann = None
+
+    self._log(changes)
+
+  def clear(self) -> None:
+    self.ids, self.metadata, self.rows = [], [], {}
+    self.ann = None
+    self.flush()
+
+  def flush(self) -> None:
+    """
+    Writes the snapshot of ids and metadata, and starts a new log on top of it.
+    """
+    if self.base_path is None:
+      return
+
+    if isinstance(self.matrix, np.memmap):
+      self.matrix.flush()
+
+    previous_log = self._log_path()
+    self.generation += 1
+    tmp_path = self.base_path + '.json.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+      json.dump({'dim': self.dim, 'generation': self.generation, 'ids': self.ids, 'metadata': self.metadata}, f)
+    os.replace(tmp_path, self.base_path + '.json')
+
+    self.log_entries = 0
+    if os.path.exists(previous_log):
+      os.remove(previous_log)
+
+  def _set(self, _id: str, metadata: dict[str, Any]) -> int:
+    row = self.rows.get(_id)
+    if row is None:
+      row = len(self.ids)
+      self.rows[_id] = row
+      self.ids.append(_id)
+      self.metadata.append({})
+
+    self.metadata[row] = metadata
+    return row
+
+  def _remove(self, _id: str, move_vector: bool) -> bool:
+    row = self.rows.pop(_id, None)
+    if row is None:
+      return False
+
+    # Move the last vector in the freed row, so that live rows stay contiguous
+    last = len(self.ids) - 1
+    if row != last:
+      moved_id = self.ids[last]
+      if move_vector:
+        self.matrix[row] = self.matrix[last]
+      self.ids[row] = moved_id
+      self.metadata[row] = self.metadata[last]
+      self.rows[moved_id] = row
+
+    self.ids.pop()
+    self.metadata.pop()
+    return True
+
+  def _log(self, changes: list[dict[str, Any]]) -> None:
+    if self.base_path is None or not changes:
+      return
+
+    with open(self._log_path(), 'a', encoding='utf-8') as f:
+      f.write(''.join(json.dumps(change) + '\n' for change in changes))
+
+    # Snapshotting once the log is as long as the namespace keeps every write amortized O(1)
+    self.log_entries += len(changes)
+    if self.log_entries > max(MIN_LOG_ENTRIES, len(self.ids)):
+      self.flush()
+
+  def _log_path(self) -> str:
+    return f'{self.base_path}.{self.generation}.log'
+
+  def _reserve(self, size: int) -> None:
+    capacity = len(self.matrix)
+    if size <= capacity:
+      return
+
+    new_capacity = max(size, 2 * capacity, 16)
+    count = len(self.ids)
+
+    if self.base_path is None:
+      matrix = np.empty((new_capacity, self.dim), dtype=np.float32)
+      matrix[:count] = self.matrix[:count]
+      self.matrix = matrix
+      return
+
+    tmp_path = self.base_path + '.f32.tmp'
+    matrix = np.memmap(tmp_path, dtype=np.float32, mode='w+', shape=(new_capacity, self.dim))
+    matrix[:count] = self.matrix[:count]
+    matrix.flush()
+    del matrix
+    os.replace(tmp_path, self.base_path + '.f32')
+
+    self.matrix = np.memmap(self.base_path + '.f32', dtype=np.float32, mode='r+', shape=(new_capacity, self.dim))
+
+  def _load(self) -> None:
+    base_path: str = self.base_path  # type: ignore[assignment]
+
+    if os.path.exists(base_path + '.json'):
+      with open(base_path + '.json', 'r', encoding='utf-8') as f:
+        state = json.load(f)
+
+      if state['dim'] != self.dim:
+        raise ValueError(
+          f"{base_path} holds vectors of {state['dim']} dimensions, expected {self.dim}"
+        )
+
+      self.ids = state['ids']
+      self.metadata = state['metadata']
+      self.rows = {_id: row for row, _id in enumerate(self.ids)}
+      self.generation = state.get('generation', 0)
+
+    # The vectors are already in place in the matrix, only ids and metadata are replayed
+    if os.path.exists(self._log_path()):
+      with open(self._log_path(), 'r', encoding='utf-8') as f:
+        for line in f:
+          try:
+            change = json.loads(line)
+          except json.JSONDecodeError:
+            logger.warning(f"Ignoring the truncated end of {self._log_path()}")
+            break
+
+          if change['op'] == 'upsert':
+            self._set(change['id'], change['metadata'])
+          else:
+            self._remove(change['id'], move_vector=False)
+          self.log_entries += 1
+
+    if os.path.exists(base_path + '.f32'):
+      capacity = os.path.getsize(base_path + '.f32') // (self.dim * np.dtype(np.float32).itemsize)
+      self.matrix = np.memmap(base_path + '.f32', dtype=np.float32, mode='r+', shape=(capacity, self.dim))
+
+  def _label(self, _id: str) -> int:
+    label = self.labels.get(_id)
+    if label is None:
+      label = self.next_label
+      self.next_label += 1
+      self.labels[_id] = label
+      self.label_ids[label] = _id
+    return label
+
+  def _ann_index(self) -> Any:
+    if self.ann is None:
+      count = len(self.ids)
+      logger.debug(f"Building HNSW index over {count} vectors")
+      ann = hnswlib.Index(space='cosine', dim=self.dim)  # type: ignore[union-attr]
+      ann.init_index(max_elements=max(count, 16), ef_construction=200, M=16)
+      self.labels = {_id: row for row, _id in enumerate(self.ids)}
+      self.label_ids = dict(enumerate(self.ids))
+      self.next_label = count
+      ann.add_items(self.matrix[:count], np.arange(count))
+      ann.set_ef(64)
+      self.ann = ann
+
+    return self.ann
+
+
+class LocalIndex:
+  """
+  In-process replacement of a Pinecone index handle: same `upsert`, `query` and `delete` calls,
+  same `{'matches': [...]}` responses.
+  """
+  def __init__(
+      self,
+      dim: int = DEFAULT_DIMENSION,
+      path: str | None = None,
+      ann_threshold: int | None = DEFAULT_ANN_THRESHOLD
+  ) -> None:
+    self.dim = dim
+    self.path = path
+    self.ann_threshold = ann_threshold
+    self._namespaces: dict[str, _Namespace] = {}
+    self._lock = threading.RLock()
+
+    if path is not None:
+      os.makedirs(path, exist_ok=True)
+
+  def namespace(self, name: str) -> _Namespace:
+    with self._lock:
+      if name not in self._namespaces:
+        base_path = os.path.join(self.path, quote(name, safe='')) if self.path is not None else None
+        self._namespaces[name] = _Namespace(self.dim, base_path)
+      return self._namespaces[name]
+
+  def upsert(self, vectors: list[Vector], namespace: str = '') -> dict[str, int]:
+    with self._lock:
+      return {'upserted_count': self.namespace(namespace).upsert(vectors)}
+
+  def query(
+      self,
+      vector: list[float],
+      top_k: int,
+      namespace: str = '',
+      include_metadata: bool = False
+  ) -> dict[str, list[dict[str, Any]]]:
+    with self._lock:
+      ns = self.namespace(namespace)
+      matches = [
+        {
+          'id': ns.ids[row],
+          'score': score,
+          **({'metadata': dict(ns.metadata[row])} if include_metadata else {})
+        }
+        for row, score in ns.query(vector, top_k, self.ann_threshold)
+      ]
+
+    return {'matches': matches, 'namespace': namespace}
+
+  def delete(self, ids: list[str] | None = None, delete_all: bool = False, namespace: str = '') -> None:
+    with self._lock:
+      ns = self.namespace(namespace)
+      if delete_all:
+        ns.clear()
+      elif ids:
+        ns.delete(ids)
+
+  def flush(self) -> None:
+    """
+    Snapshots every namespace, so that the next start does not replay their logs.
+    """
+    with self._lock:
+      for ns in self._namespaces.values():
+        ns.flush()
+
+
+_indexes: dict[tuple[str | None, int], LocalIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(
+    path: str | None = None,
+    dim: int = DEFAULT_DIMENSION,
+    ann_threshold: int | None = DEFAULT_ANN_THRESHOLD
+) -> LocalIndex:
+  """
+  One LocalIndex per path and dimension, shared by every LocalVectorStore of the process.
+  """
+  with _indexes_lock:
+    key = (path, dim)
+    if key not in _indexes:
+      _indexes[key] = LocalIndex(dim, path, ann_threshold)
+    return _indexes[key]
+
+
+class LocalVectorStore:
+  """
+  Drop-in replacement of PineconeVectorStore, backed by a LocalIndex.
+  """
+  def __init__(
+      self,
+      embedder: Embedder,
+      namespace: str,
+      path: str | None = None,
+      dim: int = DEFAULT_DIMENSION,
+      ann_threshold: int | None = DEFAULT_ANN_THRESHOLD
+  ) -> None:
+    self.embedder = embedder
+    self.namespace = namespace
+    self.path = path
+    self.dim = dim
+    self.ann_threshold = ann_threshold
+
+  @property
+  def index(self) -> LocalIndex:
+    return get_index(self.path, self.dim, self.ann_threshold)
+
+  def add(self, file: ds.File, start: int = 0) -> int:
+    """
+    :param start: index of the first doc to upsert, the docs before it are considered already stored
+    :return: the number of vectors upserted
+    """
+    if not len(file.docs) == len(file.embeddings):
+      raise ObjectUpsertionError(
+        storage=ds.Storages.VECTORSTORE,
+        msg=f"Length of docs and embeddings of file {file.metadata.file_id} do not match: "
+          f"{len(file.docs)} != {len(file.embeddings)}"
+      )
+
+    vectors = [
+      _to_vector(doc.id, embeddings, doc.metadata)
+      for doc, embeddings in zip(file.docs[start:], file.embeddings[start:])
+    ]
+
+    return self.upsert(vectors, namespace=self._generate_full_namespace(file.metadata.collection))
+
+  def add_chunks(self, chunks: list[ds.Chunk], collection: str) -> int:
+    vectors: list[Vector] = []
+    for chunk in chunks:
+      if chunk.embedding is None:
+        raise ObjectUpsertionError(
+          storage=ds.Storages.VECTORSTORE,
+          msg=f"Chunk {chunk.doc.id} was not embedded"
+        )
+      vectors.append(_to_vector(chunk.doc.id, chunk.embedding, chunk.doc.metadata))
+
+    return self.upsert(vectors, namespace=self._generate_full_namespace(collection))
+
+  def upsert(self, vectors: list[Vector], namespace: str) -> int:
+    if not vectors:
+      return 0
+
+    return self.index.upsert(vectors, namespace=namespace)['upserted_count']
+
+  def add_image(
+      self,
+      encoded_img: str,
+      metadata: ds.Metadata,
+      file_id: str,
+    ) -> bool:
+    values: list[float] = self.embedder.embed_img(encoded_img)
+    if not len(values) == self.dim:
+      raise ValueError(
+        f"Expected {self.dim} dimensions for input, but got {len(values)}"
+      )
+
+    # Same layout as PineconeVectorStore, the image itself is retrieved from the bucket
+    metadata.__dict__['text'] = file_id
+    self.index.upsert([_to_vector(file_id, values, metadata.__dict__)], namespace=self.namespace)
+
+    return True
+
+  def query(self, vector: list[float], top_k: int, include_metadata: bool = True) -> dict[str, Any]:
+    return self.index.query(
+      vector=vector,
+      top_k=top_k,
+      namespace=self.namespace,
+      include_metadata=include_metadata
+    )
+
+  def clean(self) -> None:
+    self.index.delete(delete_all=True, namespace=self.namespace)
+
+  async def aclean(self):
+    await asyncio.to_thread(self.clean)
+
+  def remove_object(self, id: str) -> None:
+    self.index.delete([id], namespace=self.namespace)
+
+  def remove_objects(self, ids: list[str], collection: str) -> None:
+    self.index.delete(ids, namespace=self._generate_full_namespace(collection))
+
+  def _generate_full_namespace(self, collection: str) -> str:
+    return self.namespace + f"/{collection}"
+
+
+def _to_vector(_id: str | None, values: list[float], metadata: dict[str, Any]) -> Vector:
+  if not _id:
+    raise ObjectUpsertionError(
+      storage=ds.Storages.VECTORSTORE,
+      msg=f"Invalid document generated, missing id for metadata: {metadata}"
+    )
+
+  return Vector(id=_id, values=values, metadata=metadata)
+
+
+def _normalize(values: np.ndarray) -> np.ndarray:
+  norm = np.linalg.norm(values)
+  return values / norm if norm > 0 else values
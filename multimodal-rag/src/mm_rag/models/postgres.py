@@ -1,7 +1,16 @@
 from typing import Any
+import asyncio
+import csv
+import functools
+import io
+import json
 from sqlalchemy import (
   create_engine,
+  delete,
+  select,
+  text,
   Column,
+  Index,
   MetaData,
   Table,
   Integer,
@@ -9,14 +18,30 @@ from sqlalchemy import (
   Text,
   Identity,
   ForeignKey,
+  UniqueConstraint,
 )
 from sqlalchemy.dialects.postgresql import (
   JSONB,
 )
+from sqlalchemy.exc import SQLAlchemyError
 from pgvector.sqlalchemy import Vector
 from sqlalchemy.orm import sessionmaker
+import psycopg2
 
 from mm_rag.config.config import config
+from mm_rag.agents.mm_embedder import Embedder
+from mm_rag.exceptions import ObjectDeletionError, ObjectUpsertionError
+from mm_rag.logging_service.log_config import create_logger
+import mm_rag.datastructures as ds
+
+import pinecone
+
+
+logger = create_logger(__name__)
+
+VECTOR_INDEX_TYPES = ('hnsw', 'ivfflat')
+# Upper bound of hnsw.ef_search
+MAX_EF_SEARCH = 1000
 
 
 class PSQLDB:
@@ -27,11 +52,27 @@ class PSQLDB:
     db_password: str,
     user: str = 'postgres',
     port: int = 5432,
+    pool_size: int = 5,
+    max_overflow: int = 10,
+    dim: int = 1024,
+    vector_index: str = 'hnsw',
   ) -> None:
+    if vector_index not in VECTOR_INDEX_TYPES:
+      raise ValueError(f"vector_index must be one of {VECTOR_INDEX_TYPES}, got {vector_index}")
+
     self.engine = create_engine(
       f"postgresql://{user}:{db_password}@"
-        f"{endpoint_url}:{port}/{db_name}"
+        f"{endpoint_url}:{port}/{db_name}",
+      # Connections are reused across requests, and checked before being handed out
+      pool_size=pool_size,
+      max_overflow=max_overflow,
+      pool_pre_ping=True,
+      pool_recycle=1800,
     )
+    self.dim = dim
+    self.vector_index = vector_index
+    # Whether filtered ANN scans can go on until enough rows pass the filter, pgvector >= 0.8
+    self.iterative_scan = False
     self.session = sessionmaker(
       bind=self.engine
     )()
@@ -93,19 +134,49 @@ class PSQLDB:
           "id", Integer, Identity(always=True),
           primary_key=True
         ),
+        Column(
+          "doc_id", Text, nullable=False
+        ),
+        Column(
+          "namespace", String(512), nullable=False
+        ),
+        Column(
+          "owner", String(256), nullable=False, index=True
+        ),
         Column(
           "text_content", Text, nullable=False
         ),
         Column(
-          "embeddings", Vector(1024), nullable=True
+          "doc_metadata", JSONB, nullable=False
+        ),
+        Column(
+          "embeddings", Vector(self.dim), nullable=True
         ),
         Column(
           "from_file", Integer,
           ForeignKey("files.id")
-        )
+        ),
+        UniqueConstraint("namespace", "doc_id", name="embeddings_namespace_doc_id"),
+      )
+      Index(
+        f"embeddings_{self.vector_index}",
+        self._embeddings.c.embeddings,
+        postgresql_using=self.vector_index,
+        postgresql_ops={"embeddings": "vector_cosine_ops"},
+        postgresql_with={"m": 16, "ef_construction": 64} if self.vector_index == 'hnsw' else {"lists": 100},
       )
     return self._embeddings
 
+  def ensure_vector_schema(self) -> None:
+    """
+    Creates the pgvector extension, the embeddings table and its ANN index, if missing.
+    """
+    with self.engine.begin() as conn:
+      conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+      version = conn.execute(text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")).scalar()
+    self.iterative_scan = _version(version) >= (0, 8)
+    self.metadata_obj.create_all(bind=self.engine, tables=[self.users, self.files, self.embeddings])
+
   def create_all(self) -> bool:
     try:
       self.metadata_obj.create_all(
@@ -159,16 +230,256 @@ class PSQLDB:
 
     table: Table = getattr(self, f"{table_name}")
 
+    with self.engine.begin() as conn:
+      conn.execute(
+        table.insert().values(
+          file_metadata=file_metadata,
+          content=content,
+          owned_by=owned_by
+        )
+      )
+    return True
+
+  def copy_embeddings(self, rows: list[tuple[str, str, str, str, dict[str, Any], list[float]]]) -> int:
+    """
+    Bulk upserts (doc_id, namespace, owner, text_content, doc_metadata, embeddings) rows:
+    they are streamed with COPY into a staging table, then merged on (namespace, doc_id).
+    :return: the number of rows written
+    """
+    if not rows:
+      return 0
+
+    buffer = io.StringIO()
+    # Quoting every field keeps empty strings apart from NULLs
+    writer = csv.writer(buffer, quoting=csv.QUOTE_ALL)
+    for doc_id, namespace, owner, text_content, doc_metadata, embeddings in rows:
+      writer.writerow([
+        doc_id,
+        namespace,
+        owner,
+        text_content,
+        json.dumps(doc_metadata, default=str),
+        '[' + ','.join(map(repr, map(float, embeddings))) + ']'
+      ])
+    buffer.seek(0)
+
+    columns = "doc_id, namespace, owner, text_content, doc_metadata, embeddings"
+    conn = self.engine.raw_connection()
     try:
-      table.insert().values(
-        file_metadata=file_metadata,
-        content=content,
-        owned_by=owned_by
+      with conn.cursor() as cursor:
+        cursor.execute(
+          "CREATE TEMP TABLE embeddings_staging "
+          f"(doc_id text, namespace text, owner text, text_content text, doc_metadata jsonb, embeddings vector({self.dim})) "
+          "ON COMMIT DROP"
+        )
+        cursor.copy_expert(f"COPY embeddings_staging ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+        cursor.execute(
+          f"INSERT INTO embeddings ({columns}) SELECT {columns} FROM embeddings_staging "
+          "ON CONFLICT (namespace, doc_id) DO UPDATE SET "
+          "owner = EXCLUDED.owner, text_content = EXCLUDED.text_content, "
+          "doc_metadata = EXCLUDED.doc_metadata, embeddings = EXCLUDED.embeddings"
+        )
+      conn.commit()
+    except Exception:
+      conn.rollback()
+      raise
+    finally:
+      conn.close()
+
+    return len(rows)
+
+
+@functools.lru_cache(maxsize=None)
+def connect(
+    endpoint_url: str,
+    db_name: str,
+    db_password: str,
+    user: str = 'postgres',
+    port: int = 5432,
+    pool_size: int = 5,
+    vector_index: str = 'hnsw',
+) -> PSQLDB:
+  """
+  One PSQLDB, hence one connection pool, per database and process. The vector schema is checked once.
+  """
+  db = PSQLDB(
+    endpoint_url, db_name, db_password, user=user, port=port, pool_size=pool_size, vector_index=vector_index
+  )
+  db.ensure_vector_schema()
+  return db
+
+
+class PgVectorStore:
+  """
+  VectorStore backed by the pgvector `embeddings` table of a PSQLDB, with the same surface as PineconeVectorStore.
+  Docs are written in the `namespace/collection` namespace and queries are filtered by owner,
+  so that a user searches every collection.
+  """
+  def __init__(
+      self,
+      embedder: Embedder,
+      db: PSQLDB,
+      namespace: str,
+      ef_search: int = 40,
+      probes: int = 10
+  ) -> None:
+    self.embedder = embedder
+    self.db = db
+    self.namespace = namespace
+    self.ef_search = ef_search
+    self.probes = probes
+
+  def add(self, file: ds.File, start: int = 0) -> int:
+    """
+    :param start: index of the first doc to upsert, the docs before it are considered already stored
+    :return: the number of vectors upserted
+    """
+    if not len(file.docs) == len(file.embeddings):
+      raise ObjectUpsertionError(
+        storage=ds.Storages.VECTORSTORE,
+        msg=f"Length of docs and embeddings of file {file.metadata.file_id} do not match: "
+          f"{len(file.docs)} != {len(file.embeddings)}"
       )
-    except Exception as e:
-      raise e 
+
+    namespace = self._generate_full_namespace(file.metadata.collection)
+    rows = [
+      self._row(doc.id, namespace, doc.page_content, doc.metadata, embeddings)
+      for doc, embeddings in zip(file.docs[start:], file.embeddings[start:])
+    ]
+    return self._copy(rows, namespace)
+
+  def add_chunks(self, chunks: list[ds.Chunk], collection: str) -> int:
+    namespace = self._generate_full_namespace(collection)
+    rows = []
+    for chunk in chunks:
+      if chunk.embedding is None:
+        raise ObjectUpsertionError(
+          storage=ds.Storages.VECTORSTORE,
+          msg=f"Chunk {chunk.doc.id} was not embedded"
+        )
+      rows.append(self._row(chunk.doc.id, namespace, chunk.doc.page_content, chunk.doc.metadata, chunk.embedding))
+
+    return self._copy(rows, namespace)
+
+  def upsert(self, vectors: list[pinecone.Vector], namespace: str) -> int:
+    # Vectors carry no document, their text is the one of their metadata
+    rows = [
+      self._row(vector.id, namespace, str((vector.metadata or {}).get('text', '')), vector.metadata, vector.values)
+      for vector in vectors
+    ]
+    return self._copy(rows, namespace)
+
+  def add_image(
+      self,
+      encoded_img: str,
+      metadata: ds.Metadata,
+      file_id: str,
+    ) -> bool:
+    values: list[float] = self.embedder.embed_img(encoded_img)
+    if not len(values) == self.db.dim:
+      raise ValueError(
+        f"Expected {self.db.dim} dimensions for input, but got {len(values)}"
+      )
+
+    metadata.__dict__['text'] = file_id
+    self.upsert([pinecone.Vector(id=file_id, values=values, metadata=metadata.__dict__)], namespace=self.namespace)
     return True
 
+  def query(self, vector: list[float], top_k: int, include_metadata: bool = True) -> dict[str, Any]:
+    table = self.db.embeddings
+    distance = table.c.embeddings.cosine_distance(vector)
+
+    statement = (
+      select(table.c.doc_id, table.c.doc_metadata, (1 - distance).label('score'))
+      .where(table.c.owner == self.namespace)
+      .order_by(distance)
+      .limit(top_k)
+    )
+
+    with self.db.engine.begin() as conn:
+      # Search breadth of the ANN index, only for this transaction.
+      # The owner filter is applied to the rows found by the index, so the scan has to find more than top_k
+      if self.db.vector_index == 'hnsw':
+        ef_search = min(max(int(self.ef_search), 2 * top_k), MAX_EF_SEARCH)
+        conn.execute(text(f"SET LOCAL hnsw.ef_search = {ef_search}"))
+      else:
+        conn.execute(text(f"SET LOCAL ivfflat.probes = {int(self.probes)}"))
+      if self.db.iterative_scan:
+        conn.execute(text(f"SET LOCAL {self.db.vector_index}.iterative_scan = relaxed_order"))
+      rows = conn.execute(statement).all()
+
+    # Iterative scans may return the rows slightly out of order
+    rows = sorted(rows, key=lambda row: row.score, reverse=True)
+
+    return {
+      'matches': [
+        {
+          'id': row.doc_id,
+          'score': float(row.score),
+          **({'metadata': row.doc_metadata} if include_metadata else {})
+        }
+        for row in rows
+      ],
+      'namespace': self.namespace
+    }
+
+  def clean(self) -> None:
+    self._delete(self.db.embeddings.c.owner == self.namespace)
+
+  async def aclean(self):
+    await asyncio.to_thread(self.clean)
+
+  def remove_object(self, id: str) -> None:
+    table = self.db.embeddings
+    self._delete((table.c.owner == self.namespace) & (table.c.doc_id == id))
+
+  def remove_objects(self, ids: list[str], collection: str) -> None:
+    table = self.db.embeddings
+    self._delete(
+      (table.c.namespace == self._generate_full_namespace(collection)) & (table.c.doc_id.in_(ids))
+    )
+
+  def _row(
+      self,
+      doc_id: str | None,
+      namespace: str,
+      text_content: str,
+      metadata: dict[str, Any] | None,
+      values: list[float]
+  ) -> tuple[str, str, str, str, dict[str, Any], list[float]]:
+    if not doc_id:
+      raise ObjectUpsertionError(
+        storage=ds.Storages.VECTORSTORE,
+        msg=f"Invalid document generated, missing id for vector with metadata: {metadata}"
+      )
+
+    return (doc_id, namespace, self.namespace, text_content, dict(metadata or {}), values)
+
+  def _copy(self, rows: list[tuple[str, str, str, str, dict[str, Any], list[float]]], namespace: str) -> int:
+    try:
+      return self.db.copy_embeddings(rows)
+    # The rows are copied through the raw driver connection, whose errors are not wrapped by SQLAlchemy
+    except (SQLAlchemyError, psycopg2.Error) as e:
+      logger.error(f"Unable to copy {len(rows)} embeddings in {namespace}: {e}")
+      raise ObjectUpsertionError(ds.Storages.VECTORSTORE) from e
+
+  def _delete(self, condition: Any) -> None:
+    try:
+      with self.db.engine.begin() as conn:
+        conn.execute(delete(self.db.embeddings).where(condition))
+    except SQLAlchemyError as e:
+      logger.error(f"Unable to delete embeddings of {self.namespace}: {e}")
+      raise ObjectDeletionError(ds.Storages.VECTORSTORE) from e
+
+  def _generate_full_namespace(self, collection: str) -> str:
+    return self.namespace + f"/{collection}"
+
+
+def _version(version: str | None) -> tuple[int, ...]:
+  if not version:
+    return (0,)
+  return tuple(int(part) for part in version.split('.')[:2] if part.isdigit())
+
 
 # Usage
 if __name__ == '__main__':
@@ -1,12 +1,18 @@
 import asyncio
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import boto3
 import os
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from botocore.exceptions import ClientError, ParamValidationError
-from typing import Any, NewType
+from typing import Any, Callable, NewType
 import io
 
 from mm_rag.config.config import config
+from mm_rag.caching import LRUCache
 from mm_rag.datastructures import Storages
 from mm_rag.logging_service.log_config import create_logger
 from mm_rag.exceptions import MissingRegionError, BucketAccessError, ObjectUpsertionError, ObjectDeletionError
@@ -14,9 +20,91 @@ from mm_rag.exceptions import MissingRegionError, BucketAccessError, ObjectUpser
 
 logger = create_logger(__name__)
 
+_s3_lock = threading.Lock()
+_s3_client: Any = None
+_s3_resource: Any = None
+
+
+def s3_config(options: dict[str, Any] | None = None) -> Config:
+  """
+  :param options: see config['aws']['s3']
+  """
+  options = options if options is not None else config['aws']['s3']
+
+  return Config(
+    max_pool_connections=options.get('max_pool_connections', 10),
+    retries={
+      'max_attempts': options.get('max_attempts', 3),
+      'mode': options.get('retry_mode', 'standard')
+    },
+    connect_timeout=options.get('connect_timeout', 60),
+    read_timeout=options.get('read_timeout', 60)
+  )
+
+
+def get_s3_client() -> Any:
+  """
+  Process-wide S3 client.
+  boto3 clients are thread-safe, so every thread and every BucketService share its credentials and connection pool.
+  """
+  global _s3_client
+
+  if _s3_client is None:
+    with _s3_lock:
+      if _s3_client is None:
+        _s3_client = boto3.session.Session().client('s3', config=s3_config())
+  return _s3_client
+
+
+def get_s3_resource() -> Any:
+  """
+  Process-wide S3 resource, used for bucket handles and ACLs.
+  Unlike clients, resources are not thread-safe, uploads and downloads go through `get_s3_client`.
+  """
+  global _s3_resource
+
+  if _s3_resource is None:
+    with _s3_lock:
+      if _s3_resource is None:
+        _s3_resource = boto3.session.Session().resource('s3', config=s3_config())
+  return _s3_resource
+
+
+def reset_s3_clients() -> None:
+  """
+  Drops the shared client and resource, the next access builds them again, e.g. after a change of credentials.
+  """
+  global _s3_client, _s3_resource
+
+  with _s3_lock:
+    _s3_client = None
+    _s3_resource = None
+
+
+def transfer_config(options: dict[str, Any] | None = None) -> TransferConfig:
+  """
+  Objects over the multipart threshold are uploaded in parts, with a few parts in flight.
+  :param options: see config['aws']['s3']
+  """
+  options = options if options is not None else config['aws']['s3']
+  mb = 1024 * 1024
+
+  return TransferConfig(
+    multipart_threshold=options.get('multipart_threshold_mb', 8) * mb,
+    multipart_chunksize=options.get('multipart_chunksize_mb', 8) * mb,
+    max_concurrency=options.get('multipart_concurrency', 4)
+  )
+
+
+def content_etag(data: bytes) -> str:
+  """
+  :return: the ETag S3 assigns to `data` when uploaded in a single part
+  """
+  return f'"{hashlib.md5(data).hexdigest()}"'
+
 
 def create_bucket(bucket_name: str, region: str = 'eu-central-1'):
-  client = boto3.client('s3')
+  client = get_s3_client()
   try:
     if region is None:
       raise MissingRegionError(f'In order to create the bucket {bucket_name}, please specify also a region.')
@@ -29,24 +117,44 @@ def create_bucket(bucket_name: str, region: str = 'eu-central-1'):
       )
   except ClientError as e:
     if e.response['Error']['Code'] == 'BucketAlreadyOwnedByYou':
-      return boto3.resource('s3').Bucket(bucket_name)  # type: ignore
+      return get_s3_resource().Bucket(bucket_name)
     if e.response['Error']['Code'] == "BucketAlreadyExists":
-      return boto3.resource('s3').Bucket(bucket_name)  # type: ignore
+      return get_s3_resource().Bucket(bucket_name)
     raise e
   return bucket
 
 
 class BucketService():
-  def __init__(self, bucket) -> None:
+  def __init__(
+      self,
+      bucket,
+      client: Any = None,
+      known_keys_entries: int | None = None,
+      known_keys_ttl: float | None = None,
+      upload_concurrency: int | None = None
+  ) -> None:
+    """
+    :param client: S3 client to use instead of the process-wide one
+    :param known_keys_entries, known_keys_ttl: bound the cache of keys known to exist, see config['aws']['s3']
+    :param upload_concurrency: objects in flight in `upload_objects`
+    """
     self.bucket = bucket
+    self._client = client
+    self.upload_concurrency = upload_concurrency or config['aws']['s3'].get('upload_concurrency', 8)
+    self.transfer_config = transfer_config()
+    # key -> ETag, empty when the object was uploaded by this process and its ETag is unknown
+    self._known_keys: LRUCache[str, str] = LRUCache(
+      max_entries=known_keys_entries or config['aws']['s3'].get('known_keys_entries', 10_000),
+      ttl=known_keys_ttl if known_keys_ttl is not None else config['aws']['s3'].get('known_keys_ttl_seconds')
+    )
 
   @property
   def client(self):
-    return boto3.client('s3')
+    return self._client if self._client is not None else get_s3_client()
 
   @property
   def resource(self):
-    return boto3.resource('s3')
+    return get_s3_resource()
 
   @property
   def name(self) -> str:
@@ -55,13 +163,17 @@ class BucketService():
   def upload_object_from_path(
       self,
       file_path: str,
-      object_name=None
+      object_name=None,
+      check_exists: bool = True
     ) -> bool:
+    """
+    :param check_exists: skips the upload if the object already exists, callers knowing it does not can save the request
+    """
     # Add multiple file upload
     if object_name is None:
       object_name = os.path.basename(file_path)
 
-    if self.object_exists(object_name):
+    if check_exists and self.object_exists(object_name):
       return True
 
     try:
@@ -69,6 +181,7 @@ class BucketService():
         file_path,
         self.name,
         object_name,
+        Config=self.transfer_config
       )
     except (ClientError, ParamValidationError) as e:
       raise ObjectUpsertionError(
@@ -76,22 +189,27 @@ class BucketService():
         msg=f"Error while trying to put object {file_path} in the bucket {self.bucket.name}: {str(e)}"
       ) from e
 
+    self._known_keys.set(object_name, '')
     return True
 
   def upload_object_from_file(
       self,
       file_obj,
-      object_key: str
+      object_key: str,
+      check_exists: bool = True
   ) -> bool:
-
-    if self.object_exists(object_key):
+    """
+    :param check_exists: skips the upload if the object already exists, callers knowing it does not can save the request
+    """
+    if check_exists and self.object_exists(object_key):
       return True
 
     try:
       self.client.upload_fileobj(
         file_obj,
         self.name,
-        object_key
+        object_key,
+        Config=self.transfer_config
       )
     except (ClientError, ParamValidationError) as e:
       raise ObjectUpsertionError(
@@ -99,8 +217,56 @@ class BucketService():
         msg=f"Error while trying to put object {object_key} in the bucket {self.bucket.name}: {str(e)}"
       ) from e
 
+    self._known_keys.set(object_key, '')
     return True
 
+  def upload_objects(
+      self,
+      objects: list[tuple[str, Callable[[], Any]]],
+      rollback_prefix: str | None = None
+  ) -> int:
+    """
+    Uploads many objects, with up to `upload_concurrency` of them in flight over the shared client.
+    Every object is produced by its callable in the upload worker, so that e.g. images are encoded concurrently too.
+    If any object fails, the pending ones are cancelled, the objects uploaded by this call,
+    or everything under `rollback_prefix` when given, are removed and the first error is raised.
+    :param objects: pairs of key and callable returning a file-like object
+    :return: the number of objects uploaded
+    """
+    if not objects:
+      return 0
+
+    uploaded: list[str] = []
+    error: BaseException | None = None
+
+    def _upload(key: str, produce: Callable[[], Any]) -> None:
+      self.upload_object_from_file(produce(), key, check_exists=False)
+      uploaded.append(key)
+
+    with ThreadPoolExecutor(
+        max_workers=min(self.upload_concurrency, len(objects)),
+        thread_name_prefix='s3-upload'
+    ) as pool:
+      futures = [pool.submit(_upload, key, produce) for key, produce in objects]
+
+      for future in as_completed(futures):
+        error = future.exception()
+        if error is not None:
+          for pending in futures:
+            pending.cancel()
+          break
+    # Leaving the pool waits for the uploads in flight, so the rollback sees all of them
+
+    if error is not None:
+      logger.error(f"Upload of {len(objects)} objects failed after {len(uploaded)} succeeded, rolling back: {error}")
+      if rollback_prefix is not None:
+        self.remove_prefix(rollback_prefix)
+      elif uploaded:
+        self.remove_object(uploaded)
+      raise error
+
+    return len(uploaded)
+
   def upload_object(self, key: str, body: str) -> bool:
     try:
       self.client.put_object(
@@ -112,6 +278,7 @@ class BucketService():
         storage=Storages.BUCKET,
       )
 
+    self._known_keys.set(key, '')
     return True
 
   def copy_object(self, to_bucket: str, object_key: str, dest_obj_key: str | None = None) -> bool:
@@ -136,6 +303,9 @@ class BucketService():
     else:
       objects = [{'Key': object_key}]
 
+    for obj in objects:
+      self._known_keys.pop(obj['Key'])
+
     try:
       self.client.delete_objects(
         Bucket=self.bucket.name,
@@ -149,6 +319,27 @@ class BucketService():
       return False
     return True
 
+  def remove_prefix(self, prefix: str) -> int:
+    """
+    Removes every object whose key starts with `prefix`.
+    :return: the number of objects removed
+    """
+    if not prefix:
+      raise ValueError("Refusing to remove objects with an empty prefix, use `delete_all` instead")
+
+    removed = 0
+    paginator = self.client.get_paginator('list_objects_v2')
+    try:
+      # Pages hold up to 1000 keys, the most a single delete_objects request accepts
+      for page in paginator.paginate(Bucket=self.bucket.name, Prefix=prefix):
+        keys = [obj['Key'] for obj in page.get('Contents', [])]
+        if keys and self.remove_object(keys):
+          removed += len(keys)
+    except ClientError as e:
+      raise ObjectDeletionError(Storages.BUCKET) from e
+
+    return removed
+
   def move_object(self, to_bucket: str, object_key: str, dest_obj_key: str | None = None) -> bool:
     copied = self.copy_object(to_bucket, object_key, dest_obj_key)
     if copied:
@@ -186,6 +377,7 @@ class BucketService():
       raise ObjectDeletionError(Storages.BUCKET)
 
     obj_keys: list[dict[str, str]] = [{"Key": obj['Key']} for obj in contents]
+    self._known_keys.clear()
 
     try:
 
@@ -309,18 +501,69 @@ class BucketService():
       raise
     return url
 
-  def object_exists(self, object_key: str) -> bool:
+  def object_exists(self, object_key: str, etag: str | None = None) -> bool:
+    """
+    Checks the key through its metadata, without downloading the object.
+    :param etag: if given, the object only counts as existing when its ETag matches, see `content_etag`
+    """
+    known = self._known_keys.get(object_key)
+    if known is not None and (etag is None or known == etag):
+      return True
+
     try:
-      self.client.get_object(
+      response = self.client.head_object(
         Bucket=self.bucket.name,
         Key=object_key
       )
     except ClientError as e:
-      if e.response['Error']['Code'] == 'NoSuchKey':
+      if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
         return False
+      raise BucketAccessError(
+        f"Unable to check the existence of {object_key} in the bucket {self.bucket.name}: {e}"
+      ) from e
+
+    self._known_keys.set(object_key, response['ETag'])
+    if etag is not None and response['ETag'] != etag:
+      return False
 
     logger.info(f"Not upserting {object_key} as it already exists in the bucket {self.bucket}")
     return True
 
+  def existing_keys(self, object_keys: list[str], etags: dict[str, str] | None = None) -> set[str]:
+    """
+    Batch version of `object_exists`: the keys that are not known to exist
+    are looked up with a listing of their common prefix, e.g. all the pages of a file at once.
+    :param etags: expected ETag of some of the keys, those only count as existing when their object matches
+    """
+    etags = etags or {}
+
+    def _matches(key: str, etag: str | None) -> bool:
+      return etag is not None and (key not in etags or etag == etags[key])
+
+    found = {key for key in object_keys if _matches(key, self._known_keys.get(key))}
+    missing = set(object_keys) - found
+    if not missing:
+      return found
+
+    prefix = os.path.commonprefix(sorted(missing))
+    if not prefix:
+      # Listing the whole bucket costs more than a HEAD per key
+      return found | {key for key in missing if self.object_exists(key, etag=etags.get(key))}
+
+    try:
+      paginator = self.client.get_paginator('list_objects_v2')
+      for page in paginator.paginate(Bucket=self.bucket.name, Prefix=prefix):
+        for obj in page.get('Contents', []):
+          if obj['Key'] in missing:
+            self._known_keys.set(obj['Key'], obj['ETag'])
+            if _matches(obj['Key'], obj['ETag']):
+              found.add(obj['Key'])
+    except ClientError as e:
+      raise BucketAccessError(
+        f"Unable to list the objects under {prefix} in the bucket {self.bucket.name}: {e}"
+      ) from e
+
+    return found
+
 if __name__ == '__main__':
   pass
\ No newline at end of file
@@ -1,25 +1,147 @@
 import asyncio
-from typing import Literal
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Callable, Literal, TypeVar
 
 from mm_rag.logging_service.log_config import create_logger
 from mm_rag.config.config import config
 from mm_rag.agents.mm_embedder import Embedder
-from mm_rag.exceptions import ObjectUpsertionError
+from mm_rag.exceptions import ObjectUpsertionError, PartialUpsertionError
 import mm_rag.datastructures as ds
 
 import pinecone
 from pinecone import Pinecone, Vector
 from pinecone import ServerlessSpec
 
-from langchain_pinecone import PineconeVectorStore as lcPineconeVectorStore
+from langchain_core.documents import Document
+
+if TYPE_CHECKING:
+  from langchain_pinecone import PineconeVectorStore as lcPineconeVectorStore
 
 from botocore.exceptions import ClientError
 
 from mm_rag.exceptions import ObjectDeletionError, FileNotValidError, DocGenerationError
 import pinecone.exceptions
+import urllib3.exceptions
 
 logger = create_logger(__name__)
 
+T = TypeVar("T")
+
+# Pinecone rejects upsert requests over 2MB or 1000 vectors,
+# 100 vectors per request is the documented sweet spot.
+MAX_UPSERT_VECTORS = 100
+MAX_UPSERT_BYTES = 2 * 1024 * 1024 - 64 * 1024
+# Rough size of a float once serialized in the request body
+FLOAT_PAYLOAD_BYTES = 20
+
+
+def estimate_vector_size(vector: Vector) -> int:
+  metadata_size = len(json.dumps(vector.metadata, default=str)) if vector.metadata else 0
+  return len(vector.id) + FLOAT_PAYLOAD_BYTES * len(vector.values) + metadata_size
+
+
+def batch_vectors(
+    vectors: list[Vector],
+    max_vectors: int = MAX_UPSERT_VECTORS,
+    max_bytes: int = MAX_UPSERT_BYTES
+  ) -> list[list[Vector]]:
+  batches: list[list[Vector]] = []
+  batch: list[Vector] = []
+  batch_size = 0
+
+  for vector in vectors:
+    vector_size = estimate_vector_size(vector)
+
+    if batch and (len(batch) >= max_vectors or batch_size + vector_size > max_bytes):
+      batches.append(batch)
+      batch, batch_size = [], 0
+
+    batch.append(vector)
+    batch_size += vector_size
+
+  if batch:
+    batches.append(batch)
+
+  return batches
+
+
+# Errors after which the cached index handle is rebuilt and the call retried once
+RECONNECT_ERRORS = (
+  ConnectionError,
+  urllib3.exceptions.HTTPError,
+  pinecone.exceptions.ServiceException,
+)
+
+
+class PineconeRegistry:
+  """
+  Process-wide cache of Pinecone clients and index handles.
+  Every PineconeVectorStore, whatever its namespace or ComponentFactory, resolves its index here,
+  so that index existence is checked once and the data-plane connection pool is reused.
+  """
+  def __init__(self) -> None:
+    self._clients: dict[str, Pinecone] = {}
+    self._indexes: dict[tuple[str, str], Any] = {}
+    self._ensured: set[tuple[str, str]] = set()
+    self._lock = threading.RLock()
+
+  def client(self, api_key: str) -> Pinecone:
+    with self._lock:
+      if api_key not in self._clients:
+        self._clients[api_key] = Pinecone(api_key=api_key)
+      return self._clients[api_key]
+
+  def ensure_index(self, api_key: str, index_name: str, cloud: str, region: str) -> None:
+    with self._lock:
+      if (api_key, index_name) in self._ensured:
+        return
+
+      pc = self.client(api_key)
+      if not pc.has_index(index_name):
+        logger.info(f"Creating Pinecone index {index_name} in {cloud}/{region}")
+        pc.create_index(
+          name=index_name,
+          dimension=1024,
+          metric='cosine',
+          spec=ServerlessSpec(
+            cloud=cloud,
+            region=region
+          )
+        )
+      self._ensured.add((api_key, index_name))
+
+  def index(self, api_key: str, index_name: str, cloud: str, region: str) -> Any:
+    key = (api_key, index_name)
+    handle = self._indexes.get(key)
+    if handle is not None:
+      return handle
+
+    with self._lock:
+      if key not in self._indexes:
+        self.ensure_index(api_key, index_name, cloud, region)
+        self._indexes[key] = self.client(api_key).Index(index_name)
+      return self._indexes[key]
+
+  def reconnect(self, api_key: str, index_name: str) -> None:
+    """
+    Drops the cached client and index handle, the next access opens fresh connections.
+    The index is known to exist, so its existence is not checked again.
+    """
+    with self._lock:
+      self._indexes.pop((api_key, index_name), None)
+      self._clients.pop(api_key, None)
+
+  def clear(self) -> None:
+    with self._lock:
+      self._clients.clear()
+      self._indexes.clear()
+      self._ensured.clear()
+
+
+registry = PineconeRegistry()
+
 
 class PineconeVectorStore:
   def __init__(
@@ -29,7 +151,10 @@ class PineconeVectorStore:
     index_name: str,
     namespace: str,
     cloud: str,
-    region: str
+    region: str,
+    max_batch_vectors: int = MAX_UPSERT_VECTORS,
+    max_batch_bytes: int = MAX_UPSERT_BYTES,
+    upsert_concurrency: int = 4
 	) -> None:
     self.embedder = embedder
     self.api_key = api_key
@@ -37,30 +162,27 @@ class PineconeVectorStore:
     self.cloud = cloud
     self.region = region
     self.namespace = namespace
+    self.max_batch_vectors = max_batch_vectors
+    self.max_batch_bytes = max_batch_bytes
+    self.upsert_concurrency = upsert_concurrency
 
   @property
   def index(self):
-    try:
-      pc = Pinecone(api_key=self.api_key)
+    return registry.index(self.api_key, self.index_name, self.cloud, self.region)
 
-      if not pc.has_index(self.index_name):
-        pc.create_index(
-          name=self.index_name,
-          dimension=1024,
-          metric='cosine',
-          spec=ServerlessSpec(
-            cloud=self.cloud,
-            region=self.region
-          )
-        )
-      return pc.Index(config['pinecone']['index_name'])
-    except ClientError as e:
-      raise
-    except Exception as e:
-      raise
+  def _call_index(self, func: Callable[[Any], T]) -> T:
+    try:
+      return func(self.index)
+    except RECONNECT_ERRORS as e:
+      logger.warning(f"Connection to index {self.index_name} failed, reconnecting: {e}")
+      registry.reconnect(self.api_key, self.index_name)
+      return func(self.index)
 
   @property
-  def vector_store(self) -> lcPineconeVectorStore:
+  def vector_store(self) -> 'lcPineconeVectorStore':
+    # Only needed by deletions, langchain_pinecone is slow to import
+    from langchain_pinecone import PineconeVectorStore as lcPineconeVectorStore
+
     try:
       return lcPineconeVectorStore(
         index=self.index,
@@ -72,7 +194,11 @@ class PineconeVectorStore:
     except Exception as e:
       raise
 
-  def add(self, file: ds.File) -> None:
+  def add(self, file: ds.File, start: int = 0) -> int:
+    """
+    :param start: index of the first doc to upsert, the docs before it are considered already stored
+    :return: the number of vectors upserted
+    """
     if not len(file.docs) == len(file.embeddings):
       raise ObjectUpsertionError(
         storage=ds.Storages.VECTORSTORE,
@@ -80,28 +206,85 @@ class PineconeVectorStore:
           "{len(file.docs)} != {len(file.embeddings)}"
       )
 
-    try:
-      for doc, embeddings in zip(file.docs, file.embeddings):
-        if not doc.id:
-          raise ObjectUpsertionError(
-            storage=ds.Storages.VECTORSTORE,
-            msg=f"Invalid document generated, missing id for doc: {doc}"
-          )
+    vectors = [
+      self._to_vector(doc, embeddings)
+      for doc, embeddings in zip(file.docs[start:], file.embeddings[start:])
+    ]
 
-        self.index.upsert(
-          [
-            Vector(
-              id=doc.id,
-              values=embeddings,
-              metadata=doc.metadata
-          )],
-          namespace=self._generate_full_namespace(file.metadata.collection)
+    return self.upsert(vectors, namespace=self._generate_full_namespace(file.metadata.collection))
+
+  def add_chunks(self, chunks: list[ds.Chunk], collection: str) -> int:
+    """
+    :return: the number of vectors upserted
+    """
+    vectors: list[Vector] = []
+    for chunk in chunks:
+      if chunk.embedding is None:
+        raise ObjectUpsertionError(
+          storage=ds.Storages.VECTORSTORE,
+          msg=f"Chunk {chunk.doc.id} was not embedded"
         )
-    except pinecone.exceptions.PineconeException as e:
+      vectors.append(self._to_vector(chunk.doc, chunk.embedding))
+
+    return self.upsert(vectors, namespace=self._generate_full_namespace(collection))
+
+  @staticmethod
+  def _to_vector(doc: Document, embeddings: list[float]) -> Vector:
+    if not doc.id:
       raise ObjectUpsertionError(
         storage=ds.Storages.VECTORSTORE,
-        msg=str(e)
-      ) from e
+        msg=f"Invalid document generated, missing id for doc: {doc}"
+      )
+
+    return Vector(
+      id=doc.id,
+      values=embeddings,
+      metadata=doc.metadata
+    )
+
+  def upsert(self, vectors: list[Vector], namespace: str) -> int:
+    """
+    Writes the vectors in size-limited batches, sent concurrently over a single index handle.
+    :return: the number of vectors upserted
+    :raises PartialUpsertionError: if a batch fails, with the number of leading vectors that were stored
+    """
+    batches = batch_vectors(vectors, self.max_batch_vectors, self.max_batch_bytes)
+    if not batches:
+      return 0
+
+    logger.debug(f"Upserting {len(vectors)} vectors in {len(batches)} batches to {namespace}")
+
+    def _upsert(batch: list[Vector]) -> Any:
+      return self._call_index(lambda index: index.upsert(vectors=batch, namespace=namespace))
+
+    upserted = 0
+    confirmed = 0
+    error: Exception | None = None
+
+    with ThreadPoolExecutor(max_workers=min(self.upsert_concurrency, len(batches))) as pool:
+      futures = [pool.submit(_upsert, batch) for batch in batches]
+
+      for batch, future in zip(batches, futures):
+        try:
+          response = future.result()
+        except (pinecone.exceptions.PineconeException, *RECONNECT_ERRORS) as e:
+          logger.error(f"Upsert of a batch of {len(batch)} vectors to {namespace} failed: {e}")
+          error = error or e
+          continue
+
+        upserted += response.upserted_count
+        # Only an uninterrupted prefix of batches can be skipped when resuming
+        if error is None:
+          confirmed += len(batch)
+
+    if error is not None:
+      raise PartialUpsertionError(
+        storage=ds.Storages.VECTORSTORE,
+        confirmed=confirmed,
+        msg=str(error)
+      ) from error
+
+    return upserted
 
   def _generate_full_namespace(self, collection: str) -> str:
     return self.namespace + f"/{collection}"
@@ -126,21 +309,33 @@ class PineconeVectorStore:
       # We therefore store the fileId in order to then retrieve the image from the s3 Bucket.
       metadata.__dict__['text'] = file_id
 
-      self.index.upsert(
-        [
-          Vector(
-          id=file_id,
-          values=values,
-          metadata=metadata.__dict__
-          )
-        ],
-        namespace=self.namespace
+      self._call_index(
+        lambda index: index.upsert(
+          [
+            Vector(
+            id=file_id,
+            values=values,
+            metadata=metadata.__dict__
+            )
+          ],
+          namespace=self.namespace
+        )
       )
     except pinecone.PineconeException as e:
       logger.error(e)
       raise ObjectUpsertionError(ds.Storages.VECTORSTORE) from e
     return True
 
+  def query(self, vector: list[float], top_k: int, include_metadata: bool = True) -> Any:
+    return self._call_index(
+      lambda index: index.query(
+        top_k=top_k,
+        vector=vector,
+        namespace=self.namespace,
+        include_metadata=include_metadata
+      )
+    )
+
   def clean(self) -> None:
     try:
       self.vector_store.delete(delete_all=True)
@@ -153,6 +348,18 @@ class PineconeVectorStore:
   def remove_object(self, id: str) -> None:
     self.vector_store.delete([id], namespace=self.namespace)
 
+  def remove_objects(self, ids: list[str], collection: str) -> None:
+    """
+    Removes vectors written by `add` or `add_chunks`, which live in the collection namespace.
+    """
+    namespace = self._generate_full_namespace(collection)
+    try:
+      for start in range(0, len(ids), self.max_batch_vectors):
+        batch = ids[start:start + self.max_batch_vectors]
+        self._call_index(lambda index: index.delete(ids=batch, namespace=namespace))
+    except (pinecone.exceptions.PineconeException, *RECONNECT_ERRORS) as e:
+      raise ObjectDeletionError(ds.Storages.VECTORSTORE) from e
+
 
 if __name__ == '__main__':
   pass
\ No newline at end of file
@@ -1,13 +1,16 @@
 import os
 import subprocess
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import asdict
 from abc import ABC, abstractmethod
-from typing import Union
+from typing import Iterator, Union
 
 from PIL import Image
 from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter, Language
-from pdf2image import convert_from_path
+from pdf2image import convert_from_path, pdfinfo_from_path
+from pdf2image.exceptions import PDFInfoNotInstalledError, PDFPageCountError, PDFSyntaxError
 
 from mm_rag.exceptions import FileNotValidError, ImageTooBigError
 import mm_rag.datastructures as ds
@@ -19,8 +22,13 @@ logger = create_logger(__name__)
 
 
 class Extractor(ABC):
-  def __init__(self, embedding_func: ds.EmbeddingFunc) -> None:
+  def __init__(
+      self,
+      embedding_func: ds.EmbeddingFunc,
+      batch_embedding_func: ds.BatchEmbeddingFunc | None = None
+  ) -> None:
     self.embedding_func = embedding_func
+    self.batch_embedding_func = batch_embedding_func
 
   def extract(self, path: ds.Path, auth: ds.UserId) -> ds.File:
     path = validate_path(path)
@@ -37,6 +45,50 @@ class Extractor(ABC):
       embeddings=embeddings
     )
 
+  def stream(self, path: ds.Path, auth: ds.UserId) -> tuple[ds.Metadata, Iterator[ds.Chunk]]:
+    """
+    Lazy counterpart of `extract`: the chunks are produced while they are consumed and are not embedded.
+    """
+    path = validate_path(path)
+    metadata = self._extract_metadata(path, auth)
+
+    return metadata, self._iter_chunks(path, metadata)
+
+  def embed_chunk(self, chunk: ds.Chunk) -> ds.Chunk:
+    chunk.embedding = self.embedding_func(_embedding_input(chunk))
+    return chunk
+
+  def embed_chunks(self, chunks: list[ds.Chunk]) -> list[ds.Chunk]:
+    """
+    Batch counterpart of `embed_chunk`, with one call of the `batch_embedding_func` when given.
+    :return: the same chunks, embedded
+    """
+    if self.batch_embedding_func is None or len(chunks) < 2:
+      return [self.embed_chunk(chunk) for chunk in chunks]
+
+    embeddings = self.batch_embedding_func([_embedding_input(chunk) for chunk in chunks])
+    for chunk, embedding in zip(chunks, embeddings):
+      chunk.embedding = embedding
+    return chunks
+
+  def _iter_chunks(self, path: ds.Path, metadata: ds.Metadata) -> Iterator[ds.Chunk]:
+    content = self._extract_content(path)
+    docs = self._extract_docs(content, metadata)
+    payload = self._extract_payload(content)
+
+    for i, doc in enumerate(docs):
+      # The original file is stored once, alongside the first chunk
+      if i == 0 and payload is not None:
+        yield ds.Chunk(doc, payload=payload, payload_key=metadata.file_id)
+      else:
+        yield ds.Chunk(doc)
+
+  def _extract_payload(self, content: Union[str | Image.Image, list[Image.Image]]) -> bytes | None:
+    """
+    :return: the bytes stored in the bucket under the file id, if any
+    """
+    return None
+
   @abstractmethod
   def _extract_metadata(self, path: ds.Path, auth: ds.UserId) -> ds.Metadata:
     """
@@ -63,12 +115,21 @@ class Extractor(ABC):
     pass
 
   def _extract_embeddings(self, docs: list[Document]) -> list[list[float]]:
+    if self.batch_embedding_func is not None:
+      return self.batch_embedding_func([doc.page_content for doc in docs])
+
     return [self.embedding_func(doc.page_content) for doc in docs]
 
 
 class TxtExtractor(Extractor):
-  def __init__(self, embedding_func: ds.EmbeddingFunc, chunk_size: int = 500, chunk_overlap: int = 100):
-    super().__init__(embedding_func)
+  def __init__(
+      self,
+      embedding_func: ds.EmbeddingFunc,
+      chunk_size: int = 500,
+      chunk_overlap: int = 100,
+      batch_embedding_func: ds.BatchEmbeddingFunc | None = None
+  ):
+    super().__init__(embedding_func, batch_embedding_func)
     self.chunk_size = chunk_size
     self.chunk_overlap = chunk_overlap
 
@@ -79,6 +140,9 @@ class TxtExtractor(Extractor):
     with open(path, 'r', encoding='utf-8') as file:
       return file.read()
 
+  def _extract_payload(self, content: str) -> bytes:
+    return content.encode('utf-8')
+
   def _extract_docs(self, content: str, metadata: ds.Metadata) -> list[Document]:
     splitter = RecursiveCharacterTextSplitter(
       chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap
@@ -92,24 +156,89 @@ class TxtExtractor(Extractor):
 
 
 class ImgExtractor(Extractor):
+  """
+  Images are decoded at reduced scale and encoded once, see `utils.open_img` and `utils.encode_img`.
+  `stream_many` and `extract_many` preprocess a batch of images in a pool of `preprocess_workers` processes.
+  """
+  def __init__(
+      self,
+      embedding_func: ds.EmbeddingFunc,
+      batch_embedding_func: ds.BatchEmbeddingFunc | None = None,
+      preprocess_workers: int = 1
+  ) -> None:
+    super().__init__(embedding_func, batch_embedding_func)
+    self.preprocess_workers = preprocess_workers
+
   def _extract_metadata(self, path: ds.Path, auth: ds.UserId) -> ds.Metadata:
     return super()._extract_metadata(path, auth)
 
   def _extract_content(self, path: ds.Path) -> Image.Image:
-    try:
-      return Image.open(path).convert("RGB")
+    return open_image(path)
 
-    except Image.DecompressionBombError as e:
-      logger.error(f"The given image {path} cannot be open as the size is too big.")
-      raise ImageTooBigError(
-        f"The given image {path} cannot be open as the size is too big."
-      ) from e
-    except Image.UnidentifiedImageError as e:
-      logger.error(f"The given image is not an image: {path}.")
-      raise FileNotValidError(
-        f"The given image is not an image: {path}"
-      ) from e
+  def extract(self, path: ds.Path, auth: ds.UserId) -> ds.File:
+    metadata, chunks = self.stream(path, auth)
+    chunk = self.embed_chunk(next(chunks))
 
+    return ds.File(
+      metadata=metadata,
+      content=chunk.image,  # type: ignore[arg-type]
+      docs=[chunk.doc],
+      embeddings=[chunk.embedding]  # type: ignore[list-item]
+    )
+
+  def extract_many(self, paths: list[ds.Path], auth: ds.UserId) -> list[ds.File]:
+    """
+    Batch counterpart of `extract`: the images are preprocessed in parallel and embedded together.
+    :return: one File per path, in the same order
+    """
+    streams = self.stream_many(paths, auth)
+    metadatas = [metadata for metadata, _ in streams]
+    chunks = [next(chunks) for _, chunks in streams]
+
+    if self.batch_embedding_func is not None:
+      embeddings = self.batch_embedding_func([chunk.image.base64 for chunk in chunks])  # type: ignore[union-attr]
+    else:
+      embeddings = [self.embed_chunk(chunk).embedding for chunk in chunks]  # type: ignore[misc]
+
+    return [
+      ds.File(
+        metadata=chunk_metadata,
+        content=chunk.image,  # type: ignore[arg-type]
+        docs=[chunk.doc],
+        embeddings=[embedding]
+      )
+      for chunk_metadata, chunk, embedding in zip(metadatas, chunks, embeddings)
+    ]
+
+  def stream_many(self, paths: list[ds.Path], auth: ds.UserId) -> list[tuple[ds.Metadata, Iterator[ds.Chunk]]]:
+    """
+    Batch counterpart of `stream`: the images are decoded and encoded in parallel, the chunks are not embedded.
+    :return: the metadata and the chunks of every path, in the same order
+    """
+    paths = [validate_path(path) for path in paths]
+    metadatas = [self._extract_metadata(path, auth) for path in paths]
+
+    if self.preprocess_workers > 1 and len(paths) > 1:
+      with ProcessPoolExecutor(max_workers=min(self.preprocess_workers, len(paths))) as pool:
+        images = list(pool.map(encode_image, paths))
+    else:
+      images = [encode_image(path) for path in paths]
+
+    return [(metadata, iter([self._image_chunk(image, metadata)])) for image, metadata in zip(images, metadatas)]
+
+  def _iter_chunks(self, path: ds.Path, metadata: ds.Metadata) -> Iterator[ds.Chunk]:
+    # The image is encoded once, the same bytes are embedded and stored
+    yield self._image_chunk(utils.encode_img(self._extract_content(path), close=True), metadata)
+
+  @staticmethod
+  def _image_chunk(image: ds.EncodedImage, metadata: ds.Metadata) -> ds.Chunk:
+    doc = Document(
+      page_content=metadata.file_id,
+      metadata={**asdict(metadata), 'modality': 'image', 'text': metadata.file_id},
+      id=metadata.file_id
+    )
+
+    return ds.Chunk(doc, payload=image.data, payload_key=metadata.file_id, image=image)
 
   def _extract_docs(self, content: Image.Image, metadata: ds.Metadata) -> list[Document]:
     processed_img = utils.process_img(content)
@@ -126,6 +255,176 @@ class ImgExtractor(Extractor):
 
 
 class PdfExtractor(Extractor):
+  """
+  Pages are rendered by a bounded pool of poppler workers and streamed one by one:
+  each page is compressed and sent to the embedder while the next ones are still rendering,
+  so at most `max_pending_pages` decoded bitmaps are alive at any time.
+
+  When a `text_embedding_func` is given, pages are routed one by one:
+  pages with at least `min_text_chars` characters in their text layer and no image of at least
+  `min_image_pixels` are split into text chunks and never rendered, the others are embedded as images.
+  """
+  def __init__(
+      self,
+      embedding_func: ds.EmbeddingFunc,
+      batch_embedding_func: ds.BatchEmbeddingFunc | None = None,
+      dpi: int = 200,
+      render_workers: int = 2,
+      max_pending_pages: int = 4,
+      embed_workers: int = 4,
+      text_embedding_func: ds.EmbeddingFunc | None = None,
+      min_text_chars: int = 200,
+      min_image_pixels: int = 100 * 100,
+      chunk_size: int = 1000,
+      chunk_overlap: int = 100
+  ) -> None:
+    super().__init__(embedding_func, batch_embedding_func)
+    self.dpi = dpi
+    self.render_workers = render_workers
+    self.max_pending_pages = max_pending_pages
+    self.embed_workers = embed_workers
+    self.text_embedding_func = text_embedding_func
+    self.min_text_chars = min_text_chars
+    self.min_image_pixels = min_image_pixels
+    self.chunk_size = chunk_size
+    self.chunk_overlap = chunk_overlap
+
+  def extract(self, path: ds.Path, auth: ds.UserId) -> ds.File:
+    """
+    The File holds the encoded pages and the embeddings of the whole document, so its memory grows with
+    the number of pages: only the rendering is bounded here. Use `stream` to bound the memory of large pdfs.
+    """
+    metadata, chunks = self.stream(path, auth)
+
+    content: list[bytes | None] = []
+    docs: list[Document] = []
+    embedded: list[Future[ds.Chunk]] = []
+
+    with ThreadPoolExecutor(max_workers=self.embed_workers, thread_name_prefix='pdf-embed') as pool:
+      for chunk in chunks:
+        content.append(chunk.payload)
+        docs.append(chunk.doc)
+        embedded.append(pool.submit(self.embed_chunk, chunk))
+
+      logger.debug(f"Extracted {len(docs)} chunks of {path}, waiting for the embeddings")
+
+      return ds.File(
+        metadata=metadata,
+        content=content,  # type: ignore[arg-type]
+        docs=docs,
+        embeddings=[future.result().embedding for future in embedded]  # type: ignore[misc]
+      )
+
+  def embed_chunk(self, chunk: ds.Chunk) -> ds.Chunk:
+    if chunk.doc.metadata.get('modality') == 'text' and self.text_embedding_func is not None:
+      chunk.embedding = self.text_embedding_func(chunk.doc.page_content)
+      return chunk
+
+    return super().embed_chunk(chunk)
+
+  def embed_chunks(self, chunks: list[ds.Chunk]) -> list[ds.Chunk]:
+    # Text chunks have their own embedding function, only the pages are embedded in batch
+    pages = []
+    for chunk in chunks:
+      if chunk.doc.metadata.get('modality') == 'text' and self.text_embedding_func is not None:
+        self.embed_chunk(chunk)
+      else:
+        pages.append(chunk)
+
+    super().embed_chunks(pages)
+    return chunks
+
+  def _iter_chunks(self, path: ds.Path, metadata: ds.Metadata) -> Iterator[ds.Chunk]:
+    pdf_path = self._pdf_path(path)
+    text_pages = self._find_text_pages(pdf_path)
+
+    if not text_pages:
+      for page_no, page in self.iter_pages(pdf_path):
+        yield self._page_chunk(page_no, page, metadata)
+      return
+
+    texts, n_pages = text_pages
+    image_pages = [page_no for page_no in range(1, n_pages + 1) if page_no not in texts]
+    logger.debug(f"{pdf_path}: {len(texts)} text pages, {len(image_pages)} pages to render")
+
+    # Once the first image page is requested, the following ones render in the background while text pages are chunked
+    rendered = self.iter_pages(pdf_path, image_pages) if image_pages else iter(())
+    try:
+      for page_no in range(1, n_pages + 1):
+        if page_no in texts:
+          yield from self._text_chunks(page_no, texts[page_no], metadata)
+        else:
+          rendered_no, page = next(rendered)
+          yield self._page_chunk(rendered_no, page, metadata)
+    finally:
+      close = getattr(rendered, 'close', None)
+      if close is not None:
+        close()
+
+  def _find_text_pages(self, path: ds.Path) -> tuple[dict[int, str], int] | None:
+    """
+    :return: the text of the pages to embed as text, by page number, and the number of pages.
+      None if every page has to be rendered.
+    """
+    if self.text_embedding_func is None:
+      return None
+
+    texts = read_pdf_text(path)
+    image_pages = list_pdf_image_pages(path, self.min_image_pixels)
+    if texts is None or image_pages is None:
+      return None
+
+    text_pages = {
+      page_no: text
+      for page_no, text in enumerate(texts, start=1)
+      if len(text.strip()) >= self.min_text_chars and page_no not in image_pages
+    }
+
+    return text_pages, len(texts)
+
+  def _text_chunks(self, page_no: int, text: str, metadata: ds.Metadata) -> Iterator[ds.Chunk]:
+    splitter = RecursiveCharacterTextSplitter(
+      chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap
+    )
+
+    for i, split in enumerate(splitter.split_text(text), start=1):
+      yield ds.Chunk(
+        Document(
+          page_content=split,
+          metadata={**asdict(metadata), 'modality': 'text', 'page': page_no, 'text': split},
+          id=f'{metadata.file_id}/chunk{page_no}.{i}'
+        )
+      )
+
+  @staticmethod
+  def _page_chunk(page_no: int, page: Image.Image, metadata: ds.Metadata) -> ds.Chunk:
+    image = utils.encode_img(page, close=True)
+
+    page_id = f'{metadata.file_id}/chunk{page_no}'
+    doc = Document(
+      page_content=page_id,
+      metadata={**asdict(metadata), 'modality': 'image', 'page': page_no, 'text': page_id},
+      id=page_id
+    )
+
+    return ds.Chunk(doc, payload=image.data, payload_key=page_id, image=image)
+
+  def iter_pages(
+      self,
+      path: ds.Path,
+      page_numbers: list[int] | None = None
+  ) -> Iterator[tuple[int, Image.Image]]:
+    return iter_pdf_pages(
+      path,
+      dpi=self.dpi,
+      workers=self.render_workers,
+      max_pending=self.max_pending_pages,
+      page_numbers=page_numbers
+    )
+
+  def _pdf_path(self, path: ds.Path) -> ds.Path:
+    return path
+
   def _extract_metadata(self, path: ds.Path, auth: ds.UserId) -> ds.Metadata:
     return super()._extract_metadata(path, auth)
 
@@ -141,47 +440,204 @@ class PdfExtractor(Extractor):
     return docs
 
 
-class DocExtractor(Extractor):
-  def _extract_metadata(self, path: ds.Path, auth: ds.UserId) -> ds.Metadata:
-    return super()._extract_metadata(path, auth)
+class DocExtractor(PdfExtractor):
+  def _pdf_path(self, path: ds.Path) -> ds.Path:
+    return self._convert_to_pdf(path)
 
   def _extract_content(self, path: ds.Path) -> list[Image.Image]:
+    return from_pdf_path_to_pages(self._convert_to_pdf(path))
+
+  @staticmethod
+  def _convert_to_pdf(path: ds.Path) -> ds.Path:
     output_path, _ = os.path.splitext(path)
     output_path += '.pdf'
 
     convert_docx_to_pdf(path, output_path)
 
-    return from_pdf_path_to_pages(output_path)
+    return output_path
 
-  def _extract_docs(self, content: list[Image.Image], metadata: ds.Metadata) -> list[Document]:
-    processed_pages = [utils.process_img(page) for page in content]
-    ids = utils.generate_ids(metadata.file_id, len(processed_pages))
 
-    docs = utils.generate_docs(ids, processed_pages, metadata)
+def read_pdf_text(path: str) -> list[str] | None:
+  """
+  :return: the text layer of every page, through poppler's `pdftotext`. None if it cannot be read.
+  """
+  try:
+    result = subprocess.run(
+      ['pdftotext', '-layout', '-enc', 'UTF-8', path, '-'],
+      stderr=subprocess.PIPE,
+      stdout=subprocess.PIPE
+    )
+  except OSError as e:
+    logger.warning(f"Unable to run pdftotext on {path}, every page will be rendered: {e}")
+    return None
 
-    return docs
+  if result.returncode != 0:
+    logger.warning(f"pdftotext failed on {path}, every page will be rendered: {result.stderr!r}")
+    return None
+
+  # Every page is terminated by a form feed
+  pages = result.stdout.decode('utf-8', errors='replace').split('\f')
+  return pages[:-1] if pages and not pages[-1].strip() else pages
+
+
+def list_pdf_image_pages(path: str, min_pixels: int = 0) -> set[int] | None:
+  """
+  :return: the numbers of the pages holding at least one image of `min_pixels`, through poppler's `pdfimages`.
+    None if the images cannot be listed.
+  """
+  try:
+    result = subprocess.run(
+      ['pdfimages', '-list', path],
+      stderr=subprocess.PIPE,
+      stdout=subprocess.PIPE
+    )
+  except OSError as e:
+    logger.warning(f"Unable to run pdfimages on {path}, every page will be rendered: {e}")
+    return None
 
+  if result.returncode != 0:
+    logger.warning(f"pdfimages failed on {path}, every page will be rendered: {result.stderr!r}")
+    return None
 
-def from_pdf_path_to_pages(path: str) -> list[Image.Image]:
-  pages: list[Image.Image] = []
+  pages: set[int] = set()
+  # Two header lines: column names and a dashed separator
+  for line in result.stdout.decode('utf-8', errors='replace').splitlines()[2:]:
+    columns = line.split()
+    if len(columns) < 5 or columns[2] != 'image':
+      continue
 
-  for i, page in enumerate(convert_from_path(path)):
-    try:
-      pages.append(page.convert("RGB"))
+    page, width, height = int(columns[0]), int(columns[3]), int(columns[4])
+    if width * height >= min_pixels:
+      pages.add(page)
 
-    # TODO: Skip only one page, instead of stopping the processing
-    except Image.DecompressionBombError:
-      logger.error(f"Stopping pdf extraction pipeline since page {i} is too big to process")
-      raise ImageTooBigError(
-        f"Stopping pdf extraction pipeline since page {i} is too big to process"
-      )
-    except Image.UnidentifiedImageError as e:
-      logger.error(f"The given image is not an image: {path}.")
+  return pages
+
+
+def iter_pdf_pages(
+    path: str,
+    dpi: int = 200,
+    workers: int = 2,
+    max_pending: int = 4,
+    page_numbers: list[int] | None = None
+) -> Iterator[tuple[int, Image.Image]]:
+  """
+  Renders the pages of a pdf, yielded one at a time and in order, as (page_number, RGB image).
+  Every `pdftoppm` process parses the whole pdf, so each one renders a range of up to `max_pending // workers`
+  consecutive pages. At most `workers` of them run concurrently
+  and at most `max_pending` rendered pages wait to be consumed.
+  :param dpi: resolution of the rendered pages
+  :param page_numbers: the pages to render, all of them by default
+  """
+  if workers < 1 or max_pending < workers:
+    raise ValueError(
+      f"workers must be positive and max_pending must be >= workers, got {workers} and {max_pending}"
+    )
+
+  if page_numbers is None:
+    try:
+      n_pages: int = pdfinfo_from_path(path)['Pages']
+    except (PDFInfoNotInstalledError, PDFPageCountError, PDFSyntaxError) as e:
+      logger.error(f"Unable to read the pages of {path}: {e}")
       raise FileNotValidError(
-        f"The given image is not an image: {path}"
+        f"Unable to read the pages of {path}"
       ) from e
 
-  return pages
+    page_numbers = list(range(1, n_pages + 1))
+
+  def _render(page_range: list[int]) -> list[Image.Image]:
+    pages = convert_from_path(path, dpi=dpi, first_page=page_range[0], last_page=page_range[-1])
+    return [_convert_page(page, page_no, path) for page_no, page in zip(page_range, pages)]
+
+  pending: deque[tuple[list[int], Future[list[Image.Image]]]] = deque()
+  rendered: deque[tuple[int, Image.Image]] = deque()
+  to_render = iter(_page_ranges(page_numbers, max_pending // workers))
+  next_range = next(to_render, None)
+  # Pages rendering or rendered, and not yielded yet
+  queued = 0
+
+  with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pdf-render') as pool:
+    try:
+      while True:
+        while next_range is not None and queued + len(next_range) <= max_pending:
+          pending.append((next_range, pool.submit(_render, next_range)))
+          queued += len(next_range)
+          next_range = next(to_render, None)
+
+        if not rendered:
+          if not pending:
+            break
+          page_range, future = pending.popleft()
+          rendered.extend(zip(page_range, future.result()))
+
+        queued -= 1
+        yield rendered.popleft()
+
+    finally:
+      # The consumer stopped early, do not render pages nobody will read
+      for _, future in pending:
+        future.cancel()
+
+
+def _page_ranges(page_numbers: list[int], max_length: int) -> Iterator[list[int]]:
+  """
+  Splits sorted page numbers into ranges of consecutive pages, of at most `max_length` pages.
+  """
+  page_range: list[int] = []
+  for page_no in page_numbers:
+    if page_range and (page_no != page_range[-1] + 1 or len(page_range) >= max_length):
+      yield page_range
+      page_range = []
+    page_range.append(page_no)
+
+  if page_range:
+    yield page_range
+
+
+def from_pdf_path_to_pages(path: str) -> list[Image.Image]:
+  return [
+    _convert_page(page, i, path)
+    for i, page in enumerate(convert_from_path(path))
+  ]
+
+
+def _convert_page(page: Image.Image, page_no: int, path: str) -> Image.Image:
+  try:
+    return page.convert("RGB")
+
+  # TODO: Skip only one page, instead of stopping the processing
+  except Image.DecompressionBombError:
+    logger.error(f"Stopping pdf extraction pipeline since page {page_no} is too big to process")
+    raise ImageTooBigError(
+      f"Stopping pdf extraction pipeline since page {page_no} is too big to process"
+    )
+  except Image.UnidentifiedImageError as e:
+    logger.error(f"The given image is not an image: {path}.")
+    raise FileNotValidError(
+      f"The given image is not an image: {path}"
+    ) from e
+
+
+def open_image(path: str) -> Image.Image:
+  try:
+    return utils.open_img(path)
+
+  except Image.DecompressionBombError as e:
+    logger.error(f"The given image {path} cannot be open as the size is too big.")
+    raise ImageTooBigError(
+      f"The given image {path} cannot be open as the size is too big."
+    ) from e
+  except Image.UnidentifiedImageError as e:
+    logger.error(f"The given image is not an image: {path}.")
+    raise FileNotValidError(
+      f"The given image is not an image: {path}"
+    ) from e
+
+
+def encode_image(path: str) -> ds.EncodedImage:
+  """
+  Runs in the preprocessing processes of `ImgExtractor.stream_many`, hence a module level function.
+  """
+  return utils.encode_img(open_image(path), close=True)
 
 
 def convert_docx_to_pdf(input_path: str, output_path: str) -> None:
@@ -210,6 +666,11 @@ def convert_docx_to_pdf(input_path: str, output_path: str) -> None:
     )
 
 
+def _embedding_input(chunk: ds.Chunk) -> str:
+  # Image chunks are embedded from their encoded image, the others from their text
+  return chunk.image.base64 if chunk.image is not None else chunk.doc.page_content
+
+
 def generate_file_name_and_type(file_path: str) -> tuple[str, str]:
   file_name, file_type = os.path.splitext(os.path.basename(file_path))
 
@@ -230,8 +691,14 @@ def validate_path(path: str) -> str:
 
 
 class CodeExtractor(Extractor):
-  def __init__(self, embedding_func: ds.EmbeddingFunc, chunk_size: int = 500, chunk_overlap: int = 100):
-    super().__init__(embedding_func)
+  def __init__(
+      self,
+      embedding_func: ds.EmbeddingFunc,
+      chunk_size: int = 500,
+      chunk_overlap: int = 100,
+      batch_embedding_func: ds.BatchEmbeddingFunc | None = None
+  ):
+    super().__init__(embedding_func, batch_embedding_func)
     self.chunk_size = chunk_size
     self.chunk_overlap = chunk_overlap
 
@@ -242,6 +709,9 @@ class CodeExtractor(Extractor):
     with open(path, 'r', encoding='utf-8') as file:
       return file.read()
 
+  def _extract_payload(self, content: str) -> bytes:
+    return content.encode('utf-8')
+
   def _extract_docs(self, content: str, metadata: ds.Metadata) -> list[Document]:
     splitter = self._create_splitter(metadata.file_type)
 
@@ -0,0 +1,275 @@
+import asyncio
+import hashlib
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator, TypeVar
+
+import mm_rag.datastructures as ds
+import mm_rag.pipelines.extractors as extr
+import mm_rag.pipelines.uploaders as upl
+from mm_rag.caching import IngestCheckpoints
+from mm_rag.logging_service.log_config import create_logger
+
+
+logger = create_logger(__name__)
+
+T = TypeVar("T")
+
+# Marks the end of a stage's input
+_DONE = object()
+
+
+@dataclass
+class IngestProgress:
+  file_id: str = ''
+  extracted: int = 0
+  embedded: int = 0
+  stored: int = 0
+  # Chunks skipped because a previous, failed ingestion of the same content stored them
+  resumed: int = 0
+  # Time spent working in each stage, summed over its workers
+  busy_seconds: dict[str, float] = field(default_factory=lambda: {'extract': 0.0, 'embed': 0.0, 'store': 0.0})
+  elapsed_seconds: float = 0.0
+
+
+class IngestPipeline:
+  """
+  Runs extraction, embedding and storage of a file as three overlapping stages,
+  connected by bounded queues:
+
+    extractor.stream -> [chunks] -> embed workers -> [embedded chunks] -> store workers
+
+  Every blocking call runs in a dedicated thread pool, so the event loop is never blocked,
+  and the queues bound the number of chunks held in memory.
+  Embed and store workers take up to `batch_size` chunks at a time, embedded with one call
+  of the extractor's `embed_chunks` and stored with one call of the uploader's `store_chunks`.
+  If any stage fails, whatever was stored is rolled back and the first error is raised.
+  With `checkpoints`, the chunks whose write went through are kept instead,
+  and a new ingestion of the same content resumes after them.
+  """
+  def __init__(
+      self,
+      extractor: extr.Extractor,
+      uploader: upl.Uploader,
+      embed_workers: int = 4,
+      store_workers: int = 2,
+      batch_size: int = 32,
+      queue_size: int = 16,
+      checkpoints: IngestCheckpoints | None = None
+  ) -> None:
+    if min(embed_workers, store_workers, batch_size, queue_size) < 1:
+      raise ValueError(
+        "embed_workers, store_workers, batch_size and queue_size must be positive"
+      )
+
+    self.extractor = extractor
+    self.uploader = uploader
+    self.embed_workers = embed_workers
+    self.store_workers = store_workers
+    self.batch_size = batch_size
+    self.queue_size = queue_size
+    self.checkpoints = checkpoints
+
+  @staticmethod
+  def threads_for(embed_workers: int = 4, store_workers: int = 2, **options: Any) -> int:
+    """
+    :return: the threads a pipeline built with these options keeps busy, one per worker plus the producer
+    """
+    return embed_workers + store_workers + 1
+
+  @property
+  def threads(self) -> int:
+    return self.threads_for(self.embed_workers, self.store_workers)
+
+  async def run(
+      self,
+      path: ds.Path,
+      auth: ds.UserId,
+      progress: IngestProgress | None = None,
+      executor: ThreadPoolExecutor | None = None,
+      stream: tuple[ds.Metadata, Iterator[ds.Chunk]] | None = None
+  ) -> IngestProgress:
+    """
+    :param progress: updated in place as the stages advance, e.g. to report it while the ingestion runs
+    :param executor: shared by the pipelines of a batch, it is left running. By default each run owns one
+    :param stream: metadata and chunks of the file, already extracted with the ones of other files of a batch.
+      By default the extractor streams them
+    """
+    progress = progress or IngestProgress()
+    started = time.perf_counter()
+
+    owned = executor is None
+    if executor is None:
+      executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='ingest')
+    run = _Runner(executor, progress)
+    chunks: Iterator[ds.Chunk] | None = None
+
+    try:
+      if stream is None:
+        stream = await run('extract', self.extractor.stream, path, auth)
+      metadata, chunks = stream
+      progress.file_id = metadata.file_id
+
+      digest = ''
+      resumed: frozenset[str] = frozenset()
+      if self.checkpoints is not None:
+        digest = await run('extract', _digest, path)
+        resumed = self.checkpoints.get(auth, metadata.file_id, digest)
+        if resumed:
+          logger.info(f"Resuming {metadata.file_id} after {len(resumed)} chunks stored by a previous ingestion")
+
+      to_embed: asyncio.Queue[Any] = asyncio.Queue(self.queue_size)
+      to_store: asyncio.Queue[Any] = asyncio.Queue(self.queue_size)
+      # Chunks handed to the uploader, whether their write went through, failed or is still in flight
+      submitted: list[ds.Chunk] = []
+      # Ids of the chunks whose write went through, updated by the store calls themselves
+      confirmed: set[str] = set(resumed)
+      embedders_left = self.embed_workers
+
+      async def produce() -> None:
+        iterator: Iterator[ds.Chunk] = iter(chunks)
+        while (chunk := await run('extract', next, iterator, _DONE)) is not _DONE:
+          progress.extracted += 1
+          if chunk.doc.id in resumed:
+            progress.resumed += 1
+            continue
+          await to_embed.put(chunk)
+
+        for _ in range(self.embed_workers):
+          await to_embed.put(_DONE)
+
+      async def embed() -> None:
+        nonlocal embedders_left
+        done = False
+
+        while not done:
+          batch, done = await _next_batch(to_embed, self.batch_size)
+          if batch:
+            for chunk in await run('embed', self.extractor.embed_chunks, batch):
+              await to_store.put(chunk)
+            progress.embedded += len(batch)
+
+        embedders_left -= 1
+        if embedders_left == 0:
+          for _ in range(self.store_workers):
+            await to_store.put(_DONE)
+
+      async def store() -> None:
+        done = False
+
+        while not done:
+          batch, done = await _next_batch(to_store, self.batch_size)
+          if batch:
+            submitted.extend(batch)
+            await run('store', self._store, metadata, batch, confirmed)
+            progress.stored += len(batch)
+
+      try:
+        async with asyncio.TaskGroup() as tg:
+          tg.create_task(produce())
+          for _ in range(self.embed_workers):
+            tg.create_task(embed())
+          for _ in range(self.store_workers):
+            tg.create_task(store())
+
+      except* Exception as eg:
+        logger.error(f"Ingestion of {metadata.file_id} failed: {eg.exceptions}")
+        # The TaskGroup only cancelled the tasks, writes already running in the executor
+        # would land after their rollback: they are waited for first
+        await asyncio.to_thread(_drain, run)
+
+        to_roll_back = submitted
+        if self.checkpoints is not None:
+          to_roll_back = [chunk for chunk in submitted if chunk.doc.id not in confirmed]
+          if confirmed:
+            self.checkpoints.save(auth, metadata.file_id, digest, confirmed)
+            logger.info(f"Kept {len(confirmed)} chunks of {metadata.file_id}, uploading it again resumes after them")
+
+        if to_roll_back:
+          await run('store', self.uploader.rollback, metadata, to_roll_back)
+        raise eg.exceptions[0]
+
+      if self.checkpoints is not None:
+        self.checkpoints.discard(auth, metadata.file_id)
+
+    finally:
+      # Waits for in-flight calls off the event loop, then releases the extractor's resources
+      await asyncio.to_thread(_shutdown, run, chunks, owned)
+
+    progress.elapsed_seconds = time.perf_counter() - started
+    logger.info(
+      f"Ingested {progress.stored} chunks of {metadata.file_id} in {progress.elapsed_seconds:.2f}s, "
+      f"busy time per stage: {progress.busy_seconds}"
+    )
+    return progress
+
+  def _store(self, metadata: ds.Metadata, batch: list[ds.Chunk], confirmed: set[str]) -> int:
+    stored = self.uploader.store_chunks(metadata, batch)
+    # Recorded from the executor, a write that completes after its task was cancelled still counts
+    confirmed.update(chunk.doc.id for chunk in batch if chunk.doc.id)
+    return stored
+
+
+async def _next_batch(queue: asyncio.Queue[Any], size: int) -> tuple[list[ds.Chunk], bool]:
+  """
+  Waits for a chunk, then whatever else is ready joins the batch, so batches grow when the consumer is the bottleneck.
+  :return: up to `size` chunks, and whether the end of the input was reached
+  """
+  batch: list[ds.Chunk] = []
+  item = await queue.get()
+
+  while item is not _DONE:
+    batch.append(item)
+    if len(batch) >= size or queue.empty():
+      return batch, False
+    item = queue.get_nowait()
+
+  return batch, True
+
+
+def _digest(path: ds.Path) -> str:
+  with open(path, 'rb') as f:
+    return hashlib.file_digest(f, 'sha256').hexdigest()
+
+
+class _Runner:
+  """
+  Runs blocking calls in the pipeline's executor, accounting the time to their stage.
+  """
+  def __init__(self, executor: ThreadPoolExecutor, progress: IngestProgress) -> None:
+    self.executor = executor
+    self.progress = progress
+    # Calls of this pipeline still running, the executor may be shared with other pipelines
+    self.pending: set[Future] = set()
+
+  async def __call__(self, stage: str, func: Callable[..., T], *args: Any) -> T:
+    started = time.perf_counter()
+    future = self.executor.submit(func, *args)
+    self.pending.add(future)
+    future.add_done_callback(self.pending.discard)
+
+    try:
+      return await asyncio.wrap_future(future)
+    finally:
+      self.progress.busy_seconds[stage] += time.perf_counter() - started
+
+
+def _drain(run: _Runner) -> None:
+  """
+  Cancels the calls of the pipeline that did not start yet, and waits for the running ones.
+  """
+  for future in list(run.pending):
+    future.cancel()
+  wait(list(run.pending))
+
+
+def _shutdown(run: _Runner, chunks: Iterator[ds.Chunk] | None, owned: bool) -> None:
+  if owned:
+    run.executor.shutdown(wait=True, cancel_futures=True)
+  else:
+    _drain(run)
+
+  close = getattr(chunks, 'close', None)
+  if close is not None:
+    close()
@@ -0,0 +1,290 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import asdict, dataclass, field
+from typing import TYPE_CHECKING, Any, Awaitable, Callable
+
+from botocore.exceptions import ClientError
+
+from mm_rag.exceptions import JobQueueFullError, MissingItemError
+from mm_rag.logging_service.log_config import create_logger
+
+if TYPE_CHECKING:
+  from mm_rag.models.dynamodb import DynamoDB
+  from mm_rag.pipelines.ingest import IngestProgress
+
+
+logger = create_logger(__name__)
+
+
+@dataclass
+class Job:
+  user_id: str
+  file_name: str
+  job_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+  # One of: 'queued', 'running', 'succeeded', 'failed'
+  status: str = 'queued'
+  # Chunks extracted (pages rendered), embedded and stored so far, see IngestProgress
+  progress: dict[str, Any] = field(default_factory=dict)
+  error: str | None = None
+  # What the job returned, e.g. the result of every file of a batch
+  result: Any = None
+  created: float = field(default_factory=time.time)
+  updated: float = field(default_factory=time.time)
+
+  def to_json(self) -> str:
+    return json.dumps(asdict(self))
+
+  @classmethod
+  def from_json(cls, data: str) -> 'Job':
+    return cls(**json.loads(data))
+
+
+class JobStore(ABC):
+  """
+  Where the state of the ingestion jobs lives, so that any instance can report it.
+  """
+  @abstractmethod
+  def put(self, job: Job) -> None:
+    pass
+
+  @abstractmethod
+  def get(self, job_id: str) -> Job | None:
+    pass
+
+
+class MemoryJobStore(JobStore):
+  def __init__(self) -> None:
+    self._jobs: dict[str, str] = {}
+    self._lock = threading.Lock()
+
+  def put(self, job: Job) -> None:
+    with self._lock:
+      self._jobs[job.job_id] = job.to_json()
+
+  def get(self, job_id: str) -> Job | None:
+    with self._lock:
+      data = self._jobs.get(job_id)
+
+    return Job.from_json(data) if data is not None else None
+
+
+class SQLiteJobStore(JobStore):
+  def __init__(self, path: str, ttl_seconds: int = 7 * 24 * 3600) -> None:
+    self.path = path
+    self.ttl_seconds = ttl_seconds
+
+    self._lock = threading.Lock()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    self._conn = sqlite3.connect(path, check_same_thread=False)
+    self._conn.execute("PRAGMA journal_mode=WAL")
+    self._conn.execute(
+      "CREATE TABLE IF NOT EXISTS jobs ("
+      "job_id TEXT PRIMARY KEY, job TEXT NOT NULL, updated REAL NOT NULL)"
+    )
+    self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_updated ON jobs (updated)")
+    self._conn.commit()
+
+  def put(self, job: Job) -> None:
+    with self._lock:
+      self._conn.execute(
+        "INSERT OR REPLACE INTO jobs (job_id, job, updated) VALUES (?, ?, ?)",
+        (job.job_id, job.to_json(), job.updated)
+      )
+      # Finished jobs are only kept for `ttl_seconds`
+      self._conn.execute("DELETE FROM jobs WHERE updated < ?", (time.time() - self.ttl_seconds,))
+      self._conn.commit()
+
+  def get(self, job_id: str) -> Job | None:
+    with self._lock:
+      row = self._conn.execute("SELECT job FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+
+    return Job.from_json(row[0]) if row is not None else None
+
+
+class DynamoDBJobStore(JobStore):
+  """
+  Stores the jobs in the `jobs` table, they expire through DynamoDB's native TTL on `expiresAt`.
+  """
+  table_name = 'jobs'
+
+  def __init__(self, dynamodb: 'DynamoDB', ttl_seconds: int = 7 * 24 * 3600) -> None:
+    self.dynamodb = dynamodb
+    self.ttl_seconds = ttl_seconds
+
+  def put(self, job: Job) -> None:
+    try:
+      self.dynamodb.put_item(
+        self.table_name,
+        {
+          'jobId': job.job_id,
+          # Serialized as a whole, DynamoDB does not take floats
+          'job': job.to_json(),
+          'expiresAt': int(time.time()) + self.ttl_seconds
+        }
+      )
+    except ClientError as e:
+      logger.warning(f"Unable to store the state of job {job.job_id}: {e}")
+
+  def get(self, job_id: str) -> Job | None:
+    try:
+      item: dict[str, Any] = self.dynamodb.get_from_table(self.table_name, {'jobId': job_id})
+    except MissingItemError:
+      return None
+
+    return Job.from_json(item['job'])
+
+
+# Ingests a file, reporting its progress in the given IngestProgress, what it returns must be serializable as JSON
+JobRunner = Callable[['IngestProgress'], Awaitable[Any]]
+
+
+class JobQueue:
+  """
+  Bounded queue of ingestion jobs, drained by `workers` tasks of the event loop.
+  The state of every job is written to the store when it changes, and every `progress_interval`
+  seconds while it runs.
+  """
+  def __init__(
+      self,
+      store: JobStore,
+      workers: int = 2,
+      max_queued: int = 100,
+      progress_interval: float = 1.0
+  ) -> None:
+    if min(workers, max_queued) < 1:
+      raise ValueError("workers and max_queued must be positive")
+
+    self.store = store
+    self.workers = workers
+    self.max_queued = max_queued
+    self.progress_interval = progress_interval
+
+    self._queue: asyncio.Queue[tuple[Job, JobRunner, Callable[[], None] | None]] | None = None
+    self._tasks: list[asyncio.Task] = []
+    self._loop: asyncio.AbstractEventLoop | None = None
+    self._lock = threading.Lock()
+
+  def submit(self, job: Job, run: JobRunner, cleanup: Callable[[], None] | None = None) -> Job:
+    """
+    Queues the job, the workers start with the first submission.
+    :param cleanup: called once the job is over, whatever its outcome, e.g. to remove its files
+    :raises JobQueueFullError: when `max_queued` jobs are already waiting
+    """
+    queue = self._ensure_workers()
+
+    try:
+      queue.put_nowait((job, run, cleanup))
+    except asyncio.QueueFull:
+      raise JobQueueFullError(f"{self.max_queued} jobs are already queued, try again later")
+
+    self.store.put(job)
+    logger.debug(f"Queued job {job.job_id} for {job.file_name}")
+    return job
+
+  def get(self, job_id: str) -> Job | None:
+    return self.store.get(job_id)
+
+  async def join(self) -> None:
+    """
+    Waits until every queued job is over.
+    """
+    if self._queue is not None:
+      await self._queue.join()
+
+  async def stop(self) -> None:
+    for task in self._tasks:
+      task.cancel()
+    await asyncio.gather(*self._tasks, return_exceptions=True)
+    self._tasks = []
+    self._queue = None
+    self._loop = None
+
+  def _ensure_workers(self) -> asyncio.Queue:
+    loop = asyncio.get_running_loop()
+
+    # Queues and tasks are bound to the loop that created them
+    if self._queue is None or self._loop is not loop:
+      self._loop = loop
+      self._queue = asyncio.Queue(self.max_queued)
+      self._tasks = [
+        loop.create_task(self._work(self._queue), name=f'ingest-job-{i}')
+        for i in range(self.workers)
+      ]
+
+    return self._queue
+
+  async def _work(self, queue: asyncio.Queue) -> None:
+    while True:
+      job, run, cleanup = await queue.get()
+      try:
+        await self._run(job, run)
+      finally:
+        if cleanup is not None:
+          await asyncio.to_thread(cleanup)
+        queue.task_done()
+
+  async def _run(self, job: Job, run: JobRunner) -> None:
+    from mm_rag.pipelines.ingest import IngestProgress
+
+    progress = IngestProgress()
+    await asyncio.to_thread(self._update, job, progress, 'running')
+    reporter = asyncio.create_task(self._report(job, progress))
+
+    try:
+      job.result = await run(progress)
+    except Exception as e:
+      logger.error(f"Job {job.job_id} failed: {e}")
+      job.error = str(e)
+      await asyncio.to_thread(self._update, job, progress, 'failed')
+      return
+    finally:
+      reporter.cancel()
+
+    await asyncio.to_thread(self._update, job, progress, 'succeeded')
+    logger.info(f"Job {job.job_id} of {job.file_name} succeeded: {job.progress}")
+
+  async def _report(self, job: Job, progress: 'IngestProgress') -> None:
+    while True:
+      await asyncio.sleep(self.progress_interval)
+      await asyncio.to_thread(self._update, job, progress)
+
+  def _update(self, job: Job, progress: 'IngestProgress', status: str | None = None) -> None:
+    with self._lock:
+      # A report still in flight must not overwrite the final state
+      if status is None and job.status in ('succeeded', 'failed'):
+        return
+
+      job.status = status or job.status
+      job.progress = asdict(progress)
+      job.updated = time.time()
+      self.store.put(job)
+
+
+def from_config(jobs_config: dict[str, Any], dynamodb: 'DynamoDB | None' = None) -> JobQueue:
+  backend = jobs_config.get('backend', 'memory')
+  ttl_seconds = jobs_config.get('ttl_days', 7) * 24 * 3600
+  store: JobStore
+
+  if backend == 'memory':
+    store = MemoryJobStore()
+  elif backend == 'sqlite':
+    store = SQLiteJobStore(jobs_config['sqlite_path'], ttl_seconds=ttl_seconds)
+  elif backend == 'dynamodb':
+    if dynamodb is None:
+      raise ValueError("A DynamoDB instance is required for the `dynamodb` job store")
+    store = DynamoDBJobStore(dynamodb, ttl_seconds=ttl_seconds)
+  else:
+    raise ValueError(f"Unknown job store backend: {backend}")
+
+  return JobQueue(
+    store,
+    workers=jobs_config.get('workers', 2),
+    max_queued=jobs_config.get('max_queued', 100),
+    progress_interval=jobs_config.get('progress_interval_seconds', 1.0)
+  )
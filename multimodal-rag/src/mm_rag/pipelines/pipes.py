@@ -1,18 +1,28 @@
-import mm_rag.pipelines.extractors as extr
-import mm_rag.pipelines.uploaders as upl
 import mm_rag.pipelines.retrievers as retr
 import mm_rag.datastructures as ds
 from mm_rag.models import dynamodb, s3bucket, vectorstore as vs
 from mm_rag.exceptions import FileNotValidError
 from mm_rag.agents.mm_embedder import Embedder
+from mm_rag.caching import IngestCheckpoints, namespace_versions
 from mm_rag.logging_service.log_config import create_logger
 
-from typing import Type
+from typing import TYPE_CHECKING, Any, Callable, Iterator, Type
 import os
 import asyncio
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 
 
+if TYPE_CHECKING:
+  # Extraction and upload pull in PIL, pdf2image and the text splitters, they are imported on first ingestion
+  import mm_rag.pipelines.extractors as extr
+  import mm_rag.pipelines.uploaders as upl
+  from mm_rag.pipelines.ingest import IngestProgress
+  from mm_rag.models.local_vectorstore import LocalVectorStore
+  from mm_rag.models.postgres import PgVectorStore
+
+
 logger = create_logger(__name__)
 
 
@@ -26,6 +36,9 @@ class ComponentFactory:
     region: str,
     dynamodb: dynamodb.DynamoDB,
     bucket: s3bucket.BucketService,
+    pdf_options: dict[str, int] | None = None,
+    vector_store_options: dict[str, Any] | None = None,
+    image_options: dict[str, int] | None = None
   ) -> None:
     self.dynamodb = dynamodb
     self.bucket = bucket
@@ -34,56 +47,80 @@ class ComponentFactory:
     self.index_name = index_name
     self.cloud = cloud
     self.region = region
+    # Options of PdfExtractor and DocExtractor, see config['pdf']
+    self.pdf_options = pdf_options or {}
+    # Selects and configures the VectorStore backend, see config['vector_store']
+    self.vector_store_options = vector_store_options or {}
+    # Options of ImgExtractor, see config['images']
+    self.image_options = image_options or {}
 
-  def get_extractor(self, file_path: ds.Path, auth: ds.UserId) -> extr.Extractor:
-    file_ext = self.get_file_ext(file_path)
-    if not hasattr(self, 'vector_store'):
-      self.vector_store = self.get_vector_store(auth)
+  def get_extractor(self, file_path: ds.Path, auth: ds.UserId) -> 'extr.Extractor':
+    import mm_rag.pipelines.extractors as extr
 
-    file_ext = os.path.splitext(file_path)[-1]
+    file_ext = self.get_file_ext(file_path)
     if file_ext == ds.FileType.TXT.value:
-      return extr.TxtExtractor(self.embedder.embed_query)
+      return extr.TxtExtractor(self.embedder.embed_query, batch_embedding_func=self.embedder.embed_documents)
     if file_ext in ds.FileType.IMAGE.value:
-      return extr.ImgExtractor(self.embedder.embed_img)
+      return extr.ImgExtractor(self.embedder.embed_img, batch_embedding_func=self.embedder.embed_imgs, **self.image_options)
     if file_ext == ds.FileType.PDF.value:
-      return extr.PdfExtractor(self.embedder.embed_img)
+      return extr.PdfExtractor(
+        self.embedder.embed_img,
+        batch_embedding_func=self.embedder.embed_imgs,
+        text_embedding_func=self.embedder.embed_query,
+        **self.pdf_options
+      )
     if file_ext == ds.FileType.DOCX.value:
-      return extr.DocExtractor(self.embedder.embed_img)
+      return extr.DocExtractor(
+        self.embedder.embed_img,
+        batch_embedding_func=self.embedder.embed_imgs,
+        text_embedding_func=self.embedder.embed_query,
+        **self.pdf_options
+      )
     elif file_ext in ds.FileType.CODE.value:
-      return extr.CodeExtractor(self.embedder.embed_query)
+      return extr.CodeExtractor(self.embedder.embed_query, batch_embedding_func=self.embedder.embed_documents)
 
     raise FileNotValidError(
       f"File type: {file_ext} not yet supported"
     )
 
-  def get_uploader(self, file_path: ds.Path, auth: ds.UserId) -> upl.Uploader:
+  def get_uploader(
+      self,
+      file_path: ds.Path,
+      auth: ds.UserId,
+      vector_store: 'vs.PineconeVectorStore | LocalVectorStore | PgVectorStore | None' = None
+  ) -> 'upl.Uploader':
+    """
+    :param vector_store: the VectorStore of `auth` to write to, e.g. shared by the files of a batch
+    """
+    import mm_rag.pipelines.uploaders as upl
+
     file_ext = self.get_file_ext(file_path)
-    if not hasattr(self, 'vector_store'):
-      self.vector_store = self.get_vector_store(auth)
+    # Vector stores are cheap, they all share the process-wide Pinecone index handle
+    vector_store = vector_store or self.get_vector_store(auth)
 
     if file_ext == ds.FileType.TXT.value:
       return upl.TxtUploader(
         dynamodb=self.dynamodb,
-        vector_store=self.vector_store,
+        vector_store=vector_store,
         bucket=self.bucket
     )
     if file_ext in ds.FileType.IMAGE.value:
       return upl.ImgUploader(
         dynamodb=self.dynamodb,
-        vector_store=self.vector_store,
+        vector_store=vector_store,
         bucket=self.bucket
     )
     if (file_ext == ds.FileType.PDF.value or
         file_ext == ds.FileType.DOCX.value):
       return upl.PdfUploader(
         dynamodb=self.dynamodb,
-        vector_store=self.vector_store,
+        vector_store=vector_store,
         bucket=self.bucket
     )
     elif file_ext in ds.FileType.CODE.value:
       return upl.CodeUploader(
         dynamodb=self.dynamodb,
-        vector_store=self.vector_store,
+        vector_store=vector_store,
         bucket=self.bucket
     )
 
@@ -91,7 +128,47 @@ class ComponentFactory:
       f"File type: {file_ext} not yet supported"
     )
 
-  def get_vector_store(self, auth: ds.UserId) -> vs.PineconeVectorStore:
+  @property
+  def vector_store_backend(self) -> str:
+    return self.vector_store_options.get('backend', 'pinecone')
+
+  def get_vector_store(self, auth: ds.UserId) -> 'vs.PineconeVectorStore | LocalVectorStore | PgVectorStore':
+    options = self.vector_store_options
+
+    if self.vector_store_backend == 'pgvector':
+      # sqlalchemy, pgvector and psycopg2 are only required by the pgvector backend
+      from mm_rag.models import postgres
+
+      return postgres.PgVectorStore(
+        embedder=self.embedder,
+        db=postgres.connect(
+          options['pg_host'],
+          options['pg_database'],
+          options['pg_password'],
+          user=options.get('pg_user', 'postgres'),
+          port=options.get('pg_port', 5432),
+          pool_size=options.get('pg_pool_size', 5),
+          vector_index=options.get('pg_vector_index', 'hnsw')
+        ),
+        namespace=auth,
+        ef_search=options.get('pg_ef_search', 40),
+        probes=options.get('pg_probes', 10)
+      )
+
+    if self.vector_store_backend == 'local':
+      # numpy is only required by the local backend
+      from mm_rag.models.local_vectorstore import LocalVectorStore
+
+      return LocalVectorStore(
+        embedder=self.embedder,
+        namespace=auth,
+        path=options.get('local_path'),
+        ann_threshold=options.get('ann_threshold')
+      )
+
+    if self.vector_store_backend != 'pinecone':
+      raise ValueError(f"Unknown vector store backend: {self.vector_store_backend}")
+
     return vs.PineconeVectorStore(
       embedder=self.embedder,
       api_key=self.api_key,
@@ -102,36 +179,236 @@ class ComponentFactory:
     )
 
   def get_retriever(self, auth: ds.UserId, top_k: int = 3) -> retr.Retriever:
-    if not hasattr(self, 'vector_store'):
-      self.vector_store = self.get_vector_store(auth)
-
     return retr.Retriever(
-      self.vector_store,
+      self.get_vector_store(auth),
       self.dynamodb,
       self.bucket,
       self.embedder,
-      top_k
+      top_k,
+      cache=retr.retrieval_cache
     )
 
+  def warm_up(self) -> None:
+    """
+    Checks the existence of the index and opens its connection once, at startup.
+    """
+    if self.vector_store_backend != 'pinecone':
+      return
+
+    vs.registry.index(self.api_key, self.index_name, self.cloud, self.region)
+
   @staticmethod
   def get_file_ext(path: ds.Path) -> str:
     return os.path.splitext(path)[-1]
 
 
+@dataclass
+class FileResult:
+  file_name: str
+  # One of: 'succeeded', 'failed'
+  status: str
+  file_id: str = ''
+  stored: int = 0
+  error: str | None = None
+
+
 class Piper:
   def __init__(
     self,
-    factory: ComponentFactory
+    factory: ComponentFactory,
+    ingest_options: dict[str, int] | None = None,
+    batch_options: dict[str, int] | None = None,
+    checkpoints: IngestCheckpoints | None = None
   ) -> None:
     self.factory = factory
+    # Per stage limits of the IngestPipeline: embed_workers, store_workers, batch_size, queue_size
+    self.ingest_options = ingest_options or {}
+    # Limits of `pipe_many`: files, max_files, max_archive_mb
+    self.batch_options = batch_options or {}
+    # Chunks stored by failed ingestions, a new upload of the same file resumes after them
+    self.checkpoints = checkpoints
 
-  def _get(self, file_path, auth) -> tuple[upl.Uploader, extr.Extractor]:  # Add `embedder: Embedder`
+  def _get(self, file_path, auth) -> tuple['upl.Uploader', 'extr.Extractor']:  # Add `embedder: Embedder`
     extractor = self.factory.get_extractor(file_path, auth)  # Add embedder
     uploader = self.factory.get_uploader(file_path, auth)
 
     return uploader, extractor
 
-  async def pipe(self, file_path: ds.Path, auth: ds.UserId) -> None:  
+  async def pipe(self, file_path: ds.Path, auth: ds.UserId, progress: 'IngestProgress | None' = None) -> 'IngestProgress':
+    from mm_rag.pipelines.ingest import IngestPipeline
+
     uploader, extractor = self._get(file_path, auth)
-    file = extractor.extract(file_path, auth)
-    await uploader.aupload(file)
+    pipeline = IngestPipeline(extractor, uploader, checkpoints=self.checkpoints, **self.ingest_options)
+
+    try:
+      return await pipeline.run(file_path, auth, progress)
+    finally:
+      # Failed runs may keep their stored chunks, and queries may have seen the others meanwhile
+      invalidate_retrievals(auth)
+
+  async def pipe_many(
+      self,
+      file_paths: list[ds.Path],
+      auth: ds.UserId,
+      progress: 'IngestProgress | None' = None
+  ) -> list[FileResult]:
+    """
+    Ingests a batch of files, `batch_options['files']` at a time, zip archives are unpacked first.
+    The extractor and the uploader of every file type are built once, and the files share
+    the VectorStore, the bucket and one thread pool.
+    A failed file does not stop the others, its error is reported in its result.
+    Empty files fail, and so do the files stored under the same name as an earlier one of the batch.
+    :param progress: the counts of every file are added to it as the file is ingested
+    :return: the result of every file, in order
+    """
+    from mm_rag.pipelines.ingest import IngestPipeline
+
+    concurrency = self.batch_options.get('files', 4)
+    semaphore = asyncio.Semaphore(concurrency)
+    vector_store = self.factory.get_vector_store(auth)
+    shared: dict[str, tuple['upl.Uploader', 'extr.Extractor']] = {}
+    threads = IngestPipeline.threads_for(**self.ingest_options)
+
+    def components(path: ds.Path) -> tuple['upl.Uploader', 'extr.Extractor']:
+      file_ext = self.factory.get_file_ext(path)
+      if file_ext not in shared:
+        shared[file_ext] = (
+          self.factory.get_uploader(path, auth, vector_store),
+          self.factory.get_extractor(path, auth)
+        )
+      return shared[file_ext]
+
+    async def ingest(
+        file_name: str,
+        path: ds.Path,
+        executor: ThreadPoolExecutor,
+        stream: tuple[ds.Metadata, Iterator[ds.Chunk]] | None
+    ) -> FileResult:
+      async with semaphore:
+        try:
+          uploader, extractor = components(path)
+
+          pipeline = IngestPipeline(extractor, uploader, checkpoints=self.checkpoints, **self.ingest_options)
+          file_progress = await pipeline.run(path, auth, executor=executor, stream=stream)
+
+        except Exception as e:
+          logger.error(f"Ingestion of {file_name} failed, going on with the batch: {e}")
+          return FileResult(file_name, 'failed', error=str(e))
+
+      if progress is not None:
+        progress.extracted += file_progress.extracted
+        progress.embedded += file_progress.embedded
+        progress.stored += file_progress.stored
+
+      return FileResult(file_name, 'succeeded', file_id=file_progress.file_id, stored=file_progress.stored)
+
+    with tempfile.TemporaryDirectory(prefix='batch-') as tmp:
+      entries = await asyncio.to_thread(self._expand, file_paths, tmp)
+      files = [entry for entry in entries if not isinstance(entry, FileResult)]
+      logger.info(f"Ingesting a batch of {len(files)} files for {auth}, {concurrency} at a time")
+      streams = await self._preprocess_images([path for _, path in files], auth, components)
+
+      executor = ThreadPoolExecutor(max_workers=concurrency * threads, thread_name_prefix='ingest-batch')
+      try:
+        results = iter(await asyncio.gather(*[
+          ingest(name, path, executor, streams.get(path)) for name, path in files
+        ]))
+      finally:
+        await asyncio.to_thread(executor.shutdown, True)
+        invalidate_retrievals(auth)
+
+    return [entry if isinstance(entry, FileResult) else next(results) for entry in entries]
+
+  async def _preprocess_images(
+      self,
+      paths: list[ds.Path],
+      auth: ds.UserId,
+      components: Callable[[ds.Path], tuple['upl.Uploader', 'extr.Extractor']]
+  ) -> dict[ds.Path, tuple[ds.Metadata, Iterator[ds.Chunk]]]:
+    """
+    Decodes and encodes the images of a batch together, in the process pool of ImgExtractor.
+    :return: the metadata and chunks of every image, by path. Empty without a pool to run them in,
+      or when one of them failed: every image is then extracted by its own pipeline, which reports its error
+    """
+    import mm_rag.pipelines.extractors as extr
+
+    extractor: 'extr.ImgExtractor | None' = None
+    images: list[ds.Path] = []
+    for path in paths:
+      try:
+        candidate = components(path)[1]
+      except Exception:
+        # Reported by the file's own pipeline
+        continue
+      if isinstance(candidate, extr.ImgExtractor):
+        extractor = extractor or candidate
+        images.append(path)
+
+    if extractor is None or extractor.preprocess_workers < 2 or len(images) < 2:
+      return {}
+
+    try:
+      streams = await asyncio.to_thread(extractor.stream_many, images, auth)
+    except Exception as e:
+      logger.warning(f"Unable to preprocess {len(images)} images together, extracting them one by one: {e}")
+      return {}
+
+    return dict(zip(images, streams))
+
+  def _expand(self, file_paths: list[ds.Path], dest: str) -> list[tuple[str, str] | FileResult]:
+    """
+    :return: in order, the name and path of every file to ingest, archives replaced by their files,
+      or the result of the files that cannot be ingested
+    """
+    from mm_rag.pipelines import utils
+
+    entries: list[tuple[str, str] | FileResult] = []
+    # `max_files` bounds the whole batch: the archives share what the other files leave
+    archives = [path for path in file_paths if self.factory.get_file_ext(path).lower() == '.zip']
+    files_left = self.batch_options.get('max_files', 1000) - (len(file_paths) - len(archives))
+    # The file id only keeps the base name, the first file of the batch is stored under it
+    stored_as: dict[str, str] = {}
+
+    def add(file_name: str, path: str) -> None:
+      base_name = os.path.basename(path)
+      if os.path.isfile(path) and os.path.getsize(path) == 0:
+        entries.append(FileResult(file_name, 'failed', error=f"Cannot upload an empty file: {file_name}"))
+      elif base_name in stored_as:
+        entries.append(FileResult(
+          file_name, 'failed', error=f"{stored_as[base_name]} is already stored as {base_name} in this batch"
+        ))
+      else:
+        stored_as[base_name] = file_name
+        entries.append((file_name, path))
+
+    for i, path in enumerate(file_paths):
+      file_name = os.path.basename(path)
+      if self.factory.get_file_ext(path).lower() != '.zip':
+        add(file_name, path)
+        continue
+
+      archive_dir = os.path.join(dest, str(i))
+      try:
+        members = utils.unpack_zip(
+          path,
+          archive_dir,
+          max_files=max(files_left, 0),
+          max_bytes=self.batch_options.get('max_archive_mb', 1024) * 1024 * 1024
+        )
+      except FileNotValidError as e:
+        logger.error(f"Unable to unpack {file_name}: {e}")
+        entries.append(FileResult(file_name, 'failed', error=str(e)))
+        continue
+
+      files_left -= len(members)
+      for member in members:
+        add(f"{file_name}/{os.path.relpath(member, archive_dir)}", member)
+
+    return entries
+
+
+def invalidate_retrievals(auth: ds.UserId) -> None:
+  """
+  Drops the cached retrievals and chat answers of the namespace, once its content changed.
+  """
+  namespace_versions.bump(auth)
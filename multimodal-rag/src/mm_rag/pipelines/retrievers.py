@@ -1,5 +1,8 @@
+import hashlib
 import json
-from typing import TYPE_CHECKING, Any
+import unicodedata
+from array import array
+from typing import TYPE_CHECKING, Any, Callable
 
 if TYPE_CHECKING:
   from mm_rag.models.dynamodb import DynamoDB
@@ -9,6 +12,8 @@ if TYPE_CHECKING:
 
 from langchain_core.callbacks.manager import CallbackManagerForRetrieverRun
 
+from mm_rag.caching import LRUCache, NamespaceVersions, namespace_versions
+from mm_rag.config.config import config
 from mm_rag.logging_service.log_config import create_logger
 from mm_rag.exceptions import MalformedResponseError
 
@@ -19,6 +24,75 @@ from langchain_core.retrievers import BaseRetriever
 logger = create_logger(__name__)
 
 
+class RetrievalCache:
+  """
+  Two-level cache in front of the Retriever:
+    normalized query text -> query embedding
+    (namespace, namespace version, query embedding, top_k) -> retrieved documents
+
+  Every upload or cleanup of a namespace bumps its version in `versions`, shared with the other caches,
+  so the results cached before are never served again and age out of the LRU.
+  Other processes are not notified, `ttl` bounds how long they may serve stale results.
+  """
+  def __init__(
+      self,
+      max_queries: int = 4096,
+      max_results: int = 4096,
+      ttl: float = 300,
+      versions: NamespaceVersions = namespace_versions
+  ) -> None:
+    # Embeddings of a given text never go stale
+    self.embeddings: LRUCache[tuple[str, str], list[float]] = LRUCache(max_entries=max_queries)
+    self.results: LRUCache[tuple[str, int, bytes, int], tuple[Document, ...]] = LRUCache(
+      max_entries=max_results, ttl=ttl
+    )
+    self.versions = versions
+
+  @staticmethod
+  def normalize(query: str) -> str:
+    return ' '.join(unicodedata.normalize('NFKC', query).split())
+
+  def embedding(self, model_id: str, query: str, embed: Callable[[str], list[float]]) -> list[float]:
+    key = (model_id, self.normalize(query))
+
+    embedding = self.embeddings.get(key)
+    if embedding is None:
+      embedding = embed(key[1])
+      self.embeddings.set(key, embedding)
+
+    return embedding
+
+  def results_key(self, namespace: str, embedding: list[float], top_k: int) -> tuple[str, int, bytes, int]:
+    """
+    The namespace version is read here, before querying, so results racing with an upload are stored
+    under the previous version.
+    """
+    digest = hashlib.blake2b(array('f', embedding).tobytes(), digest_size=16).digest()
+    return namespace, self.versions.get(namespace), digest, top_k
+
+  def invalidate(self, namespace: str) -> None:
+    self.versions.bump(namespace)
+    logger.debug(f"Invalidated the retrieval cache of {namespace}")
+
+  def clear(self) -> None:
+    self.embeddings.clear()
+    self.results.clear()
+
+
+def from_config(cache_config: dict[str, Any]) -> RetrievalCache | None:
+  if not cache_config.get('enabled', True):
+    return None
+
+  return RetrievalCache(
+    max_queries=cache_config.get('query_entries', 4096),
+    max_results=cache_config.get('result_entries', 4096),
+    ttl=cache_config.get('ttl_seconds', 300)
+  )
+
+
+retrieval_cache = from_config(config['retrieval_cache'])
+
+
 class Retriever(BaseRetriever):
   def __init__(
       self,
@@ -26,7 +100,8 @@ class Retriever(BaseRetriever):
       dynamo: 'DynamoDB',
       bucket: 'BucketService',
       embedder: 'Embedder',
-      top_k: int = 3
+      top_k: int = 3,
+      cache: RetrievalCache | None = None
   ) -> None:
     super().__init__()
     self._vector_store = vector_store
@@ -34,15 +109,43 @@ class Retriever(BaseRetriever):
     self._bucket = bucket
     self._top_k = top_k
     self._embedder = embedder
+    self._cache = cache
+
+  @property
+  def namespace(self) -> str:
+    return self._vector_store.namespace
+
+  @property
+  def model_id(self) -> str:
+    return self._embedder.model_id
+
+  def embed(self, query: str) -> list[float]:
+    if self._cache is None:
+      return self._embedder.embed_query(query)
+
+    return self._cache.embedding(self._embedder.model_id, query, self._embedder.embed_query)
 
   def retrieve(self, query: str) -> list[Document]:
     logger.debug(f'Embedding query: {query}')
-    embedded_query: list[float] = self._embedder.embed_query(query)
+    if self._cache is None:
+      return self._retrieve(self.embed(query))
 
-    retrieved = self._vector_store.index.query(
-      top_k=self._top_k,
+    embedded_query = self.embed(query)
+    key = self._cache.results_key(self._vector_store.namespace, embedded_query, self._top_k)
+
+    cached = self._cache.results.get(key)
+    if cached is not None:
+      return list(cached)
+
+    retrieved_docs = self._retrieve(embedded_query)
+    self._cache.results.set(key, tuple(retrieved_docs))
+
+    return retrieved_docs
+
+  def _retrieve(self, embedded_query: list[float]) -> list[Document]:
+    retrieved = self._vector_store.query(
       vector=embedded_query,
-      namespace=self._vector_store.namespace,
+      top_k=self._top_k,
       include_metadata=True
     )
 
@@ -1,227 +1,120 @@
 from mm_rag.models.dynamodb import DynamoDB
-from mm_rag.models.s3bucket import BucketService
+from mm_rag.models.s3bucket import BucketService, content_etag
 from mm_rag.models.vectorstore import PineconeVectorStore
 
-import asyncio
-
-from abc import ABC, abstractmethod
+import functools
+import io
 
 from botocore.exceptions import ClientError
 
-import pinecone
-
 import mm_rag.datastructures as ds
-import mm_rag.pipelines.utils as utils
 from mm_rag.logging_service.log_config import create_logger
-from mm_rag.exceptions import ObjectUpsertionError, StorageError
+from mm_rag.exceptions import BucketAccessError, ObjectDeletionError, ObjectUpsertionError, PartialUpsertionError
 
 
 logger = create_logger(__name__)
 
 
-class Uploader(ABC):
+class Uploader:
+  """
+  Store stage of the ingest pipeline: writes the embedded chunks of a file to the VectorStore,
+  and their payloads to the bucket.
+  """
   def __init__(
       self,
       dynamodb: DynamoDB,
       vector_store: PineconeVectorStore,
       bucket: BucketService,
+      max_retries: int = 2
   ) -> None:
     self.ddb = dynamodb
     self.vector_store = vector_store
     self.bucket = bucket
+    # Retries of a partially failed upsert, each resuming after the last confirmed vector
+    self.max_retries = max_retries
 
-  async def aupload(self, file: ds.File) -> None:
-    vector_store_upload_task = None
-    bucket_upload_task = None
-
-    try:
-      async with asyncio.TaskGroup() as tg:
-        logger.debug(f"Creating async upload task group")
-        vector_store_upload_task = tg.create_task(self.aupload_in_vector_store(file))
-        bucket_upload_task = tg.create_task(self.aupload_in_bucket(file))
-
-    except* ObjectUpsertionError as eg:
-      for e in eg.exceptions:
-        if type(e) == ObjectUpsertionError:
-          if e.storage == ds.Storages.BUCKET:
-            if (vector_store_upload_task
-                and vector_store_upload_task.done()
-                and not vector_store_upload_task.cancelled()
-                and not vector_store_upload_task.exception()):
-              logger.warning(
-                "Upload failed in Bucket, rolling back VectorStore upload."
-              )
-              self.vector_store.remove_object(file.metadata.file_id)
-              raise e
-
-          elif e.storage == ds.Storages.VECTORSTORE:
-            if (bucket_upload_task
-                and bucket_upload_task.done()
-                and not bucket_upload_task.cancelled()
-                and not bucket_upload_task.exception()):
-              logger.warning(
-                "Upload failed in VectorStore, rolling back Bucket upload."
-              )
-
-              self.bucket.remove_object(file.metadata.file_id)
-              raise e
-        raise e
-
-    except* Exception as eg:
-      logger.error(f"Unhandled error in exc group: {eg.exceptions}")
-      raise StorageError(
-        f"Something went wrong while upserting the file: {file.metadata.file_name}: {eg.exceptions}"
-      )
-
-  def upload(self, file: ds.File) -> None:
-    self.upload_in_vector_store(file)
-    self.upload_in_bucket(file)
-
-  @abstractmethod
-  def upload_in_vector_store(self, file: ds.File) -> bool:
+  def store_chunks(self, metadata: ds.Metadata, chunks: list[ds.Chunk]) -> int:
     """
-    This function must be implemented in order to upsert any object in the VectorStore
+    Upserts the embedded chunks and uploads the payloads that are not in the bucket yet, or whose content changed.
+    :return: the number of vectors upserted
     """
+    upserted = self._upsert(metadata, chunks)
 
-  @abstractmethod
-  def upload_in_bucket(self, file: ds.File) -> None:
-    """
-    Let the subclass define how to be upserted into the s3bucket
-    """
-
-  async def aupload_in_vector_store(self, file: ds.File):
-    try:
-      return await asyncio.to_thread(self.upload_in_vector_store, file)
-
-    except (AttributeError, ValueError, ObjectUpsertionError) as e:
-      raise ObjectUpsertionError(ds.Storages.VECTORSTORE) from e
-
-  async def aupload_in_bucket(self, file: ds.File):
-    try:
-      return await asyncio.to_thread(self.upload_in_bucket, file)
-
-    except (AttributeError, ValueError, ObjectUpsertionError) as e:
-      raise ObjectUpsertionError(ds.Storages.BUCKET) from e
-
+    payloads = [chunk for chunk in chunks if chunk.payload is not None and chunk.payload_key is not None]
+    if not payloads:
+      return upserted
 
-class TxtUploader(Uploader):
-  def upload_in_vector_store(self, file: ds.File) -> bool:
     try:
-      logger.debug(f"upserting docs of {file.metadata.file_name} to the VectorStore")
-      self.vector_store.add(file)
-
-      logger.debug("Done")
-
-    except pinecone.PineconeException as e:
-      logger.error(e)
-      raise ObjectUpsertionError(ds.Storages.VECTORSTORE) from e
-
-    return True
-
-  def upload_in_bucket(self, file: ds.File) -> None:
-    logger.debug(f"Inserting {file.metadata.file_name} in {self.bucket.name}")
-
-    try:
-      self.bucket.upload_object(
-        file.metadata.file_id, file.content
+      existing = self.bucket.existing_keys(
+        [chunk.payload_key for chunk in payloads],  # type: ignore
+        etags={chunk.payload_key: content_etag(chunk.payload) for chunk in payloads}  # type: ignore
       )
-    except ClientError as e:
+    except BucketAccessError as e:
       raise ObjectUpsertionError(ds.Storages.BUCKET) from e
 
-    logger.debug("Done")
-
-
-class ImgUploader(Uploader):
-  def __init__(self, dynamodb: DynamoDB, vector_store: PineconeVectorStore, bucket: BucketService) -> None:
-    super().__init__(dynamodb, vector_store, bucket)
-
-  def upload_in_vector_store(self, file: ds.File) -> bool:
+    to_upload = [chunk for chunk in payloads if chunk.payload_key not in existing]
+    objects = [(chunk.payload_key, functools.partial(io.BytesIO, chunk.payload)) for chunk in to_upload]
 
     try:
-      logger.debug(f'Upserting img: {file.metadata.file_name} to the VectorStore')
-      self.vector_store.add(file)
-      logger.debug(f"Done.")
-
-    except pinecone.PineconeException as e:
-      logger.error("Error wile upserting the image %s to the VectorStore: %s" % file.metadata.file_name, e)
-      raise ObjectUpsertionError(ds.Storages.VECTORSTORE) from e
-
-    return True
-
-  def upload_in_bucket(self, file: ds.File) -> None:
-    logger.debug(f"Inserting {file.metadata.file_name} in {self.bucket.name}")
-
-    img_buffer = utils.save_img_to_buffer(file.content)
-
-    try:
-      self.bucket.upload_object_from_file(
-        img_buffer,
-        file.metadata.file_id
-        )
-
+      # A failed call removes the objects it uploaded itself
+      self.bucket.upload_objects(objects)  # type: ignore
     except ClientError as e:
-      logger.error(f"Error while upserting {file.metadata.file_name} in bucket {self.bucket.name}: {e}")
+      logger.error(f"Error while upserting the payloads of {metadata.file_id} in bucket {self.bucket.name}: {e}")
       raise ObjectUpsertionError(ds.Storages.BUCKET) from e
 
-    logger.debug("Done")
+    # Only these are removed if the ingestion is rolled back, the others belong to an earlier upload
+    for chunk in to_upload:
+      chunk.payload_written = True
 
+    return upserted
 
-class PdfUploader(Uploader):
-  def __init__(self, dynamodb: DynamoDB, vector_store: PineconeVectorStore, bucket: BucketService) -> None:
-    super().__init__(dynamodb, vector_store, bucket)
+  def _upsert(self, metadata: ds.Metadata, chunks: list[ds.Chunk]) -> int:
+    start = 0
 
-  def upload_in_vector_store(self, file: ds.File) -> bool:
-    for i in range(len(file.content)):
-      page_id = file.docs[i].id
+    for attempt in range(self.max_retries + 1):
+      try:
+        return start + self.vector_store.add_chunks(chunks[start:], metadata.collection)
 
-      if not page_id:
-        raise ValueError(
-          f"In order to upload the given PdfFile to the VectorStore, "
-          f"please provide valid ids in `docs`"
+      except PartialUpsertionError as e:
+        start += e.confirmed
+        logger.warning(
+          f"Upsert of {metadata.file_id} failed after {start}/{len(chunks)} vectors of the batch "
+          f"(attempt {attempt + 1}/{self.max_retries + 1}): {e}"
         )
+        if attempt == self.max_retries:
+          raise
 
-      try:
-        logger.debug(f"Upserting {file.metadata.file_id} to the VectorStore")
-        self.vector_store.add(file)
-        logger.debug(f"Done.")
-
-      except pinecone.PineconeException as e:
-        logger.error("Error wile upserting the pdf page %d %s to the VectorStore: %s" % i, file.metadata.file_name, e)
-        raise ObjectUpsertionError(ds.Storages.VECTORSTORE) from e
+    return start
 
-    logger.debug(f"All pages upserted.")
-    return True
+  def rollback(self, metadata: ds.Metadata, chunks: list[ds.Chunk]) -> None:
+    """
+    Best effort removal of everything `store_chunks` wrote for the given chunks.
+    """
+    ids = [chunk.doc.id for chunk in chunks if chunk.doc.id]
+    keys = [chunk.payload_key for chunk in chunks if chunk.payload_key and chunk.payload_written]
+    logger.warning(f"Rolling back {len(ids)} vectors and {len(keys)} objects of {metadata.file_id}")
 
-  def upload_in_bucket(self, file: ds.File) -> None:
-    logger.debug(f"Inserting {file.metadata.file_name} in {self.bucket.name}")
+    if ids:
+      try:
+        self.vector_store.remove_objects(ids, metadata.collection)
+      except ObjectDeletionError as e:
+        logger.error(f"Unable to roll back the vectors of {metadata.file_id}: {e}")
+    if keys:
+      self.bucket.remove_object(keys)
 
-    if not file.docs:
-      raise AttributeError(
-        f"In order to upload PdfFile to the Bucket, please pass over the docs"
-      )
 
-    for i, page in enumerate(file.content):
-      page_id = file.docs[i].id
+# The uploaders of every file type share the store stage, they are kept apart for the type-specific writes to come
+class TxtUploader(Uploader):
+  pass
 
-      if not page_id:
-        raise ValueError(
-          f"In order to upload the given PdfFile to the VectorStore, "
-          f"please provide valid ids in `docs`. Found doc {i+1} without id:\n{file.docs[i]}"
-        )
 
-      page_buffer = utils.save_img_to_buffer(page)
+class ImgUploader(Uploader):
+  pass
 
-      try:
-        self.bucket.upload_object_from_file(
-          page_buffer,
-          page_id
-        )
-      except ClientError as e:
-        logger.error(f"Error while upserting {file.metadata.file_name} in bucket {self.bucket.name}: {e}")
-        raise ObjectUpsertionError(ds.Storages.BUCKET) from e
 
-      logger.debug("Done")
+class PdfUploader(Uploader):
+  pass
 
 
 class CodeUploader(TxtUploader):
-  pass
\ No newline at end of file
+  pass
@@ -1,9 +1,13 @@
-from mm_rag.api.utils import authorize
+from mm_rag.api.utils import aauthorize, authorize, auth_cache
 from mm_rag.models.dynamodb import DynamoDB
 from mm_rag.exceptions import MissingItemError
 
 from fastapi import HTTPException
 
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import hashlib
+import threading
 from unittest.mock import MagicMock, patch
 
 import unittest
@@ -11,6 +15,7 @@ import unittest
 
 class TestAuth(unittest.TestCase):
   def setUp(self):
+    auth_cache.clear()
     self.mock_ddb = MagicMock(DynamoDB)
     self.test_pat = 'testPAT'
     self.test_id = 'testId'
@@ -54,5 +59,103 @@ class TestAuth(unittest.TestCase):
         with self.assertRaises(HTTPException):
           authorize(self.mock_ddb, 'whatever')
 
+
+class TestAuthCache(unittest.TestCase):
+  def setUp(self):
+    auth_cache.clear()
+    self.mock_ddb = MagicMock(DynamoDB)
+    self.mock_ddb.query_with_gsi.return_value = [{'userId': 'testId', 'PAT': 'testPAT'}]
+    self.token_hash = hashlib.sha256('testPAT'.encode()).hexdigest()
+
+  def tearDown(self):
+    auth_cache.clear()
+
+  def test_repeated_calls_query_once(self):
+    for _ in range(3):
+      self.assertEqual(authorize(self.mock_ddb, 'testPAT').user_id, 'testId')
+
+    self.mock_ddb.query_with_gsi.assert_called_once()
+
+  def test_unknown_token_is_cached(self):
+    self.mock_ddb.query_with_gsi.side_effect = MissingItemError
+
+    for _ in range(2):
+      with self.assertRaises(HTTPException) as ctx:
+        authorize(self.mock_ddb, 'unknown')
+      self.assertEqual(ctx.exception.status_code, 403)
+
+    self.mock_ddb.query_with_gsi.assert_called_once()
+
+  def test_malformed_user_is_not_cached(self):
+    self.mock_ddb.query_with_gsi.return_value = [{'userId': 'testId'}]
+
+    for _ in range(2):
+      with self.assertRaises(HTTPException):
+        authorize(self.mock_ddb, 'testPAT')
+
+    self.assertEqual(self.mock_ddb.query_with_gsi.call_count, 2)
+
+  def test_concurrent_lookups_are_deduplicated(self):
+    release = threading.Event()
+
+    def slow_query(**kwargs):
+      release.wait(5)
+      return [{'userId': 'testId', 'PAT': 'testPAT'}]
+
+    self.mock_ddb.query_with_gsi.side_effect = slow_query
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+      futures = [pool.submit(authorize, self.mock_ddb, 'testPAT') for _ in range(4)]
+      # Lets every thread reach the cache before the query returns
+      threading.Event().wait(0.1)
+      release.set()
+      users = [future.result() for future in futures]
+
+    self.assertEqual({user.user_id for user in users}, {'testId'})
+    self.mock_ddb.query_with_gsi.assert_called_once()
+
+  def test_pat_changes_invalidate_the_cache(self):
+    authorize(self.mock_ddb, 'testPAT')
+
+    with patch('mm_rag.models.dynamodb.boto3'):
+      ddb = DynamoDB()
+    ddb._tables['users'] = MagicMock()
+
+    ddb.delete_item_from_table('users', {'userId': 'testId', 'PAT': self.token_hash})
+    self.mock_ddb.query_with_gsi.side_effect = MissingItemError
+
+    with self.assertRaises(HTTPException):
+      authorize(self.mock_ddb, 'testPAT')
+
+    ddb.add_user('users', self.token_hash, 'testId')
+    self.mock_ddb.query_with_gsi.side_effect = None
+
+    self.assertEqual(authorize(self.mock_ddb, 'testPAT').user_id, 'testId')
+    self.assertEqual(self.mock_ddb.query_with_gsi.call_count, 3)
+
+
+class TestAsyncAuth(unittest.IsolatedAsyncioTestCase):
+  def setUp(self):
+    auth_cache.clear()
+    self.mock_ddb = MagicMock(DynamoDB)
+
+  async def test_lookup_does_not_block_the_event_loop(self):
+    release = threading.Event()
+
+    def slow_query(**kwargs):
+      release.wait(5)
+      return [{'userId': 'testId', 'PAT': 'testPAT'}]
+
+    self.mock_ddb.query_with_gsi.side_effect = slow_query
+    lookup = asyncio.create_task(aauthorize(self.mock_ddb, 'testPAT'))
+
+    # The loop keeps running while the query is pending
+    await asyncio.sleep(0.05)
+    self.assertFalse(lookup.done())
+    release.set()
+
+    self.assertEqual((await lookup).user_id, 'testId')
+
+
 if __name__ == "__main__":
   unittest.main()
\ No newline at end of file
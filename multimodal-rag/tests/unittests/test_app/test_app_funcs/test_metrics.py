@@ -0,0 +1,50 @@
+from mm_rag.api.routes import metrics
+from mm_rag.agents.chatbot_flow.semantic_cache import SemanticCache
+from mm_rag.agents.chatbot_flow.pre_classifier import Decision, PreClassifier
+from mm_rag.caching import NamespaceVersions
+
+import json
+from unittest.mock import MagicMock, patch
+
+import unittest
+
+
+class TestMetrics(unittest.TestCase):
+  def get_metrics(self) -> dict:
+    with patch.object(metrics, 'authorize') as mock_authorize:
+      response = metrics.get_metrics(MagicMock())
+
+    mock_authorize.assert_called_once()
+    return json.loads(response.body)
+
+  def test_reports_the_chat_cache(self):
+    cache = SemanticCache(versions=NamespaceVersions())
+    cache.set('user1', [1.0, 0.0], 'Apples are red')
+    cache.get('user1', [1.0, 0.0])
+
+    with patch.object(metrics, 'chat_cache', cache):
+      body = self.get_metrics()
+
+    self.assertEqual(body['chat_cache']['hits'], 1)
+    self.assertEqual(body['chat_cache']['entries'], 1)
+
+  def test_reports_the_pre_classifier(self):
+    classifier = PreClassifier(exemplars=[])
+    classifier.record(Decision(False, 'rules'))
+    classifier.record(Decision(True, 'vlm'))
+
+    with patch('mm_rag.agents.chatbot_flow.pre_classifier.pre_classifier', classifier):
+      body = self.get_metrics()
+
+    self.assertEqual(body['pre_classifier'], {'decisions': {'rules': 1, 'vlm': 1}, 'local_rate': 0.5})
+
+  def test_disabled_components_are_null(self):
+    with patch.object(metrics, 'chat_cache', None), patch('mm_rag.agents.chatbot_flow.pre_classifier.pre_classifier', None):
+      body = self.get_metrics()
+
+    self.assertIsNone(body['chat_cache'])
+    self.assertIsNone(body['pre_classifier'])
+
+
+if __name__ == "__main__":
+  unittest.main()
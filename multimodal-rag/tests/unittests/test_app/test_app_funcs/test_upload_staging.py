@@ -0,0 +1,141 @@
+from mm_rag.api.utils import check_background_jobs, stage_upload, UploadDeduplicator
+from mm_rag.exceptions import FileNotValidError, UploadTooLargeError
+
+from fastapi import HTTPException, UploadFile
+
+import asyncio
+import hashlib
+import io
+import os
+from unittest.mock import AsyncMock, patch
+
+import unittest
+
+
+def make_upload(content: bytes, filename: str = 'test.txt', size: int | None = None) -> UploadFile:
+  return UploadFile(io.BytesIO(content), filename=filename, size=size)
+
+
+class TestStageUpload(unittest.IsolatedAsyncioTestCase):
+  async def test_streams_to_a_private_copy(self):
+    content = b'x' * 10_000
+    upload = make_upload(content)
+
+    with patch.object(upload, 'read', wraps=upload.read) as read:
+      async with stage_upload(upload, max_bytes=20_000, chunk_bytes=4096) as staged:
+        self.assertEqual(os.path.basename(staged.path), 'test.txt')
+        with open(staged.path, 'rb') as f:
+          self.assertEqual(f.read(), content)
+
+    self.assertEqual(staged.size, len(content))
+    self.assertEqual(staged.sha256, hashlib.sha256(content).hexdigest())
+    # 3 chunks and the final empty read
+    self.assertEqual(read.call_count, 4)
+    self.assertFalse(os.path.exists(os.path.dirname(staged.path)))
+
+  async def test_concurrent_uploads_of_the_same_name_do_not_collide(self):
+    async with stage_upload(make_upload(b'first'), max_bytes=100) as first:
+      async with stage_upload(make_upload(b'second'), max_bytes=100) as second:
+        self.assertNotEqual(first.path, second.path)
+        with open(first.path, 'rb') as f:
+          self.assertEqual(f.read(), b'first')
+
+  async def test_too_large_upload_is_rejected_while_streaming(self):
+    upload = make_upload(b'x' * 10_000)
+
+    with self.assertRaises(UploadTooLargeError):
+      async with stage_upload(upload, max_bytes=5000, chunk_bytes=1024):
+        self.fail("The upload should not be staged")
+
+    # Rejected at the first chunk past the limit, the rest is never read
+    self.assertLess(upload.file.tell(), 10_000)
+
+  async def test_declared_size_is_rejected_upfront(self):
+    upload = make_upload(b'x', size=10_000)
+
+    with patch.object(upload, 'read') as read:
+      with self.assertRaises(UploadTooLargeError):
+        async with stage_upload(upload, max_bytes=5000):
+          pass
+
+    read.assert_not_called()
+
+  async def test_client_path_is_stripped(self):
+    async with stage_upload(make_upload(b'x', filename='../../etc/passwd'), max_bytes=100) as staged:
+      self.assertEqual(os.path.basename(staged.path), 'passwd')
+      self.assertTrue(staged.path.startswith('/tmp/upload-'))
+
+    with self.assertRaises(FileNotValidError):
+      async with stage_upload(make_upload(b'x', filename='../'), max_bytes=100):
+        pass
+
+
+class TestUploadDeduplicator(unittest.IsolatedAsyncioTestCase):
+  def setUp(self):
+    self.dedup = UploadDeduplicator(ttl=60)
+    self.key = ('user', 'test.txt', 'hash')
+
+  async def test_repeated_upload_is_skipped(self):
+    ingest = AsyncMock()
+
+    self.assertTrue(await self.dedup.run(self.key, ingest))
+    self.assertFalse(await self.dedup.run(self.key, ingest))
+    ingest.assert_awaited_once()
+
+  async def test_concurrent_uploads_share_one_ingestion(self):
+    calls = 0
+
+    async def ingest():
+      nonlocal calls
+      calls += 1
+      await asyncio.sleep(0.01)
+
+    results = await asyncio.gather(*[self.dedup.run(self.key, ingest) for _ in range(5)])
+
+    self.assertEqual(calls, 1)
+    self.assertEqual(sorted(results), [False] * 4 + [True])
+
+  async def test_failed_upload_is_not_remembered(self):
+    ingest = AsyncMock(side_effect=[ValueError, None])
+
+    with self.assertRaises(ValueError):
+      await self.dedup.run(self.key, ingest)
+
+    self.assertTrue(await self.dedup.run(self.key, ingest))
+
+  async def test_clear_forgets_uploads(self):
+    ingest = AsyncMock()
+    await self.dedup.run(self.key, ingest)
+
+    self.dedup.clear('user')
+
+    self.assertTrue(await self.dedup.run(self.key, ingest))
+
+  async def test_clear_keeps_other_users_uploads(self):
+    ingest = AsyncMock()
+    other = ('other', 'test.txt', 'hash')
+    await self.dedup.run(self.key, ingest)
+    await self.dedup.run(other, ingest)
+
+    self.dedup.clear('user')
+
+    self.assertFalse(await self.dedup.run(other, ingest))
+    self.assertTrue(await self.dedup.run(self.key, ingest))
+
+
+class TestBackgroundJobs(unittest.TestCase):
+  def test_refused_where_the_queue_cannot_run(self):
+    with patch.dict('mm_rag.api.utils.config', {'jobs': {'enabled': False}}):
+      with self.assertRaises(HTTPException) as cm:
+        check_background_jobs(True)
+      check_background_jobs(False)
+
+    self.assertEqual(cm.exception.status_code, 501)
+
+  def test_accepted_otherwise(self):
+    with patch.dict('mm_rag.api.utils.config', {'jobs': {'enabled': True}}):
+      check_background_jobs(True)
+
+
+if __name__ == "__main__":
+  unittest.main()
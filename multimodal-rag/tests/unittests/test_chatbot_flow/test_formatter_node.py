@@ -150,6 +150,31 @@ class TestMessageCreation(unittest.TestCase):
 
     self.assertDictEqual(formatted, expected_message_format)
 
+  def test_pdf_text_chunk_message_creation(self):
+    mock_bucket = MagicMock(BucketService)
+
+    mock_state = {
+      'retrieved': [
+        Document(
+          page_content='text layer of page 1',
+          id='123/chunk1.1',
+          metadata={"fileType": "pdf", "modality": "text"}
+        )
+      ],
+      'retriever': MagicMock(),
+      'vlm': MagicMock(),
+      'is_retrieval_required': 'True',
+      'bucket': mock_bucket,
+    }
+
+    formatted = formatter.formatter(mock_state)  # type: ignore
+
+    self.assertEqual(
+      formatted['messages'][0]['content'][1],
+      {"type": "text", "text": "text layer of page 1"}
+    )
+    mock_bucket.generate_presigned_url.assert_not_called()
+
   def test_missing_retrieval(self):
     mock_state = {
       'retrieved': None,
@@ -0,0 +1,88 @@
+from mm_rag.agents.chatbot_flow.pre_classifier import EXEMPLARS, PreClassifier
+from mm_rag.agents.chatbot_flow.input_classifier import classify_input
+from mm_rag.pipelines.retrievers import Retriever
+
+import unittest
+from unittest.mock import MagicMock, patch
+
+
+exemplars = [
+  ("What did the authors conclude?", True),
+  ("What is the capital of France?", False),
+]
+
+embeddings = {
+  "What did the authors conclude?": [1.0, 0.0],
+  "What is the capital of France?": [0.0, 1.0],
+  "What did they conclude?": [0.95, 0.05],
+  "What is the capital of Spain?": [0.1, 0.9],
+  "Something in between": [1.0, 1.0],
+}
+
+
+class TestPreClassifier(unittest.TestCase):
+  def setUp(self) -> None:
+    self.classifier = PreClassifier(exemplars=exemplars, min_similarity=0.8, min_margin=0.1)
+    self.retriever = MagicMock(Retriever)
+    self.retriever.model_id = 'model'
+    self.retriever.embed.side_effect = embeddings.__getitem__
+
+  def test_exemplars_come_from_the_classifier_prompt(self):
+    self.assertEqual(len(EXEMPLARS), 6)
+    self.assertIn(("What is the capital of France?", False), EXEMPLARS)
+    self.assertIn(("Explain the results shown in Figure 2 of the uploaded document.", True), EXEMPLARS)
+
+  def test_rules_decide_without_embedding(self):
+    greeting = self.classifier.classify("Hello there!", self.retriever)
+    own_content = self.classifier.classify("Summarize my documents please", self.retriever)
+
+    self.assertEqual((greeting.is_retrieval_required, greeting.source), (False, 'rules'))
+    self.assertEqual((own_content.is_retrieval_required, own_content.source), (True, 'rules'))
+    self.retriever.embed.assert_not_called()
+
+  def test_closest_exemplar_decides(self):
+    needs_retrieval = self.classifier.classify("What did they conclude?", self.retriever)
+    self_contained = self.classifier.classify("What is the capital of Spain?", self.retriever)
+
+    self.assertEqual((needs_retrieval.is_retrieval_required, needs_retrieval.source), (True, 'exemplars'))
+    self.assertFalse(self_contained.is_retrieval_required)
+    # The exemplars are only embedded once
+    self.assertEqual(self.retriever.embed.call_count, 4)
+
+  def test_low_confidence_is_left_to_the_vlm(self):
+    self.assertIsNone(self.classifier.classify("Something in between", self.retriever))
+    self.assertIsNone(self.classifier.classify("Something in between"))
+
+  def test_embedding_failure_is_left_to_the_vlm(self):
+    self.retriever.embed.side_effect = RuntimeError("throttled")
+
+    self.assertIsNone(self.classifier.classify("What did they conclude?", self.retriever))
+
+
+class TestClassifyInputWithPreClassifier(unittest.TestCase):
+  def test_local_decision_skips_the_vlm(self):
+    classifier = PreClassifier(exemplars=exemplars)
+    vlm = MagicMock()
+
+    with patch('mm_rag.agents.chatbot_flow.input_classifier.pre_classifier', classifier):
+      result = classify_input({'query': "Thanks!", 'vlm': vlm})
+
+    self.assertEqual(result, {'is_retrieval_required': False, 'query': "Thanks!"})
+    vlm.invoke.assert_not_called()
+    self.assertEqual(classifier.metrics(), {'decisions': {'rules': 1}, 'local_rate': 1.0})
+
+  @patch("mm_rag.agents.chatbot_flow.input_classifier.classifier_prompt")
+  @patch("mm_rag.agents.chatbot_flow.input_classifier.validate_response")
+  def test_vlm_decisions_are_recorded(self, mock_validate, mock_prompt):
+    classifier = PreClassifier(exemplars=exemplars)
+    mock_validate.return_value.is_retrieval_required = True
+
+    with patch('mm_rag.agents.chatbot_flow.input_classifier.pre_classifier', classifier):
+      classify_input({'query': "Something in between", 'vlm': MagicMock()})
+      classify_input({'query': "Hi", 'vlm': MagicMock()})
+
+    self.assertEqual(classifier.metrics(), {'decisions': {'vlm': 1, 'rules': 1}, 'local_rate': 0.5})
+
+
+if __name__ == "__main__":
+  unittest.main()
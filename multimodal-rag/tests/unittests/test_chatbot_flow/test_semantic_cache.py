@@ -0,0 +1,110 @@
+from mm_rag.agents.chatbot_flow import run_chatbot
+from mm_rag.agents.chatbot_flow.semantic_cache import SemanticCache, from_config
+from mm_rag.caching import NamespaceVersions
+from mm_rag.pipelines.retrievers import Retriever
+
+import unittest
+from unittest.mock import MagicMock, patch
+
+
+class TestSemanticCache(unittest.TestCase):
+  def setUp(self) -> None:
+    self.now = 0.0
+    self.versions = NamespaceVersions()
+    self.cache = SemanticCache(
+      max_entries=3,
+      max_distance=0.05,
+      ttl=60,
+      versions=self.versions,
+      clock=lambda: self.now
+    )
+
+  def test_close_query_is_a_hit(self):
+    self.cache.set('user1', [1.0, 0.0, 0.0], 'Apples are red')
+
+    # Scale does not matter, the distance is a cosine one
+    self.assertEqual(self.cache.get('user1', [2.0, 0.1, 0.0]), 'Apples are red')
+    self.assertIsNone(self.cache.get('user1', [0.6, 0.8, 0.0]))
+
+  def test_namespaces_are_isolated(self):
+    self.cache.set('user1', [1.0, 0.0], 'Apples are red')
+
+    self.assertIsNone(self.cache.get('user2', [1.0, 0.0]))
+
+  def test_new_version_invalidates_the_answers(self):
+    self.cache.set('user1', [1.0, 0.0], 'Apples are red')
+    self.cache.set('user2', [1.0, 0.0], 'Pears are green')
+
+    self.versions.bump('user1')
+
+    self.assertIsNone(self.cache.get('user1', [1.0, 0.0]))
+    self.assertEqual(self.cache.get('user2', [1.0, 0.0]), 'Pears are green')
+    self.assertEqual(len(self.cache), 1)
+
+  def test_answers_expire(self):
+    self.cache.set('user1', [1.0, 0.0], 'Apples are red')
+    self.now = 61
+
+    self.assertIsNone(self.cache.get('user1', [1.0, 0.0]))
+
+  def test_least_recently_used_is_evicted(self):
+    self.cache.set('user1', [1.0, 0.0, 0.0], 'x')
+    self.cache.set('user1', [0.0, 1.0, 0.0], 'y')
+    self.cache.set('user2', [0.0, 0.0, 1.0], 'z')
+    self.cache.get('user1', [1.0, 0.0, 0.0])
+
+    self.cache.set('user2', [1.0, 1.0, 0.0], 'w')
+
+    self.assertIsNone(self.cache.get('user1', [0.0, 1.0, 0.0]))
+    self.assertEqual(self.cache.get('user1', [1.0, 0.0, 0.0]), 'x')
+    self.assertEqual(self.cache.stats.evictions, 1)
+
+  def test_hit_rate(self):
+    self.cache.set('user1', [1.0, 0.0], 'x')
+    self.cache.get('user1', [1.0, 0.0])
+    self.cache.get('user1', [0.0, 1.0])
+
+    metrics = self.cache.metrics()
+    self.assertEqual((metrics['hits'], metrics['misses']), (1, 1))
+    self.assertEqual(metrics['hit_rate'], 0.5)
+
+  def test_from_config(self):
+    self.assertIsNone(from_config({'enabled': False}))
+    self.assertEqual(from_config({'max_distance': 0.1}).max_distance, 0.1)
+
+
+class TestRunChatbotWithCache(unittest.TestCase):
+  def setUp(self) -> None:
+    self.versions = NamespaceVersions()
+    self.cache = SemanticCache(versions=self.versions)
+    self.retriever = MagicMock(Retriever)
+    self.retriever.namespace = 'user1'
+    self.retriever.embed.return_value = [0.3, 0.4]
+
+  def run_chatbot(self, graph: MagicMock):
+    with patch('mm_rag.agents.chatbot_flow.get_graph', return_value=graph):
+      return run_chatbot('What color are apples?', self.retriever, MagicMock(), MagicMock(), cache=self.cache)
+
+  def test_hit_skips_the_graph(self):
+    graph = MagicMock()
+    graph.invoke.return_value = {'messages': [MagicMock(content='Red')]}
+
+    self.assertEqual(self.run_chatbot(graph), 'Red')
+    self.assertEqual(self.run_chatbot(graph), 'Red')
+    graph.invoke.assert_called_once()
+
+  def test_upload_during_the_answer_is_not_cached(self):
+    graph = MagicMock()
+
+    def answer(state):
+      self.versions.bump('user1')
+      return {'messages': [MagicMock(content='Red')]}
+    graph.invoke.side_effect = answer
+
+    self.run_chatbot(graph)
+    self.run_chatbot(graph)
+    self.assertEqual(graph.invoke.call_count, 2)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -1,6 +1,8 @@
 import base64
 import json
 import os
+import threading
+import time
 from mm_rag.agents.mm_embedder import Embedder
 
 import unittest
@@ -71,10 +73,66 @@ class TestEmbedder(unittest.TestCase):
       self.embedder.embed_documents(self.txt_content)
 
       self.assertEqual(mock_txt_embed.call_count, len(self.txt_content))
-      mock_txt_embed.assert_has_calls(excepcted_calls)
+      # Calls run concurrently, so only the set of calls is guaranteed
+      mock_txt_embed.assert_has_calls(excepcted_calls, any_order=True)
 
     with self.assertRaises(ValueError):
       self.embedder.embed_documents(1)  # type: ignore[Invalid type]
 
+
+class TestBatchedEmbedder(unittest.IsolatedAsyncioTestCase):
+  def setUp(self):
+    self.embedder = Embedder(max_concurrency=3, batch_size=4)
+    self.texts = [f'text {i}' for i in range(10)]
+    self.in_flight = 0
+    self.max_in_flight = 0
+    self.lock = threading.Lock()
+
+  def fake_embed(self, text: str) -> list[float]:
+    with self.lock:
+      self.in_flight += 1
+      self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    # Later inputs finish first, to make sure the order does not depend on completion
+    time.sleep(0.001 * (10 - int(text.split()[-1])))
+
+    with self.lock:
+      self.in_flight -= 1
+    return [float(text.split()[-1])]
+
+  def test_embed_documents_preserves_order(self):
+    with patch.object(self.embedder, 'embed_query', side_effect=self.fake_embed):
+      result = self.embedder.embed_documents(self.texts)
+
+    self.assertEqual(result, [[float(i)] for i in range(10)])
+
+  def test_embed_documents_bounded_concurrency(self):
+    with patch.object(self.embedder, 'embed_query', side_effect=self.fake_embed):
+      self.embedder.embed_documents(self.texts)
+
+    self.assertLessEqual(self.max_in_flight, 3)
+
+  def test_embed_imgs_uses_embed_img(self):
+    with patch.object(self.embedder, 'embed_img', side_effect=self.fake_embed) as mock_img_embed:
+      result = self.embedder.embed_imgs(self.texts)
+
+    self.assertEqual(mock_img_embed.call_count, len(self.texts))
+    self.assertEqual(result, [[float(i)] for i in range(10)])
+
+  async def test_aembed_documents(self):
+    with patch.object(self.embedder, 'embed_query', side_effect=self.fake_embed):
+      result = await self.embedder.aembed_documents(self.texts)
+
+    self.assertEqual(result, [[float(i)] for i in range(10)])
+    self.assertLessEqual(self.max_in_flight, 3)
+
+  async def test_aembed_documents_invalid_input(self):
+    with self.assertRaises(ValueError):
+      await self.embedder.aembed_documents('not a list')  # type: ignore[arg-type]
+
+  def test_invalid_limits_raise(self):
+    with self.assertRaises(ValueError):
+      Embedder(max_concurrency=0)
+
 if __name__ == "__main__":
   unittest.main()
\ No newline at end of file
@@ -0,0 +1,167 @@
+import json
+import os
+import tempfile
+from array import array
+from mm_rag.agents.embedding_cache import (
+  EmbeddingCache,
+  SQLiteCacheBackend,
+  DynamoDBCacheBackend,
+  from_config
+)
+from mm_rag.agents.mm_embedder import Embedder
+from mm_rag.caching import LRUCache
+from mm_rag.models.dynamodb import DynamoDB
+
+import unittest
+from unittest.mock import MagicMock, patch
+
+
+class TestLRUCache(unittest.TestCase):
+  def test_evicts_least_recently_used(self):
+    cache: LRUCache[str, int] = LRUCache(max_entries=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+
+    self.assertIn('a', cache)
+    self.assertNotIn('b', cache)
+    self.assertEqual(cache.stats.evictions, 1)
+
+  def test_evicts_by_size(self):
+    cache: LRUCache[str, bytes] = LRUCache(max_entries=100, max_bytes=10, sizeof=lambda k, v: len(v))
+    cache.set('a', b'12345')
+    cache.set('b', b'12345')
+    cache.set('c', b'1')
+
+    self.assertNotIn('a', cache)
+    self.assertEqual(cache.size, 6)
+
+  def test_hit_and_miss_counters(self):
+    cache: LRUCache[str, int] = LRUCache()
+    cache.set('a', 1)
+    cache.get('a')
+    cache.get('missing')
+
+    self.assertEqual(cache.stats.hits, 1)
+    self.assertEqual(cache.stats.misses, 1)
+    self.assertEqual(cache.stats.hit_rate, 0.5)
+
+  def test_entries_expire_after_ttl(self):
+    now = [0.0]
+    cache: LRUCache[str, int] = LRUCache(ttl=10, clock=lambda: now[0])
+    cache.set('a', 1)
+    cache.set('b', 2, ttl=1)
+
+    now[0] = 5
+    self.assertEqual(cache.get('a'), 1)
+    self.assertIsNone(cache.get('b'))
+
+    now[0] = 10
+    self.assertIsNone(cache.get('a'))
+    self.assertEqual(len(cache), 0)
+
+
+class TestEmbeddingCache(unittest.TestCase):
+  def setUp(self):
+    self.tmp_dir = tempfile.TemporaryDirectory()
+    self.sqlite_path = os.path.join(self.tmp_dir.name, 'cache.sqlite')
+
+  def tearDown(self):
+    self.tmp_dir.cleanup()
+
+  def test_key_depends_on_model_kind_and_content(self):
+    key = EmbeddingCache.key('model', 'text', 'hello')
+
+    self.assertEqual(key, EmbeddingCache.key('model', 'text', 'hello'))
+    self.assertNotEqual(key, EmbeddingCache.key('other-model', 'text', 'hello'))
+    self.assertNotEqual(key, EmbeddingCache.key('model', 'image', 'hello'))
+    self.assertNotEqual(key, EmbeddingCache.key('model', 'text', 'hello!'))
+
+  def test_memory_roundtrip(self):
+    cache = EmbeddingCache()
+    cache.set('key', [0.5, 0.25])
+
+    self.assertEqual(cache.get('key'), [0.5, 0.25])
+    self.assertEqual(cache.stats()['memory_hits'], 1)
+
+  def test_persistent_tier_is_promoted(self):
+    persistent = SQLiteCacheBackend(self.sqlite_path)
+    EmbeddingCache(persistent=persistent).set('key', [0.5, 0.25])
+
+    # A fresh cache only shares the persistent tier
+    cache = EmbeddingCache(persistent=persistent)
+    self.assertEqual(cache.get('key'), [0.5, 0.25])
+    self.assertIn('key', cache.memory)
+    self.assertEqual(cache.stats()['persistent_hits'], 1)
+
+  def test_sqlite_size_based_eviction(self):
+    backend = SQLiteCacheBackend(self.sqlite_path, max_entries=10)
+    for i in range(15):
+      backend.set(f'key{i}', b'value')
+
+    self.assertLessEqual(len(backend), 10)
+    self.assertIsNone(backend.get('key0'))
+    self.assertEqual(backend.get('key14'), b'value')
+
+  def test_dynamodb_backend(self):
+    mock_ddb = MagicMock(DynamoDB)
+    table = mock_ddb.table.return_value
+    backend = DynamoDBCacheBackend(mock_ddb)
+    packed = array('f', [0.5]).tobytes()
+
+    backend.set('key', packed)
+    stored = table.put_item.call_args.kwargs['Item']
+    self.assertEqual(stored['cacheKey'], 'key')
+    self.assertEqual(stored['embedding'], packed)
+
+    table.get_item.return_value = {'Item': {'embedding': packed}}
+    self.assertEqual(backend.get('key'), packed)
+
+    table.get_item.return_value = {}
+    self.assertIsNone(backend.get('missing'))
+    self.assertEqual((backend.hits, backend.misses), (1, 1))
+    # The table is checked once, not on every access
+    mock_ddb.table.assert_called_once_with('embedding_cache')
+
+  def test_from_config(self):
+    self.assertIsNone(from_config({'enabled': False}))
+    self.assertIsNone(from_config({'backend': None}).persistent)  # type: ignore[union-attr]
+    with self.assertRaises(ValueError):
+      from_config({'backend': 'dynamodb'})
+    with self.assertRaises(ValueError):
+      from_config({'backend': 'unknown'})
+
+
+class TestCachedEmbedder(unittest.TestCase):
+  def setUp(self):
+    self.embedder = Embedder(cache=EmbeddingCache())
+    mock_body = MagicMock()
+    mock_body.read.side_effect = lambda: json.dumps({'embedding': [0.5, 0.25]})
+    self.mock_response = {'body': mock_body}
+
+  def test_repeated_query_hits_cache(self):
+    with patch.object(self.embedder.client, 'invoke_model', return_value=self.mock_response) as mock_invoke:
+      first = self.embedder.embed_query('hello')
+      second = self.embedder.embed_query('hello')
+
+    self.assertEqual(first, second)
+    mock_invoke.assert_called_once()
+
+  def test_text_and_image_do_not_collide(self):
+    with patch.object(self.embedder.client, 'invoke_model', return_value=self.mock_response) as mock_invoke:
+      self.embedder.embed_query('payload')
+      self.embedder.embed_img('payload')
+
+    self.assertEqual(mock_invoke.call_count, 2)
+
+  def test_repeated_documents_hit_cache(self):
+    with patch.object(self.embedder.client, 'invoke_model', return_value=self.mock_response) as mock_invoke:
+      self.embedder.embed_documents(['a', 'b'])
+      self.embedder.embed_documents(['a', 'b'])
+
+    self.assertEqual(mock_invoke.call_count, 2)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -11,6 +11,7 @@ from mm_rag.pipelines.extractors import (
     ImageTooBigError
 )
 import mm_rag.datastructures as ds
+import mm_rag.pipelines.utils as utils
 
 class DummyMetadata(ds.Metadata):
     def __init__(self):
@@ -45,6 +46,91 @@ class TestImgExtractor(unittest.TestCase):
             docs = self.extractor._extract_docs(img, self.metadata)
             self.assertTrue(all(isinstance(doc, Document) for doc in docs))
 
+    def test_stream_encodes_image_once(self):
+        img = Image.new("RGB", (10, 10))
+        with patch.object(self.extractor, "_extract_content", return_value=img), \
+             patch("mm_rag.pipelines.extractors.validate_path", side_effect=lambda p: p), \
+             patch.object(self.extractor, "_extract_metadata", return_value=self.metadata), \
+             patch("mm_rag.pipelines.utils.encode_img", wraps=utils.encode_img) as encode:
+            _, chunks = self.extractor.stream("img.png", "user1")
+            chunk = self.extractor.embed_chunk(next(chunks))
+
+        encode.assert_called_once()
+        self.assertIs(chunk.payload, chunk.image.data)
+        self.assertEqual(chunk.payload_key, self.metadata.file_id)
+        self.extractor.embedding_func.assert_called_once_with(chunk.image.base64)
+
+    def test_extract_returns_encoded_image(self):
+        img = Image.new("RGB", (10, 10))
+        with patch.object(self.extractor, "_extract_content", return_value=img), \
+             patch("mm_rag.pipelines.extractors.validate_path", side_effect=lambda p: p), \
+             patch.object(self.extractor, "_extract_metadata", return_value=self.metadata):
+            file = self.extractor.extract("img.png", "user1")
+
+        self.assertIsInstance(file.content, ds.EncodedImage)
+        self.assertEqual(file.docs[0].id, self.metadata.file_id)
+        self.assertEqual(file.docs[0].metadata["text"], self.metadata.file_id)
+        self.assertEqual(len(file.embeddings), 1)
+
+    def test_extract_many_embeds_in_one_batch(self):
+        batch = MagicMock(side_effect=lambda imgs: [[float(i)] for i in range(len(imgs))])
+        extractor = ImgExtractor(MagicMock(), batch, preprocess_workers=1)
+        paths = []
+        with tempfile.TemporaryDirectory() as tmp:
+            for i, size in enumerate([(300, 300), (400, 300)]):
+                path = os.path.join(tmp, f"img{i}.png")
+                Image.new("RGB", size).save(path)
+                paths.append(path)
+
+            files = extractor.extract_many(paths, "user1")
+
+        batch.assert_called_once()
+        extractor.embedding_func.assert_not_called()
+        self.assertEqual([file.metadata.file_name for file in files], ["img0", "img1"])
+        self.assertEqual([file.embeddings for file in files], [[[0.0]], [[1.0]]])
+        self.assertEqual((files[1].content.width, files[1].content.height), (400, 300))
+
+
+class TestImgPreprocessing(unittest.TestCase):
+    def test_target_shape(self):
+        self.assertEqual(utils.target_shape((4000, 3000)), (2048, 1536))
+        self.assertEqual(utils.target_shape((100, 200)), (256, 512))
+        self.assertEqual(utils.target_shape((1000, 800)), (1000, 800))
+
+    def test_jpeg_is_decoded_at_reduced_scale(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "photo.jpg")
+            Image.new("RGB", (8000, 6000)).save(path, format="JPEG")
+
+            img = utils.open_img(path)
+
+        # 1/2 scale is the smallest still covering the 2048x1536 target
+        self.assertEqual(img.size, (4000, 3000))
+        self.assertEqual(img.mode, "RGB")
+
+    def test_large_downscale_uses_reducing_filter(self):
+        img = Image.new("RGB", (8000, 6000))
+        with patch.object(img, "resize", wraps=img.resize) as resize:
+            resized = utils.adjust_shape(img)
+
+        self.assertEqual(resized.size, (2048, 1536))
+        self.assertEqual(resize.call_args.args[1], Image.Resampling.BICUBIC)
+        self.assertEqual(resize.call_args.kwargs["reducing_gap"], 2.0)
+
+    def test_small_downscale_uses_lanczos(self):
+        img = Image.new("RGB", (3000, 2000))
+        with patch.object(img, "resize", wraps=img.resize) as resize:
+            utils.adjust_shape(img)
+
+        self.assertEqual(resize.call_args.args[1], Image.Resampling.LANCZOS)
+
+    def test_encode_keeps_caller_image_open(self):
+        img = Image.new("RGB", (1000, 800))
+        utils.encode_img(img)
+
+        # Already on target, the image is encoded as it is and stays usable
+        img.getpixel((0, 0))
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -1,3 +1,6 @@
+import os
+import tempfile
+import threading
 import unittest
 from unittest.mock import patch, MagicMock
 
@@ -6,7 +9,10 @@ from langchain_core.documents import Document
 
 from mm_rag.pipelines.extractors import (
     PdfExtractor,
-    ImageTooBigError
+    ImageTooBigError,
+    iter_pdf_pages,
+    list_pdf_image_pages,
+    read_pdf_text
 )
 import mm_rag.datastructures as ds
 
@@ -49,5 +55,177 @@ class TestPdfExtractor(unittest.TestCase):
             self.assertTrue(all(isinstance(doc, Document) for doc in docs))
 
 
+class TestIterPdfPages(unittest.TestCase):
+    def setUp(self):
+        info_patcher = patch("mm_rag.pipelines.extractors.pdfinfo_from_path", return_value={"Pages": 12})
+        convert_patcher = patch("mm_rag.pipelines.extractors.convert_from_path")
+        info_patcher.start()
+        self.mock_convert = convert_patcher.start()
+        self.addCleanup(info_patcher.stop)
+        self.addCleanup(convert_patcher.stop)
+        self.mock_convert.side_effect = lambda path, dpi, first_page, last_page: [
+            Image.new("RGB", (10, 10)) for _ in range(first_page, last_page + 1)
+        ]
+
+    def test_pages_are_yielded_in_order(self):
+        page_numbers = [page_no for page_no, _ in iter_pdf_pages("file.pdf", workers=3, max_pending=6)]
+        self.assertEqual(page_numbers, list(range(1, 13)))
+
+    def test_consecutive_pages_are_rendered_together_at_dpi(self):
+        list(iter_pdf_pages("file.pdf", dpi=100, workers=2, max_pending=6))
+
+        # Each worker renders max_pending // workers pages at a time
+        self.assertEqual(self.mock_convert.call_count, 4)
+        for call in self.mock_convert.call_args_list:
+            self.assertEqual(call.kwargs["dpi"], 100)
+            self.assertEqual(call.kwargs["last_page"] - call.kwargs["first_page"], 2)
+
+    def test_ranges_stop_at_skipped_pages(self):
+        pages = list(iter_pdf_pages("file.pdf", workers=1, max_pending=4, page_numbers=[1, 2, 5, 6, 7]))
+
+        self.assertEqual([page_no for page_no, _ in pages], [1, 2, 5, 6, 7])
+        self.assertEqual(
+            [(call.kwargs["first_page"], call.kwargs["last_page"]) for call in self.mock_convert.call_args_list],
+            [(1, 2), (5, 7)]
+        )
+
+    def test_rendering_stays_ahead_by_max_pending(self):
+        rendered: list[int] = []
+        lock = threading.Lock()
+
+        def _render(path, dpi, first_page, last_page):
+            with lock:
+                rendered.extend(range(first_page, last_page + 1))
+            return [Image.new("RGB", (10, 10)) for _ in range(first_page, last_page + 1)]
+
+        self.mock_convert.side_effect = _render
+        pages = iter_pdf_pages("file.pdf", workers=2, max_pending=4)
+
+        for page_no, _ in pages:
+            # Pages are requested only while fewer than `max_pending` are waiting
+            self.assertLessEqual(len(rendered), page_no + 3)
+        self.assertEqual(sorted(rendered), list(range(1, 13)))
+
+    def test_invalid_limits(self):
+        with self.assertRaises(ValueError):
+            list(iter_pdf_pages("file.pdf", workers=4, max_pending=2))
+
+
+class TestPdfEmbedChunks(unittest.TestCase):
+    def test_pages_are_embedded_in_one_batch(self):
+        batch = MagicMock(side_effect=lambda inputs: [[float(i)] for i in range(len(inputs))])
+        text = MagicMock(return_value=[9.0])
+        extractor = PdfExtractor(MagicMock(), batch, text_embedding_func=text)
+        chunks = [
+            ds.Chunk(Document(page_content="page 1", metadata={"modality": "image"})),
+            ds.Chunk(Document(page_content="some text", metadata={"modality": "text"})),
+            ds.Chunk(Document(page_content="page 3", metadata={"modality": "image"})),
+        ]
+
+        embedded = extractor.embed_chunks(chunks)
+
+        batch.assert_called_once_with(["page 1", "page 3"])
+        text.assert_called_once_with("some text")
+        extractor.embedding_func.assert_not_called()
+        self.assertEqual([chunk.embedding for chunk in embedded], [[0.0], [9.0], [1.0]])
+
+
+class TestStreamingPdfExtract(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "file.pdf")
+        open(self.path, "wb").close()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_extract_streams_pages(self):
+        embedding_func = MagicMock(return_value=[0.1])
+        extractor = PdfExtractor(embedding_func)
+        pages = [(i + 1, Image.new("RGB", (300, 300))) for i in range(3)]
+
+        with patch.object(PdfExtractor, "iter_pages", return_value=iter(pages)):
+            file = extractor.extract(self.path, "user1")
+
+        self.assertEqual([doc.id for doc in file.docs], [f"{file.metadata.file_id}/chunk{i}" for i in range(1, 4)])
+        self.assertEqual(file.embeddings, [[0.1]] * 3)
+        self.assertEqual(embedding_func.call_count, 3)
+        # Pages are kept as encoded jpegs, not as decoded bitmaps
+        self.assertTrue(all(isinstance(page, bytes) for page in file.content))
+
+
+PDFIMAGES_LIST = b"""page   num  type   width height color comp bpc  enc interp  object ID x-ppi y-ppi size ratio
+--------------------------------------------------------------------------------------------
+   1     0 image      32    32  rgb     3   8  jpeg   no        10  0    72    72  1K  33%
+   3     1 image     800   600  rgb     3   8  jpeg   no        12  0   150   150 80K  5.6%
+   3     2 smask     800   600  gray    1   8  image  no        12  0   150   150 10K  2.1%
+"""
+
+
+class TestHybridPdfExtract(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "file.pdf")
+        open(self.path, "wb").close()
+
+        self.image_func = MagicMock(return_value=[0.1])
+        self.text_func = MagicMock(return_value=[0.2])
+        self.extractor = PdfExtractor(self.image_func, text_embedding_func=self.text_func, min_text_chars=20)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    @patch("mm_rag.pipelines.extractors.subprocess.run")
+    def test_read_pdf_text_splits_pages(self, mock_run):
+        mock_run.return_value.returncode = 0
+        mock_run.return_value.stdout = "first page\fsecond page\f".encode()
+
+        self.assertEqual(read_pdf_text("file.pdf"), ["first page", "second page"])
+
+    @patch("mm_rag.pipelines.extractors.subprocess.run")
+    def test_small_images_and_masks_are_ignored(self, mock_run):
+        mock_run.return_value.returncode = 0
+        mock_run.return_value.stdout = PDFIMAGES_LIST
+
+        self.assertEqual(list_pdf_image_pages("file.pdf", min_pixels=100 * 100), {3})
+
+    @patch("mm_rag.pipelines.extractors.subprocess.run", side_effect=FileNotFoundError("pdftotext"))
+    def test_missing_poppler_tools_render_every_page(self, _):
+        self.assertIsNone(read_pdf_text("file.pdf"))
+        self.assertIsNone(list_pdf_image_pages("file.pdf"))
+
+    def test_pages_are_routed_by_text_and_images(self):
+        texts = ["a page with a long enough text layer", "short", "text next to a picture of a cat"]
+        rendered_pages = [(2, Image.new("RGB", (300, 300))), (3, Image.new("RGB", (300, 300)))]
+
+        with patch("mm_rag.pipelines.extractors.read_pdf_text", return_value=texts), \
+             patch("mm_rag.pipelines.extractors.list_pdf_image_pages", return_value={3}), \
+             patch.object(PdfExtractor, "iter_pages", return_value=iter(rendered_pages)) as mock_iter:
+            file = self.extractor.extract(self.path, "user1")
+
+        # Only the short page and the page with an image are rendered
+        self.assertEqual(mock_iter.call_args.args[1], [2, 3])
+        file_id = file.metadata.file_id
+        self.assertEqual(
+            [doc.id for doc in file.docs],
+            [f"{file_id}/chunk1.1", f"{file_id}/chunk2", f"{file_id}/chunk3"]
+        )
+        self.assertEqual([doc.metadata["modality"] for doc in file.docs], ["text", "image", "image"])
+        self.assertEqual(file.embeddings, [[0.2], [0.1], [0.1]])
+        self.assertIsNone(file.content[0])
+        self.assertEqual(self.text_func.call_args.args[0], texts[0])
+
+    def test_no_text_embedding_func_renders_every_page(self):
+        extractor = PdfExtractor(self.image_func)
+        pages = [(1, Image.new("RGB", (300, 300)))]
+
+        with patch("mm_rag.pipelines.extractors.read_pdf_text") as mock_read, \
+             patch.object(PdfExtractor, "iter_pages", return_value=iter(pages)):
+            file = extractor.extract(self.path, "user1")
+
+        mock_read.assert_not_called()
+        self.assertEqual(file.docs[0].metadata["modality"], "image")
+
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
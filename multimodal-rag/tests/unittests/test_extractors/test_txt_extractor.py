@@ -43,6 +43,18 @@ class TestTxtExtractor(unittest.TestCase):
             docs = self.extractor._extract_docs("abc", self.metadata)
             self.assertTrue(all(isinstance(doc, Document) for doc in docs))
 
+    def test_extract_embeddings_uses_batch_func(self):
+        embedding_func = MagicMock()
+        batch_embedding_func = MagicMock(return_value=[[0.1], [0.2]])
+        extractor = TxtExtractor(embedding_func, batch_embedding_func=batch_embedding_func)
+        docs = [Document(page_content="a"), Document(page_content="b")]
+
+        embeddings = extractor._extract_embeddings(docs)
+
+        self.assertEqual(embeddings, [[0.1], [0.2]])
+        batch_embedding_func.assert_called_once_with(["a", "b"])
+        embedding_func.assert_not_called()
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
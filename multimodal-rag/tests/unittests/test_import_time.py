@@ -0,0 +1,78 @@
+import json
+import os
+import subprocess
+import sys
+
+import unittest
+
+
+# Cold import budget of the API, a Lambda cold start pays it before serving the first request
+IMPORT_BUDGET_MS = float(os.environ.get('MM_RAG_IMPORT_BUDGET_MS', 1500))
+# When set, the cumulative import time of every module is written there as JSON
+IMPORT_REPORT_PATH = os.environ.get('MM_RAG_IMPORT_REPORT')
+
+# Only imported by the code paths that need them
+DEFERRED_PACKAGES = [
+  'langchain_core',
+  'langchain_pinecone',
+  'langchain_text_splitters',
+  'langgraph',
+  'pinecone',
+  'PIL',
+  'pdf2image',
+  'sqlalchemy',
+  'pgvector',
+  'huggingface_hub',
+  'numpy',
+]
+
+
+def cumulative_import_times(module: str) -> dict[str, float]:
+  """
+  Imports `module` in a fresh interpreter with `-X importtime`.
+  :return: the cumulative import time of every imported module, in milliseconds
+  """
+  result = subprocess.run(
+    [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+    capture_output=True,
+    text=True,
+    check=True
+  )
+
+  times: dict[str, float] = {}
+  for line in result.stderr.splitlines():
+    # import time: self [us] | cumulative | imported package
+    if not line.startswith('import time:') or 'cumulative' in line:
+      continue
+    _, cumulative, name = line.removeprefix('import time:').split('|')
+    times[name.strip()] = int(cumulative) / 1000
+
+  return times
+
+
+class TestImportTime(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls.times = cumulative_import_times('mm_rag.api.main')
+
+    if IMPORT_REPORT_PATH:
+      with open(IMPORT_REPORT_PATH, 'w') as f:
+        json.dump(dict(sorted(cls.times.items(), key=lambda item: -item[1])), f, indent=2)
+
+  def test_api_import_within_budget(self):
+    slowest = sorted(self.times.items(), key=lambda item: -item[1])[:10]
+
+    self.assertLessEqual(
+      self.times['mm_rag.api.main'],
+      IMPORT_BUDGET_MS,
+      f"Importing mm_rag.api.main took {self.times['mm_rag.api.main']:.0f}ms, slowest modules: {slowest}"
+    )
+
+  def test_heavy_packages_are_deferred(self):
+    imported = {name.split('.')[0] for name in self.times}
+
+    self.assertEqual(imported.intersection(DEFERRED_PACKAGES), set())
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,160 @@
+import asyncio
+import os
+import tempfile
+from mm_rag.pipelines.jobs import (
+  Job,
+  JobQueue,
+  MemoryJobStore,
+  SQLiteJobStore,
+  DynamoDBJobStore,
+  from_config
+)
+from mm_rag.exceptions import JobQueueFullError, MissingItemError
+from mm_rag.models.dynamodb import DynamoDB
+
+import unittest
+from unittest.mock import MagicMock
+
+
+class TestJobStores(unittest.TestCase):
+  def test_memory_store_round_trip(self):
+    store = MemoryJobStore()
+    job = Job(user_id='user', file_name='test.pdf')
+    store.put(job)
+
+    self.assertEqual(store.get(job.job_id), job)
+    self.assertIsNone(store.get('missing'))
+
+  def test_sqlite_store_persists_jobs(self):
+    with tempfile.TemporaryDirectory() as tmp:
+      path = os.path.join(tmp, 'jobs.sqlite')
+      job = Job(user_id='user', file_name='test.pdf', progress={'stored': 3})
+      SQLiteJobStore(path).put(job)
+
+      self.assertEqual(SQLiteJobStore(path).get(job.job_id), job)
+
+  def test_sqlite_store_drops_expired_jobs(self):
+    with tempfile.TemporaryDirectory() as tmp:
+      store = SQLiteJobStore(os.path.join(tmp, 'jobs.sqlite'), ttl_seconds=60)
+      old = Job(user_id='user', file_name='old.pdf', updated=0)
+      store.put(old)
+      store.put(Job(user_id='user', file_name='new.pdf'))
+
+      self.assertIsNone(store.get(old.job_id))
+
+  def test_dynamodb_store(self):
+    ddb = MagicMock(DynamoDB)
+    store = DynamoDBJobStore(ddb)
+    job = Job(user_id='user', file_name='test.pdf')
+
+    store.put(job)
+    item = ddb.put_item.call_args.args[1]
+    self.assertEqual(ddb.put_item.call_args.args[0], 'jobs')
+    self.assertEqual(item['jobId'], job.job_id)
+    self.assertIn('expiresAt', item)
+
+    ddb.get_from_table.return_value = item
+    self.assertEqual(store.get(job.job_id), job)
+
+    ddb.get_from_table.side_effect = MissingItemError
+    self.assertIsNone(store.get(job.job_id))
+
+  def test_from_config(self):
+    self.assertIsInstance(from_config({'backend': 'memory'}).store, MemoryJobStore)
+    with self.assertRaises(ValueError):
+      from_config({'backend': 'dynamodb'})
+    with self.assertRaises(ValueError):
+      from_config({'backend': 'redis'})
+
+
+class TestJobQueue(unittest.IsolatedAsyncioTestCase):
+  def setUp(self):
+    self.store = MemoryJobStore()
+    self.queue = JobQueue(self.store, workers=2, max_queued=4, progress_interval=0.01)
+
+  async def asyncTearDown(self):
+    await self.queue.stop()
+
+  async def test_job_succeeds_with_its_progress(self):
+    async def run(progress):
+      progress.extracted = progress.embedded = progress.stored = 3
+
+    cleanup = MagicMock()
+    job = self.queue.submit(Job(user_id='user', file_name='test.pdf'), run, cleanup)
+    self.assertEqual(self.store.get(job.job_id).status, 'queued')
+
+    await self.queue.join()
+
+    stored = self.queue.get(job.job_id)
+    self.assertEqual(stored.status, 'succeeded')
+    self.assertEqual(stored.progress['stored'], 3)
+    cleanup.assert_called_once()
+
+  async def test_progress_is_reported_while_running(self):
+    release = asyncio.Event()
+
+    async def run(progress):
+      progress.extracted = 2
+      await release.wait()
+
+    job = self.queue.submit(Job(user_id='user', file_name='test.pdf'), run)
+    await asyncio.sleep(0.05)
+
+    running = self.queue.get(job.job_id)
+    self.assertEqual(running.status, 'running')
+    self.assertEqual(running.progress['extracted'], 2)
+
+    release.set()
+    await self.queue.join()
+    self.assertEqual(self.queue.get(job.job_id).status, 'succeeded')
+
+  async def test_failed_job_reports_its_error(self):
+    async def run(progress):
+      raise ValueError("broken file")
+
+    cleanup = MagicMock()
+    job = self.queue.submit(Job(user_id='user', file_name='test.pdf'), run, cleanup)
+    await self.queue.join()
+
+    failed = self.queue.get(job.job_id)
+    self.assertEqual(failed.status, 'failed')
+    self.assertEqual(failed.error, 'broken file')
+    cleanup.assert_called_once()
+
+  async def test_parallelism_is_bounded(self):
+    running = 0
+    peak = 0
+
+    async def run(progress):
+      nonlocal running, peak
+      running += 1
+      peak = max(peak, running)
+      await asyncio.sleep(0.01)
+      running -= 1
+
+    for _ in range(4):
+      self.queue.submit(Job(user_id='user', file_name='test.pdf'), run)
+    await self.queue.join()
+
+    self.assertEqual(peak, 2)
+
+  async def test_full_queue_refuses_jobs(self):
+    release = asyncio.Event()
+
+    async def run(progress):
+      await release.wait()
+
+    # 2 running and 4 waiting
+    for _ in range(6):
+      self.queue.submit(Job(user_id='user', file_name='test.pdf'), run)
+      await asyncio.sleep(0)
+
+    with self.assertRaises(JobQueueFullError):
+      self.queue.submit(Job(user_id='user', file_name='test.pdf'), run)
+
+    release.set()
+    await self.queue.join()
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -42,6 +42,12 @@ class TestDynamoDB(unittest.TestCase):
         result = self.dynamodb.store_file("files", "file1", "user1", {"meta": "data"})
         self.assertFalse(result)
 
+    def test_put_item_success(self):
+        item = {"cacheKey": "key", "embedding": b"value"}
+        result = self.dynamodb.put_item("embedding_cache", item)
+        self.assertTrue(result)
+        self.mock_table.put_item.assert_called_once_with(Item=item)
+
     def test_get_from_table_success(self):
         self.mock_table.get_item.return_value = {"Item": {"userId": "user1", "fileId": "file1"}}
         result = self.dynamodb.get_from_table("files", {"userId": "user1", "fileId": "file1"})
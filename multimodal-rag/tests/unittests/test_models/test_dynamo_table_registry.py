@@ -0,0 +1,72 @@
+import unittest
+from unittest.mock import MagicMock, patch
+from botocore.exceptions import ClientError
+
+from mm_rag.models import dynamodb
+from mm_rag.models.dynamodb import DynamoDB, TABLE_SPECS
+
+
+def not_found_error() -> ClientError:
+    return ClientError(
+        error_response={"Error": {"Code": "ResourceNotFoundException", "Message": "Requested resource not found"}},
+        operation_name="DescribeTable"
+    )
+
+
+class TestTableRegistry(unittest.TestCase):
+    def setUp(self):
+        patcher = patch.object(dynamodb, "_ensured_tables", set())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.dynamodb = DynamoDB()
+        self.dynamodb.ddb = MagicMock()
+        self.mock_table = self.dynamodb.ddb.Table.return_value
+        self.mock_table.key_schema = TABLE_SPECS["users"].key_schema
+
+    def test_access_does_not_create_tables(self):
+        for _ in range(3):
+            self.assertIs(self.dynamodb.users, self.mock_table)
+
+        self.dynamodb.ddb.create_table.assert_not_called()
+        self.mock_table.load.assert_called_once()
+
+    def test_tables_are_described_once_per_process(self):
+        self.dynamodb.ensure_tables(["users"])
+
+        other = DynamoDB()
+        other.ddb = MagicMock()
+        other.users
+
+        other.ddb.Table.return_value.load.assert_not_called()
+
+    def test_missing_table_is_created(self):
+        self.mock_table.load.side_effect = not_found_error()
+
+        self.dynamodb.ensure_tables(["embedding_cache"])
+
+        kwargs = self.dynamodb.ddb.create_table.call_args.kwargs
+        self.assertEqual(kwargs["TableName"], "embedding_cache")
+        self.assertEqual(kwargs["BillingMode"], "PAY_PER_REQUEST")
+        self.dynamodb.ddb.meta.client.update_time_to_live.assert_called_once()
+
+    def test_schema_mismatch_is_reported(self):
+        self.mock_table.key_schema = [{"AttributeName": "id", "KeyType": "HASH"}]
+
+        with self.assertRaises(ValueError):
+            self.dynamodb.files
+
+    def test_unknown_table(self):
+        with self.assertRaises(ValueError):
+            self.dynamodb.get_from_table("unknown", {"id": "1"})
+
+    def test_ensure_tables_bootstraps_the_given_tables(self):
+        self.mock_table.key_schema = None
+        with patch.object(DynamoDB, "_ensure_table") as mock_ensure:
+            self.dynamodb.ensure_tables(["users", "files"])
+
+        self.assertEqual([call.args[0].name for call in mock_ensure.call_args_list], ["users", "files"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,211 @@
+from mm_rag.models import local_vectorstore
+from mm_rag.models.local_vectorstore import LocalIndex, LocalVectorStore
+from mm_rag.pipelines.pipes import ComponentFactory
+from mm_rag.pipelines.retrievers import Retriever
+from mm_rag.agents.mm_embedder import Embedder
+from mm_rag.datastructures import Metadata
+from mm_rag.exceptions import ObjectUpsertionError
+import mm_rag.datastructures as ds
+
+from langchain_core.documents import Document
+from pinecone import Vector
+
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+
+def one_hot(i: int, dim: int = 8) -> list[float]:
+  values = [0.0] * dim
+  values[i] = 1.0
+  return values
+
+
+class TestLocalIndex(unittest.TestCase):
+  def setUp(self):
+    self.index = LocalIndex(dim=8)
+
+  def test_query_ranks_by_cosine_similarity(self):
+    self.index.upsert([Vector(id=str(i), values=one_hot(i), metadata={'n': i}) for i in range(8)], namespace='ns')
+
+    response = self.index.query(vector=[0.1, 0.0, 1.0, 0.5, 0, 0, 0, 0], top_k=3, namespace='ns', include_metadata=True)
+
+    self.assertEqual([match['id'] for match in response['matches']], ['2', '3', '0'])
+    self.assertEqual(response['matches'][0]['metadata'], {'n': 2})
+    self.assertGreater(response['matches'][0]['score'], response['matches'][1]['score'])
+
+  def test_namespaces_are_isolated(self):
+    self.index.upsert([Vector(id='a', values=one_hot(0))], namespace='user1')
+
+    self.assertEqual(self.index.query(vector=one_hot(0), top_k=3, namespace='user2')['matches'], [])
+
+  def test_upsert_overwrites_existing_id(self):
+    self.index.upsert([Vector(id='a', values=one_hot(0))], namespace='ns')
+    self.index.upsert([Vector(id='a', values=one_hot(1))], namespace='ns')
+
+    matches = self.index.query(vector=one_hot(1), top_k=5, namespace='ns')['matches']
+    self.assertEqual(len(matches), 1)
+    self.assertAlmostEqual(matches[0]['score'], 1.0, places=5)
+
+  def test_delete_keeps_other_vectors_searchable(self):
+    self.index.upsert([Vector(id=str(i), values=one_hot(i)) for i in range(4)], namespace='ns')
+    self.index.delete(ids=['0'], namespace='ns')
+
+    matches = self.index.query(vector=one_hot(3), top_k=4, namespace='ns')['matches']
+    self.assertEqual(len(matches), 3)
+    self.assertEqual(matches[0]['id'], '3')
+
+    self.index.delete(delete_all=True, namespace='ns')
+    self.assertEqual(self.index.query(vector=one_hot(3), top_k=4, namespace='ns')['matches'], [])
+
+  def test_wrong_dimension(self):
+    with self.assertRaises(ObjectUpsertionError):
+      self.index.upsert([Vector(id='a', values=[1.0, 0.0])], namespace='ns')
+
+  def test_persists_to_memory_mapped_files(self):
+    with tempfile.TemporaryDirectory() as path:
+      index = LocalIndex(dim=8, path=path)
+      index.upsert([Vector(id=str(i), values=one_hot(i), metadata={'n': i}) for i in range(20)], namespace='user/other')
+      index.delete(ids=['5'], namespace='user/other')
+
+      reloaded = LocalIndex(dim=8, path=path)
+      matches = reloaded.query(vector=one_hot(7), top_k=1, namespace='user/other', include_metadata=True)['matches']
+
+      self.assertEqual(matches[0]['id'], '7')
+      self.assertEqual(matches[0]['metadata'], {'n': 7})
+      self.assertEqual(len(reloaded.namespace('user/other')), 19)
+
+  @unittest.skipIf(local_vectorstore.hnswlib is None, "hnswlib is not installed")
+  def test_ann_search_above_threshold(self):
+    index = LocalIndex(dim=8, ann_threshold=4)
+    index.upsert([Vector(id=str(i), values=one_hot(i)) for i in range(8)], namespace='ns')
+
+    matches = index.query(vector=one_hot(6), top_k=1, namespace='ns')['matches']
+    self.assertEqual(matches[0]['id'], '6')
+
+  @unittest.skipIf(local_vectorstore.hnswlib is None, "hnswlib is not installed")
+  def test_ann_index_is_updated_in_place(self):
+    index = LocalIndex(dim=8, ann_threshold=4)
+    index.upsert([Vector(id=str(i), values=one_hot(i)) for i in range(6)], namespace='ns')
+    index.query(vector=one_hot(0), top_k=1, namespace='ns')
+    ann = index.namespace('ns').ann
+
+    index.upsert([Vector(id='7', values=one_hot(7))], namespace='ns')
+    index.delete(ids=['0'], namespace='ns')
+
+    self.assertEqual(index.query(vector=one_hot(7), top_k=1, namespace='ns')['matches'][0]['id'], '7')
+    self.assertNotIn('0', [match['id'] for match in index.query(vector=one_hot(0), top_k=6, namespace='ns')['matches']])
+    self.assertIs(index.namespace('ns').ann, ann)
+
+  def test_writes_are_appended_to_a_log(self):
+    with tempfile.TemporaryDirectory() as path:
+      index = LocalIndex(dim=8, path=path)
+      for i in range(8):
+        index.upsert([Vector(id=str(i), values=one_hot(i), metadata={'n': i})], namespace='ns')
+      index.delete(ids=['3'], namespace='ns')
+
+      # The snapshot is only written on flush
+      self.assertFalse(os.path.exists(os.path.join(path, 'ns.json')))
+      self.assertEqual(len(LocalIndex(dim=8, path=path).namespace('ns')), 7)
+
+      index.flush()
+      self.assertEqual(os.listdir(path).count('ns.0.log'), 0)
+
+      index.upsert([Vector(id='3', values=one_hot(3), metadata={'n': 3})], namespace='ns')
+      reloaded = LocalIndex(dim=8, path=path)
+      matches = reloaded.query(vector=one_hot(3), top_k=1, namespace='ns', include_metadata=True)['matches']
+      self.assertEqual((matches[0]['id'], matches[0]['metadata']), ('3', {'n': 3}))
+      self.assertEqual(len(reloaded.namespace('ns')), 8)
+
+  def test_log_is_compacted_once_it_outgrows_the_namespace(self):
+    with tempfile.TemporaryDirectory() as path, patch.object(local_vectorstore, 'MIN_LOG_ENTRIES', 4):
+      index = LocalIndex(dim=8, path=path)
+      for _ in range(10):
+        index.upsert([Vector(id='a', values=one_hot(0))], namespace='ns')
+
+      self.assertTrue(os.path.exists(os.path.join(path, 'ns.json')))
+      self.assertLessEqual(index.namespace('ns').log_entries, 4)
+      self.assertEqual(len(LocalIndex(dim=8, path=path).namespace('ns')), 1)
+
+
+class TestLocalVectorStore(unittest.TestCase):
+  def setUp(self):
+    self.embedder = MagicMock(Embedder)
+    patcher = patch.object(local_vectorstore, '_indexes', {})
+    patcher.start()
+    self.addCleanup(patcher.stop)
+    self.store = LocalVectorStore(self.embedder, namespace='user', dim=8)
+
+  def make_file(self, n_docs: int) -> ds.File:
+    metadata = Metadata('test', '.txt', 'user')
+    docs = [
+      Document(page_content=f'chunk {i}', metadata={'text': f'chunk {i}'}, id=f'{metadata.file_id}/chunk{i+1}')
+      for i in range(n_docs)
+    ]
+    return ds.File(metadata, 'test', docs, [one_hot(i) for i in range(n_docs)])
+
+  def test_add_and_remove_file(self):
+    file = self.make_file(3)
+
+    self.assertEqual(self.store.add(file), 3)
+    namespace = self.store._generate_full_namespace(file.metadata.collection)
+    self.assertEqual(len(self.store.index.namespace(namespace)), 3)
+
+    self.store.remove_objects([doc.id for doc in file.docs], file.metadata.collection)  # type: ignore[misc]
+    self.assertEqual(len(self.store.index.namespace(namespace)), 0)
+
+  def test_stores_share_the_index(self):
+    other = LocalVectorStore(self.embedder, namespace='other', dim=8)
+    self.assertIs(self.store.index, other.index)
+
+  def test_retriever_reads_local_matches(self):
+    self.store.upsert(
+      [Vector(id='doc1', values=one_hot(1), metadata={'text': 'hello', 'fileType': '.txt'})],
+      namespace='user'
+    )
+    self.embedder.embed_query.return_value = one_hot(1)
+    retriever = Retriever(self.store, MagicMock(), MagicMock(), self.embedder, top_k=1)  # type: ignore[arg-type]
+
+    docs = retriever.retrieve('hello?')
+
+    self.assertEqual(docs[0].id, 'doc1')
+    self.assertEqual(docs[0].page_content, 'hello')
+
+  def test_add_image(self):
+    self.embedder.embed_img.return_value = one_hot(2)
+    metadata = Metadata('img', '.png', 'user')
+
+    self.store.add_image('b64', metadata, metadata.file_id)
+
+    matches = self.store.query(one_hot(2), top_k=1)['matches']
+    self.assertEqual(matches[0]['id'], metadata.file_id)
+    self.assertEqual(matches[0]['metadata']['text'], metadata.file_id)
+
+
+class TestVectorStoreSelection(unittest.TestCase):
+  def make_factory(self, **options) -> ComponentFactory:
+    return ComponentFactory(
+      MagicMock(Embedder), 'key', 'files', 'aws', 'us-east-1', MagicMock(), MagicMock(),
+      vector_store_options=options
+    )
+
+  def test_local_backend(self):
+    vector_store = self.make_factory(backend='local', local_path=None).get_vector_store('user1')
+
+    self.assertIsInstance(vector_store, LocalVectorStore)
+    self.assertEqual(vector_store.namespace, 'user1')
+
+  @patch('mm_rag.pipelines.pipes.vs.registry')
+  def test_local_backend_skips_pinecone_warm_up(self, mock_registry):
+    self.make_factory(backend='local').warm_up()
+
+    mock_registry.index.assert_not_called()
+
+  def test_unknown_backend(self):
+    with self.assertRaises(ValueError):
+      self.make_factory(backend='faiss').get_vector_store('user1')
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,183 @@
+from mm_rag.models import postgres
+from mm_rag.models.postgres import PSQLDB, PgVectorStore
+from mm_rag.pipelines.pipes import ComponentFactory
+from mm_rag.agents.mm_embedder import Embedder
+from mm_rag.datastructures import Metadata
+from mm_rag.exceptions import ObjectDeletionError, ObjectUpsertionError
+import mm_rag.datastructures as ds
+
+from langchain_core.documents import Document
+from pinecone import Vector
+
+from types import SimpleNamespace
+import unittest
+from unittest.mock import MagicMock, patch
+
+
+class TestPSQLDB(unittest.TestCase):
+  def setUp(self):
+    patcher = patch('mm_rag.models.postgres.create_engine')
+    self.mock_create_engine = patcher.start()
+    self.addCleanup(patcher.stop)
+    self.mock_engine = self.mock_create_engine.return_value
+    self.mock_conn = self.mock_engine.begin.return_value.__enter__.return_value
+
+  def test_engine_is_pooled(self):
+    PSQLDB('host', 'db', 'pass', pool_size=7)
+
+    kwargs = self.mock_create_engine.call_args.kwargs
+    self.assertEqual(kwargs['pool_size'], 7)
+    self.assertTrue(kwargs['pool_pre_ping'])
+
+  def test_store_file_executes_insert(self):
+    db = PSQLDB('host', 'db', 'pass')
+
+    self.assertTrue(db.store_file('files', {'fileType': '.txt'}, 'content', owned_by=1))
+    self.mock_conn.execute.assert_called_once()
+
+  def test_copy_embeddings_streams_csv(self):
+    db = PSQLDB('host', 'db', 'pass', dim=2)
+    raw_conn = self.mock_engine.raw_connection.return_value
+    cursor = raw_conn.cursor.return_value.__enter__.return_value
+    copied: list[str] = []
+    cursor.copy_expert.side_effect = lambda sql, buffer: copied.append(buffer.read())
+
+    written = db.copy_embeddings([
+      ('doc1', 'user/other', 'user', 'some, "quoted"\ntext', {'page': 1}, [0.5, 0.25]),
+      ('doc2', 'user/other', 'user', '', {}, [1.0, 0.0]),
+    ])
+
+    self.assertEqual(written, 2)
+    self.assertIn('COPY embeddings_staging', cursor.copy_expert.call_args.args[0])
+    self.assertIn('"[0.5,0.25]"', copied[0])
+    self.assertIn('ON CONFLICT (namespace, doc_id)', cursor.execute.call_args.args[0])
+    raw_conn.commit.assert_called_once()
+    raw_conn.close.assert_called_once()
+
+  def test_copy_embeddings_rolls_back_on_error(self):
+    db = PSQLDB('host', 'db', 'pass', dim=2)
+    raw_conn = self.mock_engine.raw_connection.return_value
+    raw_conn.cursor.return_value.__enter__.return_value.copy_expert.side_effect = RuntimeError('broken pipe')
+
+    with self.assertRaises(RuntimeError):
+      db.copy_embeddings([('doc1', 'ns', 'user', '', {}, [0.5, 0.25])])
+
+    raw_conn.rollback.assert_called_once()
+    raw_conn.close.assert_called_once()
+
+  def test_iterative_scan_depends_on_the_extension_version(self):
+    db = PSQLDB('host', 'db', 'pass')
+    db.metadata_obj = MagicMock()
+
+    self.mock_conn.execute.return_value.scalar.return_value = '0.7.4'
+    db.ensure_vector_schema()
+    self.assertFalse(db.iterative_scan)
+
+    self.mock_conn.execute.return_value.scalar.return_value = '0.8.0'
+    db.ensure_vector_schema()
+    self.assertTrue(db.iterative_scan)
+
+  def test_invalid_vector_index(self):
+    with self.assertRaises(ValueError):
+      PSQLDB('host', 'db', 'pass', vector_index='flat')
+
+
+class TestPgVectorStore(unittest.TestCase):
+  def setUp(self):
+    self.db = MagicMock(PSQLDB)
+    self.db.dim = 2
+    self.db.vector_index = 'hnsw'
+    self.db.iterative_scan = False
+    self.db.engine = MagicMock()
+    patcher = patch('mm_rag.models.postgres.create_engine')
+    patcher.start()
+    self.addCleanup(patcher.stop)
+    # A real table definition, so that the statements are built as in production
+    self.db.embeddings = PSQLDB('host', 'db', 'pass', dim=2).embeddings
+    self.mock_conn = self.db.engine.begin.return_value.__enter__.return_value
+    self.store = PgVectorStore(MagicMock(Embedder), self.db, namespace='user', ef_search=80)
+
+  def test_add_writes_in_collection_namespace_with_owner(self):
+    metadata = Metadata('test', '.txt', 'user')
+    docs = [Document(page_content='hi', metadata={'text': 'hi'}, id=f'{metadata.file_id}/chunk1')]
+    self.db.copy_embeddings.return_value = 1
+
+    self.assertEqual(self.store.add(ds.File(metadata, 'hi', docs, [[0.5, 0.5]])), 1)
+
+    doc_id, namespace, owner, text_content, _, values = self.db.copy_embeddings.call_args.args[0][0]
+    self.assertEqual((doc_id, namespace, owner, text_content), (docs[0].id, 'user/other', 'user', 'hi'))
+    self.assertEqual(values, [0.5, 0.5])
+
+  def test_chunk_text_comes_from_the_document(self):
+    metadata = Metadata('test', '.txt', 'user')
+    chunk = ds.Chunk(Document(page_content='hello', metadata={'fileType': '.txt'}, id=f'{metadata.file_id}/chunk1'))
+    chunk.embedding = [0.5, 0.5]
+
+    self.store.add_chunks([chunk], 'other')
+
+    self.assertEqual(self.db.copy_embeddings.call_args.args[0][0][3], 'hello')
+
+  def test_driver_errors_are_upsertion_errors(self):
+    self.db.copy_embeddings.side_effect = postgres.psycopg2.OperationalError('server closed the connection')
+
+    with self.assertRaises(ObjectUpsertionError):
+      self.store.upsert([Vector(id='doc1', values=[0.5, 0.5], metadata={})], namespace='user')
+
+  def test_database_errors_are_deletion_errors(self):
+    self.db.engine.begin.side_effect = postgres.SQLAlchemyError('server closed the connection')
+
+    with self.assertRaises(ObjectDeletionError):
+      self.store.remove_objects(['doc1'], 'other')
+    with self.assertRaises(ObjectDeletionError):
+      self.store.clean()
+
+  def test_query_tunes_the_index_and_returns_matches(self):
+    self.mock_conn.execute.return_value.all.return_value = [
+      SimpleNamespace(doc_id='doc1', doc_metadata={'text': 'hi'}, score=0.9)
+    ]
+
+    response = self.store.query([0.5, 0.5], top_k=3)
+
+    self.assertIn('SET LOCAL hnsw.ef_search = 80', str(self.mock_conn.execute.call_args_list[0].args[0]))
+    self.assertEqual(response['matches'], [{'id': 'doc1', 'score': 0.9, 'metadata': {'text': 'hi'}}])
+
+  def test_filtered_query_scans_beyond_top_k(self):
+    self.db.iterative_scan = True
+    self.mock_conn.execute.return_value.all.return_value = [
+      SimpleNamespace(doc_id='doc1', doc_metadata={}, score=0.8),
+      SimpleNamespace(doc_id='doc2', doc_metadata={}, score=0.9),
+    ]
+
+    response = self.store.query([0.5, 0.5], top_k=100)
+
+    statements = [str(call.args[0]) for call in self.mock_conn.execute.call_args_list]
+    self.assertIn('SET LOCAL hnsw.ef_search = 200', statements[0])
+    self.assertIn('SET LOCAL hnsw.iterative_scan = relaxed_order', statements[1])
+    self.assertEqual([match['id'] for match in response['matches']], ['doc2', 'doc1'])
+
+  def test_query_sets_probes_for_ivfflat(self):
+    self.db.vector_index = 'ivfflat'
+    self.mock_conn.execute.return_value.all.return_value = []
+
+    self.store.query([0.5, 0.5], top_k=3)
+
+    self.assertIn('SET LOCAL ivfflat.probes = 10', str(self.mock_conn.execute.call_args_list[0].args[0]))
+
+
+class TestPgVectorSelection(unittest.TestCase):
+  @patch('mm_rag.models.postgres.connect')
+  def test_factory_selects_pgvector(self, mock_connect):
+    factory = ComponentFactory(
+      MagicMock(Embedder), 'key', 'files', 'aws', 'us-east-1', MagicMock(), MagicMock(),
+      vector_store_options={'backend': 'pgvector', 'pg_host': 'host', 'pg_database': 'db', 'pg_password': 'pass'}
+    )
+
+    vector_store = factory.get_vector_store('user1')
+
+    self.assertIsInstance(vector_store, PgVectorStore)
+    self.assertIs(vector_store.db, mock_connect.return_value)  # type: ignore[union-attr]
+    self.assertEqual(vector_store.namespace, 'user1')
+
+
+if __name__ == "__main__":
+  unittest.main()
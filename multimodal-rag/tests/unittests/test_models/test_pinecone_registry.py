@@ -0,0 +1,102 @@
+from mm_rag.models.vectorstore import PineconeVectorStore, PineconeRegistry, registry
+from mm_rag.pipelines.pipes import ComponentFactory
+from mm_rag.agents.mm_embedder import Embedder
+
+import unittest
+from unittest.mock import MagicMock, patch
+
+
+class TestPineconeRegistry(unittest.TestCase):
+  def setUp(self):
+    self.registry = PineconeRegistry()
+    patcher = patch('mm_rag.models.vectorstore.Pinecone')
+    self.mock_pinecone = patcher.start()
+    self.addCleanup(patcher.stop)
+    self.mock_client = self.mock_pinecone.return_value
+    self.mock_client.has_index.return_value = True
+
+  def test_index_is_resolved_once(self):
+    first = self.registry.index('key', 'files', 'aws', 'us-east-1')
+    second = self.registry.index('key', 'files', 'aws', 'us-east-1')
+
+    self.assertIs(first, second)
+    self.mock_pinecone.assert_called_once_with(api_key='key')
+    self.mock_client.has_index.assert_called_once_with('files')
+    self.mock_client.Index.assert_called_once_with('files')
+
+  def test_missing_index_is_created_once(self):
+    self.mock_client.has_index.return_value = False
+
+    self.registry.ensure_index('key', 'files', 'aws', 'us-east-1')
+    self.registry.ensure_index('key', 'files', 'aws', 'us-east-1')
+
+    self.mock_client.create_index.assert_called_once()
+
+  def test_reconnect_rebuilds_handle_without_existence_check(self):
+    self.registry.index('key', 'files', 'aws', 'us-east-1')
+    self.registry.reconnect('key', 'files')
+    self.registry.index('key', 'files', 'aws', 'us-east-1')
+
+    self.assertEqual(self.mock_pinecone.call_count, 2)
+    self.assertEqual(self.mock_client.Index.call_count, 2)
+    self.mock_client.has_index.assert_called_once()
+
+
+class TestSharedIndexHandle(unittest.TestCase):
+  def setUp(self):
+    registry.clear()
+    self.addCleanup(registry.clear)
+    patcher = patch('mm_rag.models.vectorstore.Pinecone')
+    self.mock_pinecone = patcher.start()
+    self.addCleanup(patcher.stop)
+    self.mock_index = self.mock_pinecone.return_value.Index.return_value
+
+  def make_store(self, namespace: str) -> PineconeVectorStore:
+    return PineconeVectorStore(
+      MagicMock(Embedder),
+      api_key='key',
+      index_name='files',
+      namespace=namespace,
+      cloud='aws',
+      region='us-east-1'
+    )
+
+  def test_namespaces_share_the_index(self):
+    first = self.make_store('user1')
+    second = self.make_store('user2')
+
+    self.assertIs(first.index, second.index)
+    self.mock_pinecone.assert_called_once()
+
+  def test_factories_share_the_index(self):
+    factories = [
+      ComponentFactory(MagicMock(Embedder), 'key', 'files', 'aws', 'us-east-1', MagicMock(), MagicMock())
+      for _ in range(2)
+    ]
+
+    self.assertIs(
+      factories[0].get_vector_store('user1').index,
+      factories[1].get_vector_store('user2').index
+    )
+    self.mock_pinecone.assert_called_once()
+
+  def test_factory_uses_requested_namespace(self):
+    factory = ComponentFactory(MagicMock(Embedder), 'key', 'files', 'aws', 'us-east-1', MagicMock(), MagicMock())
+    factory.get_uploader('test.txt', 'user1')
+    uploader = factory.get_uploader('test.txt', 'user2')
+
+    self.assertEqual(uploader.vector_store.namespace, 'user2')
+
+  def test_query_reconnects_once_on_connection_error(self):
+    self.mock_index.query.side_effect = [ConnectionError('reset'), {'matches': []}]
+    store = self.make_store('user1')
+
+    self.assertEqual(store.query([0.1], top_k=3), {'matches': []})
+    self.assertEqual(self.mock_pinecone.call_count, 2)
+    self.mock_index.query.assert_called_with(
+      top_k=3, vector=[0.1], namespace='user1', include_metadata=True
+    )
+
+
+if __name__ == "__main__":
+  unittest.main()
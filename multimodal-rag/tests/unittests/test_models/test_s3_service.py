@@ -1,8 +1,10 @@
+import io
 import os
 from tempfile import NamedTemporaryFile
-from mm_rag.models.s3bucket import BucketService
+from mm_rag.models.s3bucket import BucketService, content_etag, get_s3_client, get_s3_resource, reset_s3_clients, s3_config
 
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import MagicMock, patch, call
 
 from moto import mock_aws
@@ -15,6 +17,8 @@ class TestS3Service(unittest.TestCase):
   def setUp(self) -> None:
     self.mock_aws = mock_aws()
     self.mock_aws.start()
+    # The shared client must be built while AWS is mocked
+    reset_s3_clients()
 
     client = boto3.resource('s3', region_name='eu-central-1')
     bucket = client.Bucket(self.bucket_name)
@@ -27,6 +31,7 @@ class TestS3Service(unittest.TestCase):
       f.write("this is a test")
 
   def tearDown(self) -> None:
+    reset_s3_clients()
     self.mock_aws.stop()
     if os.path.exists(self.mock_file_path):
       os.remove(self.mock_file_path)
@@ -88,5 +93,160 @@ class TestS3Service(unittest.TestCase):
 
       mock_upsert.assert_not_called()
 
+  def test_object_exists_does_not_download(self):
+    self.service.bucket.put_object(Key='example.txt', Body='This is a test')
+
+    with patch.object(self.service.client, 'get_object') as mock_get:
+      self.assertTrue(self.service.object_exists('example.txt'))
+      self.assertFalse(self.service.object_exists('missing.txt'))
+
+    mock_get.assert_not_called()
+
+  def test_object_exists_compares_etags(self):
+    self.service.bucket.put_object(Key='example.txt', Body=b'This is a test')
+
+    self.assertTrue(self.service.object_exists('example.txt', etag=content_etag(b'This is a test')))
+    self.assertFalse(self.service.object_exists('example.txt', etag=content_etag(b'Something else')))
+
+  def test_known_keys_skip_the_request(self):
+    self.service.bucket.put_object(Key='example.txt', Body='This is a test')
+    self.service.object_exists('example.txt')
+
+    with patch.object(self.service.client, 'head_object') as mock_head:
+      self.assertTrue(self.service.object_exists('example.txt'))
+
+    mock_head.assert_not_called()
+
+  def test_removed_keys_are_forgotten(self):
+    self.service.bucket.put_object(Key='example.txt', Body='This is a test')
+    self.service.object_exists('example.txt')
+
+    self.service.remove_object('example.txt')
+
+    self.assertFalse(self.service.object_exists('example.txt'))
+
+  def test_existing_keys_lists_by_prefix(self):
+    for i in (1, 2, 4):
+      self.service.bucket.put_object(Key=f'user/.pdf/doc/chunk{i}', Body='page')
+    self.service.bucket.put_object(Key='user/.pdf/other/chunk1', Body='page')
+    keys = [f'user/.pdf/doc/chunk{i}' for i in range(1, 5)]
+
+    with patch.object(self.service.client, 'head_object') as mock_head:
+      existing = self.service.existing_keys(keys)
+
+    self.assertEqual(existing, {'user/.pdf/doc/chunk1', 'user/.pdf/doc/chunk2', 'user/.pdf/doc/chunk4'})
+    mock_head.assert_not_called()
+    # Found keys are remembered
+    with patch.object(self.service.client, 'get_paginator') as mock_list:
+      self.assertEqual(self.service.existing_keys(keys[:2]), set(keys[:2]))
+    mock_list.assert_not_called()
+
+  def test_existing_keys_compares_etags(self):
+    self.service.bucket.put_object(Key='user/.txt/doc/chunk1', Body=b'old content')
+    self.service.bucket.put_object(Key='user/.txt/doc/chunk2', Body=b'same content')
+    etags = {
+      'user/.txt/doc/chunk1': content_etag(b'new content'),
+      'user/.txt/doc/chunk2': content_etag(b'same content'),
+    }
+
+    existing = self.service.existing_keys(list(etags), etags=etags)
+
+    self.assertEqual(existing, {'user/.txt/doc/chunk2'})
+    # Known keys are compared too
+    self.assertEqual(self.service.existing_keys(list(etags), etags=etags), {'user/.txt/doc/chunk2'})
+
+  def test_upload_objects(self):
+    objects = [(f'user/.pdf/doc/chunk{i}', lambda i=i: io.BytesIO(f'page {i}'.encode())) for i in range(20)]
+
+    uploaded = self.service.upload_objects(objects)
+
+    self.assertEqual(uploaded, 20)
+    self.assertEqual(self.service.existing_keys([key for key, _ in objects]), {key for key, _ in objects})
+
+  def test_failed_upload_rolls_back_the_prefix(self):
+    self.service.bucket.put_object(Key='user/.pdf/doc/stale', Body='stale')
+    self.service.bucket.put_object(Key='user/.pdf/other/chunk1', Body='page')
+
+    def _produce(i):
+      if i == 7:
+        raise OSError('encoding failed')
+      return io.BytesIO(b'page')
+
+    objects = [(f'user/.pdf/doc/chunk{i}', lambda i=i: _produce(i)) for i in range(20)]
+
+    with self.assertRaises(OSError):
+      self.service.upload_objects(objects, rollback_prefix='user/.pdf/doc/')
+
+    remaining = [obj.key for obj in self.service.bucket.objects.all()]
+    self.assertEqual(remaining, ['user/.pdf/other/chunk1'])
+
+  def test_failed_upload_rolls_back_its_objects(self):
+    self.service.bucket.put_object(Key='user/.pdf/doc/chunk0', Body='previous upload')
+
+    def _produce(i):
+      if i == 3:
+        raise OSError('encoding failed')
+      return io.BytesIO(b'page')
+
+    objects = [(f'user/.pdf/doc/chunk{i}', lambda i=i: _produce(i)) for i in range(1, 6)]
+
+    with self.assertRaises(OSError):
+      self.service.upload_objects(objects)
+
+    remaining = [obj.key for obj in self.service.bucket.objects.all()]
+    self.assertEqual(remaining, ['user/.pdf/doc/chunk0'])
+
+  def test_remove_prefix_refuses_empty_prefix(self):
+    with self.assertRaises(ValueError):
+      self.service.remove_prefix('')
+
+
+class TestSharedS3Client(unittest.TestCase):
+  def setUp(self) -> None:
+    reset_s3_clients()
+
+  def tearDown(self) -> None:
+    reset_s3_clients()
+
+  @patch('mm_rag.models.s3bucket.boto3.session.Session')
+  def test_client_is_built_once(self, mock_session):
+    services = [BucketService(MagicMock()) for _ in range(3)]
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+      clients = list(pool.map(lambda service: service.client, services * 4))
+
+    self.assertTrue(all(client is clients[0] for client in clients))
+    mock_session.return_value.client.assert_called_once()
+
+  @patch('mm_rag.models.s3bucket.boto3.session.Session')
+  def test_reset_builds_a_new_client(self, mock_session):
+    mock_session.return_value.client.side_effect = lambda *args, **kwargs: MagicMock()
+
+    first = get_s3_client()
+    reset_s3_clients()
+
+    self.assertIsNot(get_s3_client(), first)
+    self.assertIs(get_s3_resource(), get_s3_resource())
+
+  def test_injected_client_is_used(self):
+    client = MagicMock()
+
+    self.assertIs(BucketService(MagicMock(), client=client).client, client)
+
+  def test_config_is_applied(self):
+    s3 = s3_config({
+      'max_pool_connections': 64,
+      'max_attempts': 7,
+      'retry_mode': 'adaptive',
+      'connect_timeout': 2,
+      'read_timeout': 20
+    })
+
+    self.assertEqual(s3.max_pool_connections, 64)
+    self.assertEqual(s3.retries, {'max_attempts': 7, 'mode': 'adaptive'})
+    self.assertEqual(s3.connect_timeout, 2)
+    self.assertEqual(s3.read_timeout, 20)
+
+
 if __name__ == "__main__":
   unittest.main()
\ No newline at end of file
@@ -0,0 +1,107 @@
+from mm_rag.models.vectorstore import PineconeVectorStore, batch_vectors, estimate_vector_size
+from mm_rag.agents.mm_embedder import Embedder
+from mm_rag.datastructures import Metadata
+from mm_rag.exceptions import ObjectUpsertionError
+import mm_rag.datastructures as ds
+
+from langchain_core.documents import Document
+from pinecone import Vector
+import pinecone
+
+import unittest
+from unittest.mock import MagicMock, PropertyMock, patch
+
+
+def make_file(n_docs: int, dims: int = 1024) -> ds.File:
+  metadata = Metadata('test', '.txt', 'user')
+  docs = [
+    Document(page_content=f'chunk {i}', metadata={'fileType': '.txt'}, id=f'{metadata.file_id}/chunk{i+1}')
+    for i in range(n_docs)
+  ]
+  embeddings = [[0.1] * dims for _ in range(n_docs)]
+
+  return ds.File(metadata, 'test', docs, embeddings)
+
+
+class TestBatchVectors(unittest.TestCase):
+  def test_split_by_vector_count(self):
+    vectors = [Vector(id=str(i), values=[0.1]) for i in range(250)]
+    batches = batch_vectors(vectors, max_vectors=100)
+
+    self.assertEqual([len(batch) for batch in batches], [100, 100, 50])
+
+  def test_split_by_payload_bytes(self):
+    vectors = [Vector(id=str(i), values=[0.1] * 1024) for i in range(10)]
+    vector_size = estimate_vector_size(vectors[0])
+    batches = batch_vectors(vectors, max_vectors=100, max_bytes=vector_size * 3)
+
+    self.assertEqual([len(batch) for batch in batches], [3, 3, 3, 1])
+
+  def test_order_is_kept(self):
+    vectors = [Vector(id=str(i), values=[0.1]) for i in range(10)]
+    batches = batch_vectors(vectors, max_vectors=3)
+
+    self.assertEqual([v.id for batch in batches for v in batch], [str(i) for i in range(10)])
+
+
+class TestBulkUpsert(unittest.TestCase):
+  def setUp(self):
+    self.vector_store = PineconeVectorStore(
+      MagicMock(Embedder),
+      api_key='fake',
+      index_name='files',
+      namespace='mock_namespace',
+      cloud='aws',
+      region='us-east-1'
+    )
+    self.mock_index = MagicMock()
+    self.mock_index.upsert.side_effect = lambda vectors, namespace: MagicMock(upserted_count=len(vectors))
+
+  def test_add_uses_few_requests(self):
+    file = make_file(300)
+
+    with patch.object(PineconeVectorStore, 'index', new_callable=PropertyMock, return_value=self.mock_index):
+      upserted = self.vector_store.add(file)
+
+    self.assertEqual(upserted, 300)
+    # 1024-dim vectors hit the payload limit slightly before 100 vectors per request
+    self.assertLessEqual(self.mock_index.upsert.call_count, 4)
+
+  def test_add_targets_collection_namespace(self):
+    file = make_file(2)
+
+    with patch.object(PineconeVectorStore, 'index', new_callable=PropertyMock, return_value=self.mock_index):
+      self.vector_store.add(file)
+
+    namespace = self.mock_index.upsert.call_args.kwargs['namespace']
+    self.assertEqual(namespace, self.vector_store._generate_full_namespace(file.metadata.collection))
+
+  def test_add_every_vector_once(self):
+    file = make_file(250)
+
+    with patch.object(PineconeVectorStore, 'index', new_callable=PropertyMock, return_value=self.mock_index):
+      self.vector_store.add(file)
+
+    upserted_ids = [
+      vector.id
+      for call in self.mock_index.upsert.call_args_list
+      for vector in call.kwargs['vectors']
+    ]
+    self.assertCountEqual(upserted_ids, [doc.id for doc in file.docs])
+
+  def test_add_empty_file(self):
+    with patch.object(PineconeVectorStore, 'index', new_callable=PropertyMock, return_value=self.mock_index):
+      self.assertEqual(self.vector_store.add(make_file(0)), 0)
+
+    self.mock_index.upsert.assert_not_called()
+
+  def test_pinecone_error_is_wrapped(self):
+    self.mock_index.upsert.side_effect = pinecone.exceptions.PineconeException('boom')
+
+    with patch.object(PineconeVectorStore, 'index', new_callable=PropertyMock, return_value=self.mock_index):
+      with self.assertRaises(ObjectUpsertionError):
+        self.vector_store.add(make_file(5))
+
+
+if __name__ == "__main__":
+  unittest.main()
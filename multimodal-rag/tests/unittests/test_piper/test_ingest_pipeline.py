@@ -0,0 +1,235 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from langchain_core.documents import Document
+
+from mm_rag.pipelines.ingest import IngestPipeline
+from mm_rag.caching import IngestCheckpoints
+from mm_rag.exceptions import FileNotValidError
+import mm_rag.datastructures as ds
+
+
+class SlowExtractor:
+  """ Every stage sleeps for `delay` seconds per chunk, the embedding `embed_delay` seconds per batch. """
+  def __init__(self, n_chunks: int, delay: float = 0.0, embed_delay: float | None = None) -> None:
+    self.n_chunks = n_chunks
+    self.delay = delay
+    self.embed_delay = delay if embed_delay is None else embed_delay
+    self.embedding_threads: set[str] = set()
+    self.batch_sizes: list[int] = []
+
+  def stream(self, path, auth):
+    metadata = ds.Metadata('file', '.pdf', auth)
+
+    def _chunks():
+      for i in range(self.n_chunks):
+        time.sleep(self.delay)
+        page_id = f'{metadata.file_id}/chunk{i+1}'
+        yield ds.Chunk(Document(page_content='page', id=page_id), payload=b'jpeg', payload_key=page_id)
+
+    return metadata, _chunks()
+
+  def embed_chunks(self, chunks):
+    # One call embeds the whole batch, as a batch embedding function does
+    self.embedding_threads.add(threading.current_thread().name)
+    self.batch_sizes.append(len(chunks))
+    time.sleep(self.embed_delay)
+    for chunk in chunks:
+      chunk.embedding = [0.1]
+    return chunks
+
+
+class TestIngestPipeline(unittest.IsolatedAsyncioTestCase):
+  def setUp(self):
+    self.stored: list[str] = []
+    self.uploader = MagicMock()
+    self.uploader.store_chunks.side_effect = self._store
+
+  def _store(self, metadata, chunks):
+    time.sleep(0.01)
+    self.stored.extend(chunk.doc.id for chunk in chunks)
+    return len(chunks)
+
+  async def test_every_chunk_is_stored_once(self):
+    extractor = SlowExtractor(50)
+    progress = await IngestPipeline(extractor, self.uploader, batch_size=8).run('file.pdf', 'user')
+
+    self.assertEqual(sorted(self.stored), sorted(f'user/.pdf/file/chunk{i+1}' for i in range(50)))
+    self.assertEqual((progress.extracted, progress.embedded, progress.stored), (50, 50, 50))
+    for call in self.uploader.store_chunks.call_args_list:
+      self.assertLessEqual(len(call.args[1]), 8)
+
+  async def test_stages_overlap(self):
+    delay = 0.02
+    extractor = SlowExtractor(20, delay)
+    started = time.perf_counter()
+
+    await IngestPipeline(extractor, self.uploader, embed_workers=4).run('file.pdf', 'user')
+
+    # Running the stages one after the other takes at least 2 * 20 * delay
+    self.assertLess(time.perf_counter() - started, 2 * 20 * delay)
+    self.assertGreater(len(extractor.embedding_threads), 1)
+
+  async def test_chunks_are_embedded_in_batches(self):
+    extractor = SlowExtractor(40, embed_delay=0.02)
+
+    progress = await IngestPipeline(extractor, self.uploader, embed_workers=2, batch_size=8).run('file.pdf', 'user')
+
+    self.assertEqual(progress.embedded, 40)
+    self.assertEqual(sum(extractor.batch_sizes), 40)
+    # Chunks queue up behind the slow embedding, and are embedded together
+    self.assertGreater(max(extractor.batch_sizes), 1)
+    self.assertLessEqual(max(extractor.batch_sizes), 8)
+
+  async def test_event_loop_is_not_blocked(self):
+    extractor = SlowExtractor(10, 0.02)
+    ticks = 0
+    done = False
+
+    async def _ticker():
+      nonlocal ticks
+      while not done:
+        ticks += 1
+        await asyncio.sleep(0.005)
+
+    ticker = asyncio.create_task(_ticker())
+    await IngestPipeline(extractor, self.uploader).run('file.pdf', 'user')
+    done = True
+    await ticker
+
+    self.assertGreater(ticks, 10)
+
+  async def test_failure_rolls_back_and_raises_first_error(self):
+    self.uploader.store_chunks.side_effect = FileNotValidError('bad chunk')
+
+    with self.assertRaises(FileNotValidError):
+      await IngestPipeline(SlowExtractor(5), self.uploader).run('file.pdf', 'user')
+
+    self.uploader.rollback.assert_called_once()
+    rolled_back = self.uploader.rollback.call_args.args[1]
+    self.assertTrue(rolled_back)
+
+  async def test_rollback_waits_for_writes_in_flight(self):
+    slow_write_done = threading.Event()
+    calls = 0
+    lock = threading.Lock()
+
+    def _store(metadata, chunks):
+      nonlocal calls
+      with lock:
+        calls += 1
+        call = calls
+      if call == 1:
+        # Still writing when the other store worker fails
+        time.sleep(0.1)
+        self.stored.extend(chunk.doc.id for chunk in chunks)
+        slow_write_done.set()
+        return len(chunks)
+      time.sleep(0.01)
+      raise FileNotValidError('bad chunk')
+
+    def _rollback(metadata, chunks):
+      self.assertTrue(slow_write_done.is_set())
+      self.assertTrue(set(self.stored) <= {chunk.doc.id for chunk in chunks})
+
+    self.uploader.store_chunks.side_effect = _store
+    self.uploader.rollback.side_effect = _rollback
+
+    with self.assertRaises(FileNotValidError):
+      await IngestPipeline(SlowExtractor(8), self.uploader, store_workers=2, batch_size=2).run('file.pdf', 'user')
+
+    self.uploader.rollback.assert_called_once()
+    self.assertTrue(self.stored)
+
+  async def test_extraction_failure_stores_nothing(self):
+    extractor = MagicMock()
+    extractor.stream.side_effect = FileNotValidError('not a file')
+
+    with self.assertRaises(FileNotValidError):
+      await IngestPipeline(extractor, self.uploader).run('missing.pdf', 'user')
+
+    self.uploader.store_chunks.assert_not_called()
+    self.uploader.rollback.assert_not_called()
+
+  def test_invalid_limits(self):
+    with self.assertRaises(ValueError):
+      IngestPipeline(MagicMock(), self.uploader, embed_workers=0)
+
+
+class TestIngestResume(unittest.IsolatedAsyncioTestCase):
+  def setUp(self):
+    tmp = tempfile.TemporaryDirectory()
+    self.addCleanup(tmp.cleanup)
+    self.path = os.path.join(tmp.name, 'file.pdf')
+    self.write(b'%PDF v1')
+
+    self.checkpoints = IngestCheckpoints()
+    self.stored: list[str] = []
+    self.fail_after = 2
+    self.uploader = MagicMock()
+    self.uploader.store_chunks.side_effect = self._store
+
+  def write(self, content: bytes) -> None:
+    with open(self.path, 'wb') as f:
+      f.write(content)
+
+  def _store(self, metadata, chunks):
+    if self.fail_after is not None and len(self.stored) >= self.fail_after * 2:
+      raise FileNotValidError('throttled')
+    self.stored.extend(chunk.doc.id for chunk in chunks)
+    return len(chunks)
+
+  async def run_pipeline(self):
+    pipeline = IngestPipeline(
+      SlowExtractor(10), self.uploader, store_workers=1, batch_size=2, checkpoints=self.checkpoints
+    )
+    return await pipeline.run(self.path, 'user')
+
+  async def test_failed_ingestion_keeps_its_stored_chunks(self):
+    with self.assertRaises(FileNotValidError):
+      await self.run_pipeline()
+
+    rolled_back = {chunk.doc.id for chunk in self.uploader.rollback.call_args.args[1]}
+    self.assertEqual(len(self.stored), 4)
+    self.assertFalse(rolled_back & set(self.stored))
+
+  async def test_new_upload_resumes_after_the_stored_chunks(self):
+    with self.assertRaises(FileNotValidError):
+      await self.run_pipeline()
+    first_run = list(self.stored)
+
+    self.fail_after = None
+    progress = await self.run_pipeline()
+
+    self.assertEqual((progress.extracted, progress.resumed, progress.stored), (10, 4, 6))
+    # Every chunk is written once over both runs
+    self.assertEqual(sorted(self.stored), sorted(f'user/.pdf/file/chunk{i+1}' for i in range(10)))
+    self.assertEqual(self.stored[:4], first_run)
+    # Once ingested, the file starts from scratch again
+    self.stored.clear()
+    self.assertEqual((await self.run_pipeline()).resumed, 0)
+
+  async def test_changed_content_does_not_resume(self):
+    with self.assertRaises(FileNotValidError):
+      await self.run_pipeline()
+
+    self.write(b'%PDF v2')
+    self.fail_after = None
+    self.assertEqual((await self.run_pipeline()).resumed, 0)
+
+  async def test_cleanup_drops_the_checkpoints(self):
+    with self.assertRaises(FileNotValidError):
+      await self.run_pipeline()
+
+    self.checkpoints.invalidate('user')
+    self.fail_after = None
+    self.assertEqual((await self.run_pipeline()).resumed, 0)
+
+
+if __name__ == "__main__":
+  unittest.main()
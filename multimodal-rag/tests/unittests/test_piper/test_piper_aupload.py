@@ -1,42 +1,39 @@
 import unittest
-from unittest.mock import AsyncMock, MagicMock, patch
-import pytest
+from unittest.mock import MagicMock, patch
+
+from langchain_core.documents import Document
 
 from mm_rag.pipelines.pipes import Piper
 from mm_rag.exceptions import ObjectUpsertionError
 import mm_rag.datastructures as ds
 
-class DummyFile:
-    def __init__(self, file_id="id"):
-        self.metadata = MagicMock()
-        self.metadata.file_id = file_id
-
-class DummyBucket:
-    def remove_object(self, file_id):
-        pass
 
-class DummyVectorStore:
-    def remove_object(self, file_id):
-        pass
+class DummyExtractor:
+    def __init__(self, n_chunks=3):
+        self.n_chunks = n_chunks
+
+    def stream(self, path, auth):
+        metadata = ds.Metadata("foo", ".txt", auth)
+        chunks = (
+            ds.Chunk(Document(page_content=f"chunk {i}", id=f"{metadata.file_id}/chunk{i+1}"))
+            for i in range(self.n_chunks)
+        )
+        return metadata, chunks
 
-class DummyDynamoDB:
-    pass
+    def embed_chunk(self, chunk):
+        chunk.embedding = [0.1]
+        return chunk
 
-class DummyExtractor:
-    def extract(self, path, auth):
-        return DummyFile(file_id="fileid")
+    def embed_chunks(self, chunks):
+        return [self.embed_chunk(chunk) for chunk in chunks]
 
 class DummyUploader:
     def __init__(self, *a, **kw):
-        self.aupload_in_vector_store = AsyncMock()
-        self.aupload_in_bucket = AsyncMock()
-        self.aupload = AsyncMock()
-        self.remove_object = AsyncMock()
+        self.store_chunks = MagicMock(side_effect=lambda metadata, chunks: len(chunks))
+        self.rollback = MagicMock()
 
 class TestPipe(unittest.IsolatedAsyncioTestCase):
     def setUp(self):
-        self.dynamo = DummyDynamoDB()
-        self.bucket = DummyBucket()
         self.auth = "user1"
         self.piper = Piper(
             factory = MagicMock()
@@ -44,41 +41,54 @@ class TestPipe(unittest.IsolatedAsyncioTestCase):
 
     async def test_pipe_txt_success(self):
         path = "foo.txt"
-        with patch.object(self.piper, '_get', return_value=(DummyUploader(), MagicMock())):
-            await self.piper.pipe(path, self.auth)
+        uploader = DummyUploader()
+        with patch.object(self.piper, '_get', return_value=(uploader, DummyExtractor())):
+            progress = await self.piper.pipe(path, self.auth)
+
+        self.assertEqual(progress.stored, 3)
+        uploader.rollback.assert_not_called()
 
     async def test_pipe_img_success(self):
         for ext in [".jpeg", ".jpg", ".png"]:
             path = "foo" + ext
-            with patch.object(self.piper, '_get', return_value=(DummyUploader(), MagicMock())):
-                await self.piper.pipe(path, self.auth)
+            with patch.object(self.piper, '_get', return_value=(DummyUploader(), DummyExtractor(1))):
+                progress = await self.piper.pipe(path, self.auth)
+            self.assertEqual(progress.stored, 1)
 
     async def test_pipe_pdf_success(self):
         path = "foo.pdf"
-        with patch.object(self.piper, '_get', return_value=(DummyUploader(), MagicMock())):
-            await self.piper.pipe(path, self.auth)
+        with patch.object(self.piper, '_get', return_value=(DummyUploader(), DummyExtractor(10))):
+            progress = await self.piper.pipe(path, self.auth)
+
+        self.assertEqual(progress.stored, 10)
 
     async def test_pipe_docx_success(self):
         path = "foo.docx"
-        with patch.object(self.piper, '_get', return_value=(DummyUploader(), MagicMock())):
-            await self.piper.pipe(path, self.auth)
+        with patch.object(self.piper, '_get', return_value=(DummyUploader(), DummyExtractor(10))):
+            progress = await self.piper.pipe(path, self.auth)
+
+        self.assertEqual(progress.stored, 10)
 
     async def test_pipe_vectorstore_upload_error(self):
         path = "foo.txt"
         uploader = DummyUploader()
-        uploader.aupload = AsyncMock(side_effect=ObjectUpsertionError(storage=ds.Storages.VECTORSTORE))
-        with patch.object(self.piper, '_get', return_value=(uploader, MagicMock())):
+        uploader.store_chunks.side_effect = ObjectUpsertionError(storage=ds.Storages.VECTORSTORE)
+        with patch.object(self.piper, '_get', return_value=(uploader, DummyExtractor())):
             with self.assertRaises(ObjectUpsertionError):
                 await self.piper.pipe(path, self.auth)
 
+        uploader.rollback.assert_called_once()
+
     async def test_pipe_bucket_upload_error(self):
         path = "foo.txt"
         uploader = DummyUploader()
-        uploader.aupload = AsyncMock(side_effect=ObjectUpsertionError(storage=ds.Storages.BUCKET))
-        with patch.object(self.piper, '_get', return_value=(uploader, MagicMock())):
+        uploader.store_chunks.side_effect = ObjectUpsertionError(storage=ds.Storages.BUCKET)
+        with patch.object(self.piper, '_get', return_value=(uploader, DummyExtractor())):
             with self.assertRaises(ObjectUpsertionError):
                 await self.piper.pipe(path, self.auth)
 
+        uploader.rollback.assert_called_once()
+
 
 if __name__ == "__main__":
-    unittest.main()
\ No newline at end of file
+    unittest.main()
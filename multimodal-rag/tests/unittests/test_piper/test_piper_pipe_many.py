@@ -0,0 +1,220 @@
+import os
+import tempfile
+import unittest
+import zipfile
+from unittest.mock import MagicMock
+
+from langchain_core.documents import Document
+
+from mm_rag.pipelines.pipes import ComponentFactory, Piper
+from mm_rag.pipelines.extractors import ImgExtractor
+from mm_rag.pipelines.ingest import IngestProgress
+from mm_rag.pipelines.utils import unpack_zip
+from mm_rag.exceptions import FileNotValidError, ObjectUpsertionError
+import mm_rag.datastructures as ds
+
+
+class DummyExtractor:
+    def __init__(self, n_chunks=2):
+        self.n_chunks = n_chunks
+
+    def stream(self, path, auth):
+        name, ext = os.path.splitext(os.path.basename(path))
+        metadata = ds.Metadata(name, ext, auth)
+        chunks = (
+            ds.Chunk(Document(page_content=f"chunk {i}", id=f"{metadata.file_id}/chunk{i+1}"))
+            for i in range(self.n_chunks)
+        )
+        return metadata, chunks
+
+    def embed_chunk(self, chunk):
+        chunk.embedding = [0.1]
+        return chunk
+
+    def embed_chunks(self, chunks):
+        return [self.embed_chunk(chunk) for chunk in chunks]
+
+
+class DummyUploader:
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.store_chunks = MagicMock(side_effect=self._store)
+        self.rollback = MagicMock()
+
+    def _store(self, metadata, chunks):
+        if self.fail_on and metadata.file_name == self.fail_on:
+            raise ObjectUpsertionError(storage=ds.Storages.VECTORSTORE)
+        return len(chunks)
+
+
+class TestPipeMany(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.auth = "user1"
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+        self.uploader = DummyUploader()
+        self.factory = MagicMock(ComponentFactory)
+        self.factory.get_file_ext.side_effect = ComponentFactory.get_file_ext
+        self.factory.get_extractor.return_value = DummyExtractor()
+        self.factory.get_uploader.return_value = self.uploader
+        self.piper = Piper(self.factory, batch_options={'files': 2, 'max_files': 10})
+
+    def write(self, name, content=b"Hello"):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    async def test_batch_shares_components(self):
+        paths = [self.write(f"doc{i}.txt") for i in range(5)] + [self.write("img.png")]
+
+        progress = IngestProgress()
+        results = await self.piper.pipe_many(paths, self.auth, progress)
+
+        self.assertEqual([result.status for result in results], ['succeeded'] * 6)
+        self.assertEqual(progress.stored, 12)
+        # One extractor and one uploader per file type, all writing to the same VectorStore
+        self.assertEqual(self.factory.get_extractor.call_count, 2)
+        self.assertEqual(self.factory.get_uploader.call_count, 2)
+        self.factory.get_vector_store.assert_called_once_with(self.auth)
+        vector_store = self.factory.get_vector_store.return_value
+        for call in self.factory.get_uploader.call_args_list:
+            self.assertIs(call.args[2], vector_store)
+
+    async def test_failed_file_does_not_stop_the_batch(self):
+        self.factory.get_uploader.return_value = DummyUploader(fail_on="doc1")
+        paths = [self.write(f"doc{i}.txt") for i in range(3)]
+
+        results = await self.piper.pipe_many(paths, self.auth)
+
+        self.assertEqual([result.status for result in results], ['succeeded', 'failed', 'succeeded'])
+        self.assertEqual(results[1].file_name, "doc1.txt")
+        self.assertIsNotNone(results[1].error)
+        self.assertEqual(results[2].stored, 2)
+
+    async def test_archives_are_unpacked(self):
+        archive = os.path.join(self.tmp.name, "corpus.zip")
+        with zipfile.ZipFile(archive, 'w') as zf:
+            zf.writestr("a.txt", "Hello")
+            zf.writestr("nested/b.txt", "World")
+            zf.writestr("__MACOSX/._a.txt", "")
+
+        results = await self.piper.pipe_many([archive, self.write("c.txt")], self.auth)
+
+        self.assertEqual(
+            [result.file_name for result in results],
+            ["corpus.zip/a.txt", "corpus.zip/nested/b.txt", "c.txt"]
+        )
+
+    async def test_max_files_bounds_the_whole_batch(self):
+        archives = []
+        for name in ("first.zip", "second.zip"):
+            archive = os.path.join(self.tmp.name, name)
+            with zipfile.ZipFile(archive, 'w') as zf:
+                for i in range(5):
+                    zf.writestr(f"{name}{i}.txt", "Hello")
+            archives.append(archive)
+
+        results = await self.piper.pipe_many(archives + [self.write("a.txt"), self.write("b.txt")], self.auth)
+
+        # 10 files at most: the first archive fits, the second one would exceed the limit
+        self.assertEqual([result.status for result in results], ['succeeded'] * 5 + ['failed'] + ['succeeded'] * 2)
+        self.assertEqual(results[5].file_name, "second.zip")
+
+    async def test_files_stored_under_the_same_name_are_reported(self):
+        archive = os.path.join(self.tmp.name, "corpus.zip")
+        with zipfile.ZipFile(archive, 'w') as zf:
+            zf.writestr("a/notes.txt", "Hello")
+            zf.writestr("b/notes.txt", "World")
+
+        results = await self.piper.pipe_many([archive], self.auth)
+
+        self.assertEqual(
+            [(result.file_name, result.status) for result in results],
+            [("corpus.zip/a/notes.txt", 'succeeded'), ("corpus.zip/b/notes.txt", 'failed')]
+        )
+        # Only the chunks of the first one are stored
+        self.assertEqual(sum(len(call.args[1]) for call in self.uploader.store_chunks.call_args_list), 2)
+
+    async def test_failures_keep_the_input_order(self):
+        paths = [self.write("a.txt"), self.write("empty.txt", b""), self.write("broken.zip", b"not a zip")]
+
+        results = await self.piper.pipe_many(paths, self.auth)
+
+        self.assertEqual(
+            [(result.file_name, result.status) for result in results],
+            [("a.txt", 'succeeded'), ("empty.txt", 'failed'), ("broken.zip", 'failed')]
+        )
+        self.assertIn("empty", results[1].error)
+
+    def image_extractor(self):
+        dummy = DummyExtractor(n_chunks=1)
+        extractor = ImgExtractor(MagicMock(), preprocess_workers=2)
+        extractor.stream = MagicMock(side_effect=dummy.stream)
+        extractor.stream_many = MagicMock(side_effect=lambda paths, auth: [dummy.stream(path, auth) for path in paths])
+        extractor.embed_chunks = dummy.embed_chunks
+        self.factory.get_extractor.return_value = extractor
+        return extractor
+
+    async def test_images_are_preprocessed_together(self):
+        extractor = self.image_extractor()
+        paths = [self.write("a.png"), self.write("notes.txt"), self.write("b.png")]
+        self.factory.get_extractor.side_effect = lambda path, auth: extractor if path.endswith('.png') else DummyExtractor()
+
+        results = await self.piper.pipe_many(paths, self.auth)
+
+        self.assertEqual([result.status for result in results], ['succeeded'] * 3)
+        extractor.stream_many.assert_called_once_with([paths[0], paths[2]], self.auth)
+        extractor.stream.assert_not_called()
+
+    async def test_images_fall_back_to_their_own_pipeline(self):
+        extractor = self.image_extractor()
+        extractor.stream_many.side_effect = FileNotValidError("not an image")
+        paths = [self.write("a.png"), self.write("b.png")]
+
+        results = await self.piper.pipe_many(paths, self.auth)
+
+        self.assertEqual([result.status for result in results], ['succeeded'] * 2)
+        self.assertEqual(extractor.stream.call_count, 2)
+
+    async def test_invalid_archive_is_reported(self):
+        results = await self.piper.pipe_many([self.write("broken.zip", b"not a zip")], self.auth)
+
+        self.assertEqual(results[0].status, 'failed')
+        self.assertEqual(results[0].file_name, "broken.zip")
+
+
+class TestUnpackZip(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.archive = os.path.join(self.tmp.name, "archive.zip")
+        self.dest = os.path.join(self.tmp.name, "out")
+
+    def test_members_escaping_the_destination_are_refused(self):
+        with zipfile.ZipFile(self.archive, 'w') as zf:
+            zf.writestr("../evil.txt", "gotcha")
+
+        with self.assertRaises(FileNotValidError):
+            unpack_zip(self.archive, self.dest)
+        self.assertFalse(os.path.exists(os.path.join(self.tmp.name, "evil.txt")))
+
+    def test_too_many_files_are_refused(self):
+        with zipfile.ZipFile(self.archive, 'w') as zf:
+            for i in range(3):
+                zf.writestr(f"{i}.txt", "x")
+
+        with self.assertRaises(FileNotValidError):
+            unpack_zip(self.archive, self.dest, max_files=2)
+
+    def test_uncompressed_size_is_bounded(self):
+        with zipfile.ZipFile(self.archive, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr("big.txt", "0" * 10_000)
+
+        with self.assertRaises(FileNotValidError):
+            unpack_zip(self.archive, self.dest, max_bytes=1000)
+
+
+if __name__ == "__main__":
+    unittest.main()
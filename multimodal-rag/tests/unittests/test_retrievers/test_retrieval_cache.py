@@ -0,0 +1,114 @@
+from mm_rag.pipelines.retrievers import Retriever, RetrievalCache
+from mm_rag.pipelines.pipes import Piper
+from mm_rag.caching import NamespaceVersions
+from mm_rag.models import dynamodb, vectorstore, s3bucket
+from mm_rag.agents.mm_embedder import Embedder
+
+import time
+from unittest.mock import MagicMock, patch
+import unittest
+
+
+response = {
+  'matches': [
+    {'id': 'rec1', 'metadata': {'fileType': '.txt', 'text': 'Apples are rich in vitamin C'}, 'score': 0.8},
+  ]
+}
+
+
+class TestRetrievalCache(unittest.TestCase):
+  def setUp(self) -> None:
+    self.cache = RetrievalCache(ttl=60)
+    self.mock_vector = MagicMock(vectorstore.PineconeVectorStore)
+    self.mock_vector.namespace = 'user1'
+    self.mock_vector.query.return_value = response
+    self.mock_embedder = MagicMock(Embedder)
+    self.mock_embedder.model_id = 'model'
+    self.mock_embedder.embed_query.return_value = [0.1, 0.2]
+
+  def retriever(self, vector_store=None, top_k: int = 3) -> Retriever:
+    return Retriever(
+      vector_store or self.mock_vector,
+      MagicMock(dynamodb.DynamoDB),
+      MagicMock(s3bucket.BucketService),
+      self.mock_embedder,
+      top_k,
+      cache=self.cache
+    )
+
+  def test_repeated_query_is_served_from_cache(self):
+    retriever = self.retriever()
+
+    first = retriever.retrieve('apples')
+    second = retriever.retrieve('apples')
+
+    self.assertEqual([doc.id for doc in first], [doc.id for doc in second])
+    self.mock_embedder.embed_query.assert_called_once_with('apples')
+    self.mock_vector.query.assert_called_once()
+
+  def test_query_text_is_normalized(self):
+    retriever = self.retriever()
+
+    retriever.retrieve('  vitamin   C ')
+    retriever.retrieve('vitamin C')
+
+    self.mock_embedder.embed_query.assert_called_once_with('vitamin C')
+
+  def test_top_k_and_namespace_are_part_of_the_key(self):
+    other = MagicMock(vectorstore.PineconeVectorStore)
+    other.namespace = 'user2'
+    other.query.return_value = response
+
+    self.retriever().retrieve('apples')
+    self.retriever(top_k=5).retrieve('apples')
+    self.retriever(vector_store=other).retrieve('apples')
+
+    self.assertEqual(self.mock_vector.query.call_count, 2)
+    other.query.assert_called_once()
+    # The embedding is shared by all of them
+    self.mock_embedder.embed_query.assert_called_once()
+
+  def test_invalidate_drops_the_namespace_results(self):
+    retriever = self.retriever()
+    retriever.retrieve('apples')
+
+    self.cache.invalidate('user2')
+    retriever.retrieve('apples')
+    self.mock_vector.query.assert_called_once()
+
+    self.cache.invalidate('user1')
+    retriever.retrieve('apples')
+    self.assertEqual(self.mock_vector.query.call_count, 2)
+    self.mock_embedder.embed_query.assert_called_once()
+
+  def test_hot_query_is_sub_millisecond(self):
+    retriever = self.retriever()
+    retriever.retrieve('apples')
+
+    started = time.perf_counter()
+    for _ in range(1000):
+      retriever.retrieve('apples')
+    per_query = (time.perf_counter() - started) / 1000
+
+    self.assertLess(per_query, 1e-3)
+
+
+class TestRetrievalCacheInvalidation(unittest.IsolatedAsyncioTestCase):
+  async def test_pipe_invalidates_the_namespace(self):
+    versions = NamespaceVersions()
+    piper = Piper(factory=MagicMock())
+    pipeline = MagicMock()
+
+    with patch('mm_rag.pipelines.pipes.namespace_versions', versions), \
+        patch.object(piper, '_get', return_value=(MagicMock(), MagicMock())), \
+        patch('mm_rag.pipelines.ingest.IngestPipeline', return_value=pipeline):
+      pipeline.run.side_effect = ValueError
+      with self.assertRaises(ValueError):
+        await piper.pipe('foo.txt', 'user1')
+
+    self.assertEqual(versions.get('user1'), 1)
+    self.assertEqual(versions.get('user2'), 0)
+
+
+if __name__ == "__main__":
+  unittest.main()
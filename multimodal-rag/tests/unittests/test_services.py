@@ -0,0 +1,91 @@
+from mm_rag.entrypoints import setup
+from mm_rag.entrypoints.setup import Services
+from mm_rag.config.config import config
+
+import unittest
+from unittest.mock import MagicMock, patch
+
+
+class TestServices(unittest.TestCase):
+  def setUp(self):
+    patches = {
+      'get_secret': patch.object(setup, 'get_secret', return_value={'hf_token': 'hf', 'pinecone_api_key': 'pc'}),
+      's3bucket': patch.object(setup, 's3bucket'),
+      'dynamodb': patch.object(setup, 'dynamodb'),
+      'embedding_cache': patch('mm_rag.agents.embedding_cache.from_config'),
+      'Embedder': patch('mm_rag.agents.mm_embedder.Embedder'),
+      'InferenceClient': patch('huggingface_hub.InferenceClient'),
+      'VLM': patch('mm_rag.agents.vlm.VLM'),
+      'ComponentFactory': patch('mm_rag.pipelines.pipes.ComponentFactory'),
+      'Piper': patch('mm_rag.pipelines.pipes.Piper'),
+      'jobs': patch('mm_rag.pipelines.jobs.from_config'),
+    }
+    self.mocks = {name: p.start() for name, p in patches.items()}
+    for p in patches.values():
+      self.addCleanup(p.stop)
+
+    self.services = Services(config)
+
+  def test_nothing_is_built_upfront(self):
+    for mock in self.mocks.values():
+      mock.assert_not_called()
+
+  def test_components_are_built_once(self):
+    self.assertIs(self.services.get('vlm'), self.services.get('vlm'))
+
+    self.mocks['VLM'].assert_called_once()
+    self.mocks['ComponentFactory'].assert_not_called()
+
+  def test_secret_is_fetched_once(self):
+    self.services.get('vlm')
+    self.services.get('piper')
+
+    self.mocks['get_secret'].assert_called_once()
+
+  def test_failed_build_is_retried(self):
+    self.mocks['get_secret'].side_effect = [ConnectionError, {'hf_token': 'hf'}]
+
+    with self.assertRaises(ConnectionError):
+      self.services.get('client')
+
+    self.services.get('client')
+    self.assertEqual(self.mocks['get_secret'].call_count, 2)
+
+  def test_warm_up_builds_everything(self):
+    timings = self.services.warm_up()
+
+    for name in Services.components:
+      self.assertIn(name, timings)
+    self.assertIn('warm_up', timings)
+    self.mocks['get_secret'].assert_called_once()
+    self.mocks['dynamodb'].DynamoDB.return_value.ensure_tables.assert_called_once_with(self.services.dynamo_tables())
+    self.mocks['ComponentFactory'].return_value.warm_up.assert_called_once()
+
+  def test_only_the_configured_backends_tables_are_provisioned(self):
+    local = {
+      **config,
+      'embedding_cache': {**config['embedding_cache'], 'backend': 'sqlite'},
+      'jobs': {**config['jobs'], 'backend': 'memory'}
+    }
+    remote = {
+      **config,
+      'embedding_cache': {**config['embedding_cache'], 'backend': 'dynamodb'},
+      'jobs': {**config['jobs'], 'backend': 'dynamodb'}
+    }
+
+    self.assertEqual(Services(local).dynamo_tables(), ['users', 'files'])
+    self.assertEqual(Services(remote).dynamo_tables(), ['users', 'files', 'embedding_cache', 'jobs'])
+
+  def test_unknown_component(self):
+    with self.assertRaises(AttributeError):
+      self.services.get('missing')
+
+  def test_module_attributes_resolve_through_the_container(self):
+    with patch.object(setup, 'services', MagicMock(Services)) as services:
+      setup.bucket
+
+    services.get.assert_called_once_with('bucket')
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,186 @@
+from mm_rag.pipelines.uploaders import PdfUploader
+from mm_rag.models.vectorstore import PineconeVectorStore
+from mm_rag.models.dynamodb import DynamoDB
+from mm_rag.models.s3bucket import BucketService, content_etag
+from mm_rag.agents.mm_embedder import Embedder
+from mm_rag.datastructures import Metadata
+from mm_rag.exceptions import ObjectDeletionError, ObjectUpsertionError
+import mm_rag.datastructures as ds
+
+from langchain_core.documents import Document
+import pinecone
+from botocore.exceptions import ClientError
+
+from collections import Counter
+import unittest
+from unittest.mock import MagicMock, PropertyMock, patch
+
+
+def make_pages(n_pages: int, dims: int = 1024) -> tuple[Metadata, list[ds.Chunk]]:
+  metadata = Metadata('test', '.pdf', 'user')
+  chunks = []
+  for i in range(n_pages):
+    page_id = f'{metadata.file_id}/chunk{i+1}'
+    chunks.append(ds.Chunk(
+      Document(page_content=page_id, metadata={'fileType': '.pdf'}, id=page_id),
+      embedding=[0.1] * dims,
+      payload=f'jpeg {i}'.encode(),
+      payload_key=page_id
+    ))
+
+  return metadata, chunks
+
+
+class TestPdfUploaderUpsertBenchmark(unittest.TestCase):
+  """
+  Regression benchmark for the PDF store path:
+  every page must be written exactly once, in a number of requests that grows linearly with the pages.
+  """
+  def setUp(self):
+    self.vector_store = PineconeVectorStore(
+      MagicMock(Embedder),
+      api_key='fake',
+      index_name='files',
+      namespace='mock_namespace',
+      cloud='aws',
+      region='us-east-1',
+      max_batch_vectors=50
+    )
+    self.bucket = MagicMock(BucketService)
+    self.bucket.existing_keys.return_value = set()
+    self.uploader = PdfUploader(MagicMock(DynamoDB), self.vector_store, self.bucket)
+
+    self.written: Counter[str] = Counter()
+    self.mock_index = MagicMock()
+    self.mock_index.upsert.side_effect = self._upsert
+
+    patcher = patch.object(PineconeVectorStore, 'index', new_callable=PropertyMock, return_value=self.mock_index)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def _upsert(self, vectors, namespace):
+    self.written.update(vector.id for vector in vectors)
+    return MagicMock(upserted_count=len(vectors))
+
+  def test_upsert_calls_per_page(self):
+    for n_pages in (1, 10, 100, 500):
+      with self.subTest(pages=n_pages):
+        self.written.clear()
+        self.mock_index.upsert.reset_mock()
+        metadata, chunks = make_pages(n_pages)
+
+        self.assertEqual(self.uploader.store_chunks(metadata, chunks), n_pages)
+
+        self.assertEqual(self.written, Counter(chunk.doc.id for chunk in chunks))
+        self.assertLessEqual(self.mock_index.upsert.call_count, -(-n_pages // 50))
+
+  def test_resumes_from_last_confirmed_page(self):
+    metadata, chunks = make_pages(150)
+    failing_id = chunks[50].doc.id
+    failed: list[str] = []
+
+    def _flaky_upsert(vectors, namespace):
+      if vectors[0].id == failing_id and not failed:
+        failed.append(failing_id)
+        raise pinecone.exceptions.PineconeException('throttled')
+      return self._upsert(vectors, namespace)
+
+    self.mock_index.upsert.side_effect = _flaky_upsert
+
+    self.uploader.store_chunks(metadata, chunks)
+
+    # Pages before the failed batch are confirmed and never rewritten
+    self.assertTrue(all(self.written[chunk.doc.id] == 1 for chunk in chunks[:50]))
+    self.assertTrue(all(self.written[chunk.doc.id] >= 1 for chunk in chunks))
+    resumed = self.mock_index.upsert.call_args_list[-1].kwargs['vectors']
+    self.assertNotIn(chunks[0].doc.id, [vector.id for vector in resumed])
+
+  def test_gives_up_after_max_retries(self):
+    self.mock_index.upsert.side_effect = pinecone.exceptions.PineconeException('down')
+    metadata, chunks = make_pages(10)
+
+    with self.assertRaises(ObjectUpsertionError):
+      self.uploader.store_chunks(metadata, chunks)
+
+    self.assertEqual(self.mock_index.upsert.call_count, self.uploader.max_retries + 1)
+    self.bucket.upload_objects.assert_not_called()
+
+  def test_missing_page_id(self):
+    metadata, chunks = make_pages(3)
+    chunks[1].doc.id = None
+
+    with self.assertRaises(ObjectUpsertionError):
+      self.uploader.store_chunks(metadata, chunks)
+
+    self.mock_index.upsert.assert_not_called()
+
+
+class TestPdfUploaderBucket(unittest.TestCase):
+  def setUp(self):
+    self.bucket = MagicMock(BucketService)
+    self.uploader = PdfUploader(MagicMock(DynamoDB), MagicMock(PineconeVectorStore), self.bucket)
+
+  def test_existing_pages_are_skipped(self):
+    metadata, chunks = make_pages(4)
+    self.bucket.existing_keys.return_value = {chunks[0].payload_key, chunks[2].payload_key}
+
+    self.uploader.store_chunks(metadata, chunks)
+
+    self.assertEqual(self.bucket.existing_keys.call_args.args[0], [chunk.payload_key for chunk in chunks])
+    objects = self.bucket.upload_objects.call_args.args[0]
+    self.assertEqual([key for key, _ in objects], [chunks[1].payload_key, chunks[3].payload_key])
+    self.bucket.object_exists.assert_not_called()
+
+  def test_payloads_are_compared_by_content(self):
+    metadata, chunks = make_pages(2)
+    self.bucket.existing_keys.return_value = set()
+
+    self.uploader.store_chunks(metadata, chunks)
+
+    etags = self.bucket.existing_keys.call_args.kwargs['etags']
+    self.assertEqual(etags, {chunk.payload_key: content_etag(chunk.payload) for chunk in chunks})
+
+  def test_pages_are_read_by_the_upload_workers(self):
+    metadata, chunks = make_pages(3)
+    self.bucket.existing_keys.return_value = set()
+
+    self.uploader.store_chunks(metadata, chunks)
+
+    objects = self.bucket.upload_objects.call_args.args[0]
+    self.assertEqual([produce().getvalue() for _, produce in objects], [chunk.payload for chunk in chunks])
+
+  def test_text_pages_are_not_checked(self):
+    metadata, chunks = make_pages(3)
+    # Pages embedded from their text layer have no image to store
+    chunks[1].payload = chunks[1].payload_key = None
+    self.bucket.existing_keys.return_value = set()
+
+    self.uploader.store_chunks(metadata, chunks)
+
+    self.assertEqual(self.bucket.existing_keys.call_args.args[0], [chunks[0].payload_key, chunks[2].payload_key])
+
+  def test_rollback_keeps_the_pages_of_an_earlier_upload(self):
+    metadata, chunks = make_pages(3)
+    self.bucket.existing_keys.return_value = {chunks[0].payload_key}
+    self.uploader.store_chunks(metadata, chunks[:2])
+
+    self.bucket.upload_objects.side_effect = ClientError({'Error': {'Code': '500'}}, 'PutObject')
+    with self.assertRaises(ObjectUpsertionError):
+      self.uploader.store_chunks(metadata, chunks[2:])
+    self.uploader.rollback(metadata, chunks)
+
+    self.bucket.remove_object.assert_called_once_with([chunks[1].payload_key])
+
+  def test_rollback_removes_the_objects_when_the_vectors_cannot_be(self):
+    metadata, chunks = make_pages(2)
+    self.bucket.existing_keys.return_value = set()
+    self.uploader.store_chunks(metadata, chunks)
+    self.uploader.vector_store.remove_objects.side_effect = ObjectDeletionError(ds.Storages.VECTORSTORE)
+
+    self.uploader.rollback(metadata, chunks)
+
+    self.bucket.remove_object.assert_called_once_with([chunk.payload_key for chunk in chunks])
+
+
+if __name__ == "__main__":
+  unittest.main()